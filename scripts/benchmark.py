@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Offline throughput benchmark for the scrapers and downloaders.
+
+Starts mock_doj_server in-process, runs each tool against it as a
+subprocess in a scratch directory, and reports per tool:
+
+    items/s    listing pages (scrapers) or PDFs on disk (downloaders) per second
+    MB/s       bytes the server sent
+    p50 / p99  server-side request latency (request received -> last byte written)
+    peak RSS   maximum resident set size of the tool's process (see doj/launcher.py)
+
+Results can be saved with --json and compared against a saved run with
+--baseline, which exits non-zero when a tool got slower than --tolerance.
+"""
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from doj.layout import Layout
+from mock_doj_server import FIRST_ID, BackgroundServer, MockConfig, base_url, file_url
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+LAUNCHER = SCRIPTS_DIR / "doj" / "launcher.py"
+TOOLS = ("scrape_links", "scrape_pdf_links", "download_pdfs", "download_pdfs_simple")
+DEFAULT_PAGES = 20
+DEFAULT_CONCURRENCY = 16
+DEFAULT_TIMEOUT = 600  # Seconds before a tool run is killed
+DEFAULT_TOLERANCE = 0.15  # Allowed items/s drop against --baseline
+# ru_maxrss is in bytes on macOS and in KiB on Linux
+MAXRSS_PER_MB = 1024 * 1024 if sys.platform == "darwin" else 1024
+
+
+def tool_command(tool: str, port: int, config: MockConfig, work: Path, concurrency: int) -> List[str]:
+    script = str(SCRIPTS_DIR / f"{tool}.py")
+    url = base_url(port)
+    if tool == "scrape_links":
+        return [script, "--base-url", url, "--output", "links.txt", "--concurrency", str(concurrency), "--max-empty", "2"]
+    if tool == "scrape_pdf_links":
+        return [script, "--base-url", url, "--end-page", str(max(1, config.pages - 1)),
+                "--out-file", "links.txt", "--concurrency", str(concurrency)]
+    links = work / "links.txt"
+    with links.open("w", encoding="utf-8") as handle:
+        for file_id in range(FIRST_ID, FIRST_ID + config.files):
+            handle.write(file_url(port, file_id) + "\n")
+    if tool == "download_pdfs":
+        return [script, "--input", "links.txt", "--out-dir", "out", "--concurrency", str(concurrency),
+                "--min-delay", "0", "--max-delay", "0", "--no-progress"]
+    if tool == "download_pdfs_simple":
+        return [script, "--input", "links.txt", "--out-dir", "out", "--concurrency", str(concurrency),
+                "--no-cookie-file"]
+    raise ValueError(f"Unknown tool: {tool}")
+
+
+def count_items(tool: str, work: Path) -> int:
+    if tool.startswith("scrape"):
+        links = work / "links.txt"
+        return sum(1 for _ in links.open(encoding="utf-8")) if links.exists() else 0
+    return sum(1 for _ in Layout.load(work / "out").iter_files(".pdf"))
+
+
+def run_tool(tool: str, server: BackgroundServer, concurrency: int, timeout: float, verbose: bool) -> Dict:
+    """Run one tool against the server in a scratch directory; returns its metrics."""
+    with tempfile.TemporaryDirectory(prefix=f"bench-{tool}-") as tmp:
+        work = Path(tmp)
+        command = [sys.executable] + tool_command(tool, server.port, server.config, work, concurrency)
+        server.stats.reset()
+        output = None if verbose else subprocess.DEVNULL
+        report = work / "launcher.json"
+        started = time.monotonic()
+        # Through the launcher: a child forked from here would count this process's memory as its own
+        subprocess.run([sys.executable, str(LAUNCHER), str(report), str(timeout)] + command,
+                       cwd=work, stdout=output, stderr=output)
+        result = json.loads(report.read_text())
+        elapsed = time.monotonic() - started
+        stats = server.stats
+        items = count_items(tool, work)
+        p50, p99 = stats.percentile(50), stats.percentile(99)
+        return {
+            "tool": tool,
+            "exit_code": result["exit_code"],
+            "seconds": round(elapsed, 3),
+            "items": items,
+            "items_per_s": round(items / elapsed, 2),
+            "mb_per_s": round(stats.bytes_sent / 1e6 / elapsed, 2),
+            "requests": stats.requests,
+            "statuses": {str(code): count for code, count in sorted(stats.statuses.items())},
+            "p50_ms": round(p50 * 1000, 2) if p50 is not None else None,
+            "p99_ms": round(p99 * 1000, 2) if p99 is not None else None,
+            "peak_rss_mb": round(result["maxrss"] / MAXRSS_PER_MB, 1),
+        }
+
+
+def format_table(results: List[Dict]) -> str:
+    header = f"{'tool':<22}{'items':>7}{'secs':>8}{'items/s':>9}{'MB/s':>8}{'p50 ms':>9}{'p99 ms':>9}{'RSS MB':>8}  statuses"
+    lines = [header, "-" * len(header)]
+    for r in results:
+        statuses = " ".join(f"{code}:{count}" for code, count in r["statuses"].items())
+        failed = "" if r["exit_code"] == 0 else f"  (exit {r['exit_code']})"
+        lines.append(
+            f"{r['tool']:<22}{r['items']:>7}{r['seconds']:>8.1f}{r['items_per_s']:>9.1f}{r['mb_per_s']:>8.1f}"
+            f"{r['p50_ms'] or 0:>9.1f}{r['p99_ms'] or 0:>9.1f}{r['peak_rss_mb']:>8.1f}  {statuses}{failed}"
+        )
+    return "\n".join(lines)
+
+
+def compare(results: List[Dict], baseline: List[Dict], tolerance: float, emit: Callable[[str], None]) -> bool:
+    """Print items/s against the baseline; False if any tool regressed beyond tolerance."""
+    previous = {r["tool"]: r for r in baseline}
+    ok = True
+    for r in results:
+        base = previous.get(r["tool"])
+        if not base or not base["items_per_s"]:
+            continue
+        change = r["items_per_s"] / base["items_per_s"] - 1
+        regressed = change < -tolerance
+        ok = ok and not regressed
+        emit(f"{r['tool']:<22}{base['items_per_s']:>9.1f} -> {r['items_per_s']:>9.1f} items/s ({change:+.0%})"
+             + ("  REGRESSION" if regressed else ""))
+    return ok
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the scrapers and downloaders against a local mock of the DOJ site.",
+        epilog="""
+Example usage:
+  python scripts/benchmark.py --json bench.json
+  python scripts/benchmark.py --tools download_pdfs download_pdfs_simple --size-median 1000000 --latency 0.05
+  python scripts/benchmark.py --fault-429 0.05 --fault-html 0.01 --baseline bench.json
+
+A 403 fault makes download_pdfs pause every worker for --block-pause
+(at least 60 s), which dominates its timing.
+        """,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--tools", nargs="+", choices=TOOLS, default=list(TOOLS), help="Tools to run (default: all).")
+    parser.add_argument("--pages", type=int, default=DEFAULT_PAGES, help=f"Listing pages of 50 files (default: {DEFAULT_PAGES}).")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="--concurrency passed to every tool.")
+    parser.add_argument("--size-median", type=int, default=200_000, help="Median PDF size in bytes.")
+    parser.add_argument("--size-sigma", type=float, default=1.0, help="Log-normal spread of PDF sizes (0 = fixed).")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds the server adds to every response.")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Up to this many extra seconds per response.")
+    parser.add_argument("--fault-403", type=float, default=0.0, help="Fraction of requests answered 403.")
+    parser.add_argument("--fault-429", type=float, default=0.0, help="Fraction of requests answered 429.")
+    parser.add_argument("--fault-503", type=float, default=0.0, help="Fraction of requests answered 503.")
+    parser.add_argument("--fault-html", type=float, default=0.0, help="Fraction answered with HTML instead of a PDF.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for sizes and faults.")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="Seconds before a tool run is killed.")
+    parser.add_argument("--json", default="", help="Write results to this file.")
+    parser.add_argument("--baseline", default="", help="Compare against results saved with --json.")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help=f"Allowed items/s drop against --baseline before exiting 1 (default: {DEFAULT_TOLERANCE}).",
+    )
+    parser.add_argument("--verbose", action="store_true", help="Show the tools' own output.")
+    return parser
+
+
+def main() -> None:
+    args = build_arg_parser().parse_args()
+    config = MockConfig(
+        pages=max(1, args.pages),
+        size_median=max(256, args.size_median),
+        size_sigma=max(0.0, args.size_sigma),
+        latency=max(0.0, args.latency),
+        jitter=max(0.0, args.jitter),
+        fault_403=args.fault_403,
+        fault_429=args.fault_429,
+        fault_503=args.fault_503,
+        fault_html=args.fault_html,
+        seed=args.seed,
+    )
+    results = []
+    with BackgroundServer(config) as server:
+        print(f"Mock server on port {server.port}: {config.pages} pages, {config.files} files", file=sys.stderr)
+        for tool in args.tools:
+            print(f"Running {tool}...", file=sys.stderr)
+            results.append(run_tool(tool, server, max(1, args.concurrency), args.timeout, args.verbose))
+    print(format_table(results))
+
+    if args.json:
+        Path(args.json).write_text(json.dumps({"config": vars(config), "results": results}, indent=2) + "\n")
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())["results"]
+        print()
+        if not compare(results, baseline, args.tolerance, print):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""Hand out the manifest's pending URLs in leases to download_pdfs.py workers on several machines."""
+
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+from doj import manifest as mf
+from doj.leases import DEFAULT_BATCH, DEFAULT_MAX_ATTEMPTS, DEFAULT_PORT, DEFAULT_TTL, LeaseServer, LeaseTable
+from doj.state import StateStore
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Coordinate one download across machines: workers lease batches of URLs and report back here.",
+        epilog=f"""
+Example usage:
+  # On the machine holding the manifest
+  python scripts/coordinator.py --input pdf-links.txt --host 0.0.0.0
+  # On every machine that downloads (any number, started or stopped at any time)
+  python scripts/download_pdfs.py --coordinator http://COORDINATOR:{DEFAULT_PORT} --out-dir downloads
+
+Workers renew their lease and report results every few seconds. A worker
+that stops renewing loses its lease and its unfinished URLs go to the next
+claim.
+The coordinator exits once every URL is downloaded or out of attempts.
+There is no authentication: only listen beyond 127.0.0.1 on a trusted network.
+        """,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "--manifest", default=mf.DEFAULT_MANIFEST, help=f"Manifest to lease from and record in (default: {mf.DEFAULT_MANIFEST})."
+    )
+    parser.add_argument("--input", default="pdf-links.txt", help="Import new URLs from this list first, if it exists.")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1).")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"Port to listen on (default: {DEFAULT_PORT}).")
+    parser.add_argument("--batch", type=int, default=DEFAULT_BATCH, help=f"URLs per lease (default: {DEFAULT_BATCH}).")
+    parser.add_argument(
+        "--lease-ttl",
+        type=float,
+        default=DEFAULT_TTL,
+        help=f"Seconds a lease lasts without a heartbeat (default: {DEFAULT_TTL:g}).",
+    )
+    parser.add_argument(
+        "--max-attempts",
+        type=int,
+        default=DEFAULT_MAX_ATTEMPTS,
+        help=f"Stop leasing a URL once this many attempts are recorded (default: {DEFAULT_MAX_ATTEMPTS}, 0 = no limit).",
+    )
+    parser.add_argument(
+        "--failed-file",
+        default="failed.txt",
+        help="At the end, write the URLs still failed, corrupt or blocked to this file (empty to disable).",
+    )
+    parser.add_argument("--no-progress", action="store_true", help="Disable the progress line.")
+    return parser
+
+
+def main() -> None:
+    args = build_arg_parser().parse_args()
+    manifest = mf.Manifest(Path(args.manifest))
+    input_path = Path(args.input)
+    if input_path.exists():
+        added = manifest.import_url_file(input_path)
+        if added:
+            print(f"Added {added} new URLs from {input_path} to {manifest.path}", file=sys.stderr)
+    max_attempts = args.max_attempts if args.max_attempts > 0 else None
+    print(f"{manifest.count_pending()} URLs pending in {manifest.path}", file=sys.stderr)
+
+    state = StateStore(manifest)
+    table = LeaseTable(state, batch=max(1, args.batch), ttl=max(1.0, args.lease_ttl), max_attempts=max_attempts)
+    server = LeaseServer(table, args.host, args.port, show_progress=not args.no_progress)
+    try:
+        stats = asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        print("\n[SHUTDOWN] Leases still out are reissued when the coordinator is restarted", file=sys.stderr)
+        stats = table.stats
+
+    if args.failed_file:
+        failed_path = Path(args.failed_file)
+        failed = [url for status in (mf.FAILED, mf.CORRUPT, mf.BLOCKED) for url in manifest.urls_with_status(status)]
+        if failed:
+            failed_path.write_text("\n".join(failed) + "\n", encoding="utf-8")
+        elif failed_path.exists():
+            failed_path.unlink()
+    state.close()
+
+    print(
+        f"Done. Total: {stats.done}, Downloaded: {stats.downloaded}, "
+        f"Skipped: {stats.skipped}, Failed: {stats.failed}, Corrupt: {stats.corrupt}, "
+        f"Leases expired: {table.expired}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Shared building blocks for the DOJ scraper and downloader scripts."""
@@ -0,0 +1,40 @@
+"""Global pause shared by every worker once the server starts refusing us."""
+import asyncio
+import sys
+import time
+from typing import Optional
+
+CHECK_INTERVAL = 5.0  # Seconds between checks while paused
+
+
+class BlockState:
+    """Tracks an IP-level block; all workers wait it out together."""
+
+    def __init__(self, pause: float):
+        self.pause = pause
+        self.blocked_until = 0.0
+        self.blocks = 0
+
+    def remaining(self) -> float:
+        return max(0.0, self.blocked_until - time.monotonic())
+
+    def trigger(self, reason: str = "") -> bool:
+        """Start a pause unless one is already running. Returns True if it started one."""
+        now = time.monotonic()
+        if now < self.blocked_until:
+            return False  # Requests already in flight when the block began
+        self.blocked_until = now + self.pause
+        self.blocks += 1
+        duration = f"{self.pause / 60:.0f} min" if self.pause >= 60 else f"{self.pause:g}s"
+        print(f"\n[BLOCKED] {reason or 'Blocked'} - pausing all requests for {duration}...", file=sys.stderr)
+        return True
+
+    async def wait(self, stop: Optional[asyncio.Event] = None) -> bool:
+        """Sleep until the block expires. Returns True if stop was set meanwhile."""
+        while True:
+            if stop is not None and stop.is_set():
+                return True
+            remaining = self.remaining()
+            if remaining <= 0:
+                return False
+            await asyncio.sleep(min(CHECK_INTERVAL, remaining))
@@ -0,0 +1,77 @@
+"""
+Content-addressed storage for downloaded files.
+
+Each distinct body is stored once under its SHA-256 digest, and the
+human-readable names in the layout are links to it:
+
+    downloads/.cas/3f/3fa9...c1.pdf      the content
+    downloads/EFTA00039025.pdf           hardlink (or symlink) to it
+    downloads/EFTA00039025-2.pdf         same content -> same blob, no extra space
+
+The store lives in a dot directory, so Layout.iter_files() only ever sees
+the names. Symlinks are relative, so the downloads folder can be moved
+as a whole; migrate_layout.py re-points them when files change shard.
+The digest is computed while the body streams to disk (see
+StorageWriter), so adding a file costs a link, not a re-read.
+"""
+import hashlib
+import os
+from pathlib import Path
+
+CAS_DIR = ".cas"
+LINK_MODES = ("hardlink", "symlink")
+READ_SIZE = 1024 * 1024
+
+
+def file_digest(path: Path) -> str:
+    """SHA-256 of a file already on disk, as hex."""
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        for block in iter(lambda: f.read(READ_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ContentStore:
+    """Stores files under their digest and links their names to them."""
+
+    def __init__(self, root: Path, link: str = "hardlink"):
+        if link not in LINK_MODES:
+            raise ValueError(f"Unknown link mode: {link} (expected one of {', '.join(LINK_MODES)})")
+        self.root = Path(root) / CAS_DIR
+        self.link = link
+        self.stored = 0  # New blobs added this run
+        self.deduplicated = 0  # Names linked to a blob that already existed
+
+    def blob_path(self, digest: str, suffix: str = "") -> Path:
+        return self.root / digest[:2] / f"{digest}{suffix}"
+
+    def store(self, path: Path, digest: str) -> bool:
+        """Move path's content into the store and leave a link in its place.
+
+        Returns True if the content was already stored (path's own copy is
+        dropped in favour of the existing blob).
+        """
+        blob = self.blob_path(digest, path.suffix)
+        exists = blob.exists()
+        if not exists:
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            if self.link == "hardlink":
+                os.link(path, blob)  # path is already the second name
+                self.stored += 1
+                return False
+            os.replace(path, blob)
+        # Build the link beside path and rename it over path, so the name
+        # never points at nothing
+        tmp = path.with_name(path.name + ".cas-link")
+        tmp.unlink(missing_ok=True)
+        if self.link == "hardlink":
+            os.link(blob, tmp)
+        else:
+            os.symlink(os.path.relpath(blob, path.parent), tmp)
+        os.replace(tmp, path)
+        if exists:
+            self.deduplicated += 1
+        else:
+            self.stored += 1
+        return exists
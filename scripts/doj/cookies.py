@@ -0,0 +1,79 @@
+"""Cookie loading for the downloaders (CLI strings, cookie files, browser exports)."""
+import json
+from pathlib import Path
+from typing import Dict
+
+
+def parse_cookies(cookie_string: str) -> Dict[str, str]:
+    """Parse cookies from string format 'name=value; name2=value2' or 'name=value,name2=value2'."""
+    cookies: Dict[str, str] = {}
+    if not cookie_string:
+        return cookies
+    for part in cookie_string.replace(",", ";").split(";"):
+        part = part.strip()
+        if "=" in part:
+            name, value = part.split("=", 1)
+            cookies[name.strip()] = value.strip()
+    return cookies
+
+
+def load_cookies_from_file(path: Path) -> Dict[str, str]:
+    """Load cookies from a file (one 'name=value' per line or Netscape format)."""
+    cookies: Dict[str, str] = {}
+    if not path.exists():
+        return cookies
+
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            # Simple format: name=value
+            if "=" in line and "\t" not in line:
+                name, value = line.split("=", 1)
+                cookies[name.strip()] = value.strip()
+            # Netscape format: domain\tflag\tpath\tsecure\texpiry\tname\tvalue
+            elif "\t" in line:
+                parts = line.split("\t")
+                if len(parts) >= 7:
+                    cookies[parts[5]] = parts[6]
+
+    return cookies
+
+
+def load_cookies_from_storage_state(path: Path) -> Dict[str, str]:
+    """Load cookies from Playwright storage-state.json format."""
+    cookies: Dict[str, str] = {}
+    if not path.exists():
+        return cookies
+
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            data = json.load(f)
+            for cookie in data.get("cookies", []):
+                cookies[cookie["name"]] = cookie["value"]
+    except (json.JSONDecodeError, KeyError):
+        pass
+
+    return cookies
+
+
+def load_cookies_from_json(path: Path, domain: str = "justice.gov") -> Dict[str, str]:
+    """Load cookies for domain from a Playwright/browser JSON export."""
+    cookies: Dict[str, str] = {}
+    if not path.exists():
+        return cookies
+
+    with path.open("r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    # Handle both list format and {cookies: [...]} format
+    cookie_list = data if isinstance(data, list) else data.get("cookies", [])
+
+    for cookie in cookie_list:
+        name = cookie.get("name")
+        value = cookie.get("value")
+        if name and value and domain in cookie.get("domain", ""):
+            cookies[name] = value
+
+    return cookies
@@ -0,0 +1,478 @@
+"""
+The download scheduler shared by every downloader script.
+
+Workers pull URLs from a queue, decide whether the file already on disk can
+be skipped, fetch through a Transport and hand the response to the
+StorageWriter. Block pauses, request pacing, retries with backoff, progress
+output and result recording live here once for every transport:
+
+    engine = Engine(transport, StorageWriter(layout), StateStore(manifest), concurrency=8)
+    stats = asyncio.run(engine.run(iter_urls(path)))
+"""
+import asyncio
+import contextlib
+import os
+import random
+import signal
+import sys
+import time
+from pathlib import Path
+from typing import AsyncIterable, Awaitable, Callable, Iterable, Optional, Tuple, Union
+
+from doj import manifest as mf
+from doj import partial, trace
+from doj.blocking import BlockState
+from doj.limiter import AdaptiveLimiter, parse_retry_after
+from doj.metrics import TTFB, RunMetrics
+from doj.state import StateStore
+from doj.storage import CORRUPT, DOWNLOADED, SNIFF_SIZE, UNCHANGED, StorageWriter, has_pdf_magic
+from doj.throttle import HostRateLimiter
+from doj.trace import TraceLog
+from doj.transports import Blocked, Transport
+from doj.validators import conditional_headers
+
+SKIPPED = "skipped"
+FAILED = "failed"
+BLOCKED = "blocked"
+STOPPED = "stopped"  # Shutdown requested; the URL is left for the next run
+
+GONE_STATUSES = (404, 410)  # Not worth retrying
+CORRUPT_THRESHOLD = 5  # Consecutive corrupt downloads before on_corrupt_streak runs
+PROGRESS_INTERVAL = 0.5
+QUEUE_DEPTH = 4  # URLs buffered per worker between the producer and the workers
+
+MANIFEST_STATUS = {CORRUPT: mf.CORRUPT, BLOCKED: mf.BLOCKED, FAILED: mf.FAILED}
+
+
+class StatusError(Exception):
+    """An HTTP error status worth retrying."""
+
+    def __init__(self, status: int, retry_after: Optional[float] = None):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+async def _aiter(urls: Iterable[str]):
+    for url in urls:
+        yield url
+
+
+class Stats:
+    """Counters for one run."""
+
+    def __init__(self):
+        self.downloaded = 0
+        self.skipped = 0
+        self.failed = 0
+        self.corrupt = 0
+        self.blocked = 0  # Blocked responses seen (retried or not)
+        self.start_time = time.monotonic()
+
+    @property
+    def done(self) -> int:
+        return self.downloaded + self.skipped + self.failed + self.corrupt
+
+    def rate(self) -> float:
+        return self.done / max(0.001, time.monotonic() - self.start_time)
+
+
+class Engine:
+    """Runs downloads for a list of URLs through one transport."""
+
+    def __init__(
+        self,
+        transport: Transport,
+        writer: StorageWriter,
+        state: Optional[StateStore] = None,
+        *,
+        concurrency: int,
+        retries: int = 3,
+        resume: bool = True,
+        verify_existing: bool = False,
+        refresh: bool = False,
+        block_state: Optional[BlockState] = None,
+        limiter: Optional[AdaptiveLimiter] = None,
+        throttle: Optional[HostRateLimiter] = None,
+        request_delay: Optional[Tuple[float, float]] = None,
+        backoff_base: float = 1.0,
+        backoff_cap: float = 60.0,
+        retry_corrupt: bool = False,
+        blocks_use_attempts: bool = True,
+        on_corrupt_streak: Optional[Callable[[], Awaitable[None]]] = None,
+        show_progress: bool = True,
+        verbose: bool = False,
+        metrics: Optional[RunMetrics] = None,
+        tracer: Optional[TraceLog] = None,
+    ):
+        """
+        resume           skip URLs whose file already exists
+        verify_existing  ...but only once the file's magic bytes and size
+                         (validator cache, else HEAD) check out
+        refresh          revalidate existing files with conditional GETs
+        limiter          adapt requests in flight to server feedback; one
+                         worker per slot up to limiter.maximum, and 403s
+                         shrink the limit before pausing everything
+        request_delay    random (min, max) sleep before every request
+        retry_corrupt    retry non-PDF bodies instead of failing them at once
+        blocks_use_attempts  count blocked responses against `retries`
+        on_corrupt_streak    awaited (with all workers held) after
+                         CORRUPT_THRESHOLD corrupt downloads in a row
+        metrics          counters, gauges and phase timings for an exporter
+        tracer           log every attempt with its phase timings as JSONL
+        """
+        self.transport = transport
+        self.writer = writer
+        self.state = state or StateStore()
+        self.concurrency = max(1, concurrency, limiter.maximum if limiter else 0)
+        self.retries = max(0, retries)
+        self.resume = resume
+        self.verify_existing = verify_existing
+        self.refresh = refresh
+        self.block_state = block_state
+        self.limiter = limiter
+        self.throttle = throttle
+        self.request_delay = request_delay
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.retry_corrupt = retry_corrupt
+        self.blocks_use_attempts = blocks_use_attempts
+        self.on_corrupt_streak = on_corrupt_streak
+        self.show_progress = show_progress
+        self.verbose = verbose
+        self.metrics = metrics
+        self.tracer = tracer
+        self.stats = Stats()
+        self.queued = 0  # URLs handed to workers so far
+        self.exhausted = False  # The URL source has been read to the end
+        self._stop = asyncio.Event()
+        self._corrupt_streak = 0
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._queue: Optional[asyncio.Queue] = None
+        if metrics:
+            metrics.add_collector(self._collect_metrics)
+
+    # -- lifecycle --------------------------------------------------------
+
+    def stop(self) -> None:
+        """Finish in-flight downloads, then return from run()."""
+        self._stop.set()
+
+    def _install_signal_handlers(self) -> None:
+        def handler() -> None:
+            if not self._stop.is_set():
+                print("\n[SHUTDOWN] Graceful shutdown requested...", file=sys.stderr)
+                self.stop()
+            else:
+                print("\n[SHUTDOWN] Forced exit", file=sys.stderr)
+                os._exit(1)
+
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, handler)
+
+    async def run(self, urls: Union[Iterable[str], AsyncIterable[str]], graceful_shutdown: bool = False) -> Stats:
+        """Download every URL; returns the run's Stats.
+
+        urls is consumed lazily by a producer feeding a bounded queue, so a
+        generator over a file or manifest query never has to be materialised.
+        It may be an async iterable, e.g. one that fetches more work as the
+        queue drains.
+        """
+        if graceful_shutdown:
+            self._install_signal_handlers()
+        queue: asyncio.Queue[Optional[str]] = asyncio.Queue(maxsize=self.concurrency * QUEUE_DEPTH)
+        self._queue = queue
+        self.stats = Stats()
+        self.queued = 0
+        self.exhausted = False
+
+        done_event = asyncio.Event()
+        progress_task = None
+        if self.show_progress:
+            progress_task = asyncio.create_task(self._progress_loop(done_event))
+        async with self.transport:
+            producer = asyncio.create_task(self._produce(urls, queue))
+            workers = [asyncio.create_task(self._worker(queue)) for _ in range(self.concurrency)]
+            await asyncio.gather(*workers)
+            producer.cancel()  # Still blocked on a full queue if we stopped early
+            await asyncio.gather(producer, return_exceptions=True)
+        done_event.set()
+        if progress_task:
+            await progress_task
+        return self.stats
+
+    async def _produce(self, urls: Union[Iterable[str], AsyncIterable[str]], queue: asyncio.Queue) -> None:
+        if not hasattr(urls, "__aiter__"):
+            urls = _aiter(urls)
+        async for url in urls:
+            if self._stop.is_set():
+                break
+            await queue.put(url)
+            self.queued += 1
+        self.exhausted = True
+        for _ in range(self.concurrency):
+            await queue.put(None)  # One end marker per worker
+
+    async def _worker(self, queue: asyncio.Queue) -> None:
+        while not self._stop.is_set():
+            url = await queue.get()
+            if url is None:
+                return
+            try:
+                await self.process(url)
+            except Exception as exc:  # Disk errors and the like shouldn't kill the worker
+                self._finish(url, FAILED, None, None, f"{type(exc).__name__}: {exc}")
+
+    # -- one URL --------------------------------------------------------
+
+    async def process(self, url: str) -> str:
+        """Skip, revalidate or download url; returns the final status."""
+        filename, path = self.writer.existing(url)
+        dest = None
+        extra_headers = None
+        cache = self.writer.validator_cache
+        if self.refresh and path.exists():
+            # Refresh mode: revalidate in place with a conditional GET when we
+            # have validators, otherwise seed them with a HEAD + size check
+            dest = path
+            entry = cache.get(url) if cache else None
+            if entry and (entry.etag or entry.last_modified):
+                extra_headers = conditional_headers(entry)
+            elif await self.is_complete_on_server(url, path):
+                return self._finish(url, SKIPPED, filename, path)
+        elif self.resume and path.exists() and await self._can_skip(url, path):
+            return self._finish(url, SKIPPED, filename, path)
+
+        if dest is None:
+            filename, dest = self.writer.reserve(url)
+        status, error = await self.fetch(url, dest, extra_headers)
+        if status == STOPPED:
+            return status
+        # A refresh answered with a block page leaves the good copy on disk untouched
+        kept = status == CORRUPT and dest == path and self.refresh
+        return self._finish(url, status, filename, dest, error, kept=kept)
+
+    async def _can_skip(self, url: str, path: Path) -> bool:
+        if not self.verify_existing:
+            return True
+        # Corrupt files are re-downloaded; valid ones are checked against
+        # cached validators, with HEAD only when suspect/stale
+        if self.writer.validate_pdf and not has_pdf_magic(path):
+            return False
+        return await self.is_complete_on_server(url, path)
+
+    async def is_complete_on_server(self, url: str, dest: Path) -> bool:
+        """Check dest against the validator cache, falling back to a HEAD request."""
+        cache = self.writer.validator_cache
+        if cache and cache.is_fresh(url, dest):
+            return True
+        headers = await self.transport.head(url)
+        if headers is None:
+            return False
+        length = headers.get("Content-Length")
+        try:
+            if length is None or not length.isdigit() or dest.stat().st_size != int(length):
+                return False
+        except OSError:
+            return False
+        if cache:
+            cache.put(url, dest, headers)
+        return True
+
+    def _slot(self):
+        return self.limiter.slot() if self.limiter else contextlib.nullcontext()
+
+    def _backoff(self, attempt: int) -> float:
+        return min(self.backoff_cap, self.backoff_base * (2 ** (attempt - 1))) * random.uniform(0.8, 1.2)
+
+    async def fetch(self, url: str, dest: Path, extra_headers=None) -> Tuple[str, Optional[str]]:
+        """Fetch url into dest with retries. Returns (status, error)."""
+        attempt = 0
+        tries = 0  # Attempts made, blocked ones included, for the trace
+        while True:
+            tries += 1
+            if self.tracer:
+                self.tracer.begin(url, tries)
+            with trace.timed(trace.BLOCK_WAIT):
+                if self._refresh_task:
+                    await self._refresh_task
+                stopped = self.block_state and await self.block_state.wait(self._stop)
+            if stopped or self._stop.is_set():
+                self._trace_end(STOPPED)
+                return STOPPED, None
+            if self.throttle:
+                with trace.timed(trace.THROTTLE):
+                    await self.throttle.wait(url)
+            if self.request_delay:
+                with trace.timed(trace.DELAY):
+                    await asyncio.sleep(random.uniform(*self.request_delay))
+
+            offset = 0
+            headers = None
+            if self.transport.supports_headers:
+                # Continue a .part file left by an earlier attempt or run
+                offset, if_range = partial.resume_offset(dest)
+                if offset >= SNIFF_SIZE:
+                    # Keep a refresh's conditional headers: a 304 still means the copy on disk is current
+                    headers = {**(extra_headers or {}), **partial.range_headers(offset, if_range)}
+                else:
+                    offset = 0
+                    headers = extra_headers
+
+            try:
+                status, error = await self._attempt(url, dest, headers, offset)
+                if status != CORRUPT or not self.retry_corrupt or attempt >= self.retries:
+                    self._trace_end(status, error)
+                    return status, error
+                attempt += 1
+                delay = self._backoff(attempt)
+            except Blocked as exc:
+                status, error = BLOCKED, str(exc)
+                self.stats.blocked += 1
+                if self.metrics:
+                    self.metrics.blocked.inc()
+                # Slow down first; pause everything only once that no longer helps
+                if not (self.limiter and self.limiter.back_off()) and self.block_state:
+                    if self.block_state.trigger(str(exc)) and self.metrics:
+                        self.metrics.block_pauses.inc()
+                        self.metrics.block_pause_seconds.inc(self.block_state.pause)
+                if self.blocks_use_attempts:
+                    if attempt >= self.retries:
+                        self._trace_end(status, error)
+                        return status, error
+                    attempt += 1
+                # The block pause (if any) does the waiting; just don't retry in lock-step
+                delay = random.uniform(1, 3)
+            except Exception as exc:
+                status, error = FAILED, f"{type(exc).__name__}: {exc}"
+                if self.limiter and isinstance(exc, asyncio.TimeoutError):
+                    self.limiter.back_off()
+                if attempt >= self.retries:
+                    self._trace_end(status, error)
+                    return status, error
+                attempt += 1
+                retry_after = exc.retry_after if isinstance(exc, StatusError) else None
+                delay = retry_after if retry_after is not None else self._backoff(attempt)
+            with trace.timed(trace.BACKOFF):
+                await asyncio.sleep(delay)
+            self._trace_end(status, error, retried=True)
+
+    def _trace_end(self, status: str, error: Optional[str] = None, retried: bool = False) -> None:
+        if self.tracer:
+            self.tracer.end(status, error, retried)
+
+    async def _attempt(self, url: str, dest: Path, headers, offset: int) -> Tuple[str, Optional[str]]:
+        """One request (within a limiter slot, if any); raises for retryable outcomes."""
+        metrics = self.metrics
+        queued = time.monotonic()
+        async with self._slot():
+            if self.limiter:
+                trace.note(trace.LIMITER, time.monotonic() - queued)
+            if metrics:
+                metrics.in_flight.inc()
+            try:
+                started = time.monotonic()
+                async with self.transport.get(url, headers) as resp:
+                    ttfb = time.monotonic() - started
+                    record = trace.current()
+                    if record:
+                        record.status = resp.status
+                        record.add(TTFB, ttfb)
+                    if metrics:
+                        metrics.observe(TTFB, ttfb)
+                        metrics.responses.inc(code=resp.status)
+                    retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+                    if self.limiter:
+                        self.limiter.record(ttfb, resp.status, retry_after)
+                    if resp.status == 403:
+                        raise Blocked("403 Forbidden")
+                    if resp.status in GONE_STATUSES:
+                        return FAILED, f"HTTP {resp.status}"
+                    if resp.status >= 400 and resp.status != 416:
+                        raise StatusError(resp.status, retry_after)
+                    return await self.writer.write(url, dest, resp, offset)
+            finally:
+                if metrics:
+                    metrics.in_flight.dec()
+
+    # -- results ----------------------------------------------------------
+
+    def _finish(
+        self,
+        url: str,
+        status: str,
+        filename: Optional[str],
+        dest: Optional[Path],
+        error: Optional[str] = None,
+        kept: bool = False,
+    ) -> str:
+        """Count and record url's outcome; kept means dest still holds an earlier good copy."""
+        stats = self.stats
+        if self.metrics:
+            self.metrics.files.inc(status=status)
+        if status == DOWNLOADED:
+            stats.downloaded += 1
+            self._corrupt_streak = 0
+            self.state.downloaded(url, filename, dest.stat().st_size, self.writer.take_digest(dest))
+        elif status in (SKIPPED, UNCHANGED):
+            stats.skipped += 1
+            self.state.skipped(url, filename, dest.stat().st_size)
+        else:
+            if status == CORRUPT:
+                stats.corrupt += 1
+                self._corrupt_streak += 1
+                if self.on_corrupt_streak and self._corrupt_streak >= CORRUPT_THRESHOLD and not self._refresh_task:
+                    self._refresh_task = asyncio.create_task(self._run_corrupt_hook())
+            else:
+                stats.failed += 1
+            if kept:
+                self.state.skipped(url, filename, dest.stat().st_size)  # Stays downloaded
+            else:
+                self.state.failed(url, MANIFEST_STATUS.get(status, mf.FAILED), error)
+
+        if self.verbose:
+            label = {DOWNLOADED: "OK", SKIPPED: "SKIP", UNCHANGED: "SAME"}.get(status, status.upper())
+            suffix = f" ({error})" if error else ""
+            print(f"{label:<6} {url}{suffix}")
+        return status
+
+    async def _run_corrupt_hook(self) -> None:
+        try:
+            await self.on_corrupt_streak()
+        finally:
+            self._corrupt_streak = 0
+            self._refresh_task = None
+
+    def _collect_metrics(self) -> None:
+        metrics = self.metrics
+        metrics.queue_depth.set(self._queue.qsize() if self._queue else 0)
+        if self.block_state:
+            metrics.block_remaining.set(self.block_state.remaining())
+        if self.limiter:
+            metrics.concurrency_limit.set(self.limiter.current)
+
+    async def _progress_loop(self, done_event: asyncio.Event) -> None:
+        stats = self.stats
+        last_len = 0
+        while True:
+            finished = done_event.is_set()
+            counts = f"OK:{stats.downloaded} Skip:{stats.skipped} Fail:{stats.failed} Corrupt:{stats.corrupt}"
+            paused = self.block_state.remaining() if self.block_state else 0
+            if paused > 0 and not finished:
+                line = f"[PAUSED {int(paused)}s] {counts} Blocked:{stats.blocked}"
+            else:
+                # The total is only known once the producer has read the whole source
+                total = f"{self.queued}" if self.exhausted else f"{self.queued}+"
+                line = f"[{stats.done}/{total}] {counts} ({stats.rate():.1f}/s)"
+                if self.limiter:
+                    line += f" x{self.limiter.current}"
+            padding = " " * max(0, last_len - len(line))
+            print(f"\r{line}{padding}", end="\n" if finished else "", file=sys.stderr, flush=True)
+            last_len = len(line)
+            if finished:
+                return
+            try:
+                await asyncio.wait_for(done_event.wait(), PROGRESS_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
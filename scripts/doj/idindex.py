@@ -0,0 +1,342 @@
+"""
+Index of EFTA document IDs: download status and listing page, by range.
+
+PDFs are named EFTA<8 digits>.pdf and the listing pages show them in ID
+order. EFTA numbers are Bates numbers, so a document takes as many numbers
+as it has pages: the listed IDs are sparse, and neighbours in the listing
+are rarely neighbouring integers. The index keeps the listed IDs as one
+sorted array, and the rest compresses to run-length-encoded intervals:
+
+    status  entries [0, 48000] downloaded, [48001, 48050] pending, ...
+            (positions in the sorted listing, however far apart their IDs)
+    urls    entries [0, 48050] .../DataSet%209/EFTA________.pdf, ...
+    pages   IDs [39025, 39160] page 1, [39161, 39290] page 2, ...
+
+A mostly downloaded set is a handful of status runs, and looking up an ID
+or the pages around a range of them is a binary search. The index answers
+two questions:
+
+    missing  IDs that are listed but not downloaded -> re-download those URLs
+    gaps     pages missing between scraped ones -> re-scrape them
+
+A hole in the numbering proves nothing by itself, so gaps needs the page
+ranges that scrapes record in a manifest; without them it refuses.
+"""
+import json
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate, chain, groupby
+from pathlib import Path
+from typing import Dict, Generic, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple, TypeVar
+
+from doj import manifest as mf
+from doj.layout import Layout
+from doj.urls import iter_urls
+
+DEFAULT_INDEX = "efta-index.json"
+FORMAT_VERSION = 3
+EFTA_RE = re.compile(r"EFTA([0-9]{8})\.pdf$", re.IGNORECASE)
+
+V = TypeVar("V")
+
+
+def efta_id(name: str) -> Optional[int]:
+    """The EFTA number of a PDF URL or filename, or None."""
+    match = EFTA_RE.search(name)
+    return int(match.group(1)) if match else None
+
+
+def id_span(urls: Iterable[str]) -> Optional[Tuple[int, int]]:
+    """(lowest, highest) EFTA number among urls, e.g. one listing page's links."""
+    ids = [file_id for file_id in map(efta_id, urls) if file_id is not None]
+    return (min(ids), max(ids)) if ids else None
+
+
+def read_page_numbers(path: Path) -> List[int]:
+    """Page numbers from a one-per-line file, in ascending order without repeats."""
+    with Path(path).open("r", encoding="utf-8") as f:
+        return sorted({int(line) for line in (line.strip() for line in f) if line.isdigit()})
+
+
+class Intervals(Generic[V]):
+    """Disjoint inclusive integer ranges, each mapped to a value.
+
+    Touching ranges with equal values are merged, so a dense run of IDs
+    costs one entry. Lookups bisect the sorted starts.
+    """
+
+    def __init__(self, runs: Iterable[Tuple[int, int, V]] = ()):
+        self.starts: List[int] = []
+        self.ends: List[int] = []
+        self.values: List[V] = []
+        for start, end, value in runs:
+            self.assign(start, end, value)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def __iter__(self) -> Iterator[Tuple[int, int, V]]:
+        return zip(self.starts, self.ends, self.values)
+
+    def index(self, point: int) -> Optional[int]:
+        """Position of the run containing point, or None."""
+        i = bisect_right(self.starts, point) - 1
+        return i if i >= 0 and self.ends[i] >= point else None
+
+    def get(self, point: int, default: Optional[V] = None) -> Optional[V]:
+        i = self.index(point)
+        return self.values[i] if i is not None else default
+
+    def overlapping(self, start: int, end: int) -> Iterator[Tuple[int, int, V]]:
+        """Runs that share at least one point with [start, end]."""
+        i = bisect_left(self.ends, start)
+        while i < len(self.starts) and self.starts[i] <= end:
+            yield self.starts[i], self.ends[i], self.values[i]
+            i += 1
+
+    def assign(self, start: int, end: int, value: V) -> None:
+        """Map every point in [start, end] to value, replacing what was there.
+
+        Cheap when ranges arrive in ascending order; an insert in the middle
+        shifts the runs after it.
+        """
+        if end < start:
+            raise ValueError(f"Empty range [{start}, {end}]")
+        lo = bisect_left(self.ends, start)  # First run ending at or after start
+        hi = bisect_right(self.starts, end)  # First run starting after end
+        starts, ends, values = [start], [end], [value]
+        if lo < hi:
+            # Keep the parts of the overlapped runs that stick out either side
+            if self.starts[lo] < start:
+                starts.insert(0, self.starts[lo])
+                ends.insert(0, start - 1)
+                values.insert(0, self.values[lo])
+            if self.ends[hi - 1] > end:
+                starts.append(end + 1)
+                ends.append(self.ends[hi - 1])
+                values.append(self.values[hi - 1])
+        self.starts[lo:hi] = starts
+        self.ends[lo:hi] = ends
+        self.values[lo:hi] = values
+        new = lo + starts.index(start)
+        self._merge(new)
+        self._merge(new - 1)
+
+    def _merge(self, i: int) -> None:
+        """Fold run i + 1 into run i if they touch and agree."""
+        if 0 <= i < len(self.starts) - 1 and self.ends[i] + 1 == self.starts[i + 1] and self.values[i] == self.values[i + 1]:
+            self.ends[i] = self.ends[i + 1]
+            del self.starts[i + 1], self.ends[i + 1], self.values[i + 1]
+
+    def to_list(self) -> List[list]:
+        return [[start, end, value] for start, end, value in self]
+
+
+class Gap(NamedTuple):
+    start: int
+    end: int
+    pages: Optional[Sequence[int]]  # Listing pages to re-scrape; None if unknown
+
+
+class Run(NamedTuple):
+    start: int  # First and last ID of the run
+    end: int
+    status: str
+    pages: Optional[Sequence[int]]  # Listing pages showing these IDs; None if unknown
+    ids: Sequence[int]  # Every listed ID in the run
+
+
+Template = Tuple[str, str]  # URL of an ID is prefix + "EFTA%08d" + suffix
+
+
+def url_template(url: str) -> Optional[Template]:
+    match = EFTA_RE.search(url)
+    return (url[: match.start()], url[match.end(1) :]) if match else None
+
+
+def runs_of(values: Iterable[V]) -> Iterator[Tuple[int, int, V]]:
+    """(first, last position, value) of each run of equal values."""
+    position = 0
+    for value, group in groupby(values):
+        count = sum(1 for _ in group)
+        yield position, position + count - 1, value
+        position += count
+
+
+class IdIndex:
+    """Download status, URL and listing page of every known EFTA ID."""
+
+    def __init__(self):
+        self.ids = array("I")  # Every listed ID, ascending
+        self.status: Intervals[str] = Intervals()  # Over positions in ids
+        # Data sets are listed on pages of their own, so a few runs cover every URL
+        self.templates: List[Template] = []
+        self.template: Intervals[int] = Intervals()  # Over positions in ids -> templates
+        self.pages: Intervals[int] = Intervals()
+        self.failed_pages: List[int] = []
+
+    # -- Building -------------------------------------------------------
+
+    def set_ids(self, statuses: Dict[int, str], numbers: Dict[int, int], templates: List[Template]) -> None:
+        """Statuses of the listed IDs, and templates[numbers[id]] for those whose URL is known."""
+        self.ids = array("I", sorted(statuses))
+        self.status = Intervals(runs_of(statuses[file_id] for file_id in self.ids))
+        self.templates = templates
+        self.template = Intervals(
+            run for run in runs_of(numbers.get(file_id) for file_id in self.ids) if run[2] is not None
+        )
+
+    @classmethod
+    def from_manifest(cls, manifest: mf.Manifest) -> "IdIndex":
+        """Statuses of the manifest's files, page ranges of its scraped pages."""
+        index = cls()
+        statuses: Dict[int, str] = {}
+        numbers: Dict[int, int] = {}  # ID -> template number, a small shared int
+        templates: Dict[Template, int] = {}
+        for url, status in manifest.iter_statuses():
+            file_id = efta_id(url)
+            if file_id is None:
+                continue
+            statuses[file_id] = status
+            numbers[file_id] = templates.setdefault(url_template(url), len(templates))
+        index.set_ids(statuses, numbers, list(templates))
+        for page, status, first_id, last_id in manifest.iter_pages():
+            if status == mf.FAILED:
+                index.failed_pages.append(page)
+            elif first_id is not None:
+                index.pages.assign(first_id, last_id, page)
+        return index
+
+    @classmethod
+    def from_files(cls, links: Path, download_dir: Path) -> "IdIndex":
+        """Statuses from a link list (pending) and a download folder (downloaded); no pages."""
+        index = cls()
+        statuses: Dict[int, str] = {}
+        numbers: Dict[int, int] = {}  # ID -> template number, a small shared int
+        templates: Dict[Template, int] = {}
+        if links.exists():
+            for url in iter_urls(links, deduplicate=False):
+                file_id = efta_id(url)
+                if file_id is None:
+                    continue
+                statuses[file_id] = mf.PENDING
+                numbers[file_id] = templates.setdefault(url_template(url), len(templates))
+        if download_dir.exists():
+            for path in Layout.load(download_dir).iter_files(".pdf"):
+                file_id = efta_id(path.name)
+                if file_id is not None:
+                    statuses[file_id] = mf.DOWNLOADED
+        index.set_ids(statuses, numbers, list(templates))
+        return index
+
+    # -- Queries --------------------------------------------------------
+
+    def url(self, file_id: int) -> Optional[str]:
+        """file_id's URL, or None if it isn't listed or only known from a downloaded file."""
+        position = self.position(file_id)
+        number = self.template.get(position) if position is not None else None
+        if number is None:
+            return None
+        prefix, suffix = self.templates[number]
+        return f"{prefix}EFTA{file_id:08d}{suffix}"
+
+    def position(self, file_id: int) -> Optional[int]:
+        """Where file_id is in the listing, or None if it isn't listed."""
+        i = bisect_left(self.ids, file_id)
+        return i if i < len(self.ids) and self.ids[i] == file_id else None
+
+    def locate(self, file_id: int) -> Tuple[Optional[str], Optional[Sequence[int]]]:
+        """(status or None if not listed, listing pages that cover it)."""
+        position = self.position(file_id)
+        status = self.status.get(position) if position is not None else None
+        return status, self.pages_for(file_id, file_id)
+
+    def pages_for(self, start: int, end: int) -> Optional[Sequence[int]]:
+        """Listing pages that show (or should show) IDs start..end; None if unknown.
+
+        An ID outside every scraped page's range belongs on a page between
+        the scraped pages either side of it. The result is empty when those
+        are consecutive, i.e. no page can be hiding it.
+        """
+        pages = self.pages
+        if not len(pages):
+            return None
+        i = pages.index(start)
+        if i is None:
+            before = bisect_right(pages.starts, start) - 1  # Last range ending before start
+            first = pages.values[before] + 1 if before >= 0 else None
+        else:
+            first = pages.values[i]
+        j = pages.index(end)
+        if j is None:
+            after = bisect_right(pages.starts, end)  # First range starting after end
+            last = pages.values[after] - 1 if after < len(pages) else None
+        else:
+            last = pages.values[j]
+        if first is None or last is None:
+            return None
+        return range(first, last + 1)
+
+    def missing(self, statuses: Sequence[str] = mf.RETRYABLE) -> Iterator[Run]:
+        """Runs of listed IDs that still need downloading."""
+        for start, end, status in self.status:
+            if status in statuses:
+                ids = self.ids[start : end + 1]
+                yield Run(ids[0], ids[-1], status, self.pages_for(ids[0], ids[-1]), ids)
+
+    def gaps(self, min_size: int = 1) -> Iterator[Gap]:
+        """ID ranges of at least min_size numbers between scraped pages that aren't consecutive.
+
+        Raises ValueError if no page ranges were recorded.
+        """
+        pages = self.pages
+        if not len(pages):
+            raise ValueError("No listing page ranges recorded: build the index from a manifest that scrapes wrote to")
+        for i in range(1, len(pages)):
+            before, after = pages.values[i - 1], pages.values[i]
+            if after <= before + 1:
+                continue  # Consecutive pages: any hole between them is Bates numbering
+            start, end = pages.ends[i - 1] + 1, pages.starts[i] - 1
+            if end - start + 1 >= min_size:
+                yield Gap(start, end, range(before + 1, after))
+
+    def counts(self) -> Dict[str, int]:
+        """IDs per status."""
+        totals: Dict[str, int] = {}
+        for start, end, status in self.status:
+            totals[status] = totals.get(status, 0) + end - start + 1
+        return totals
+
+    # -- Persistence ----------------------------------------------------
+
+    def save(self, path: Path) -> None:
+        data = {
+            "version": FORMAT_VERSION,
+            # Small differences instead of 8-digit numbers
+            "ids": [b - a for a, b in zip(chain((0,), self.ids), self.ids)],
+            "status": self.status.to_list(),
+            "templates": self.templates,
+            "template": self.template.to_list(),
+            "pages": self.pages.to_list(),
+            "failed_pages": self.failed_pages,
+        }
+        path = Path(path)
+        tmp = path.with_name(f".{path.name}.tmp")
+        tmp.write_text(json.dumps(data, separators=(",", ":")) + "\n", encoding="utf-8")
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path: Path) -> "IdIndex":
+        data = json.loads(Path(path).read_text(encoding="utf-8"))
+        if data.get("version") != FORMAT_VERSION:
+            raise ValueError(f"{path}: unsupported index version {data.get('version')}; run efta_index.py build again")
+        index = cls()
+        index.ids = array("I", accumulate(data["ids"]))
+        # Saved runs are sorted and disjoint, so every assign appends
+        index.status = Intervals(map(tuple, data["status"]))
+        index.templates = [tuple(template) for template in data["templates"]]
+        index.template = Intervals(map(tuple, data["template"]))
+        index.pages = Intervals(map(tuple, data["pages"]))
+        index.failed_pages = list(data["failed_pages"])
+        return index
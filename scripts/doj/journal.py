@@ -0,0 +1,99 @@
+"""
+Append-only progress journal of completed URLs.
+
+The file stays a plain one-URL-per-line list (compatible with the old
+progress files), but checkpoints append and fsync only the new entries
+instead of rewriting the whole sorted set. Once repeated URLs (a re-run
+over the same list, say) make it COMPACT_RATIO times longer than needed it
+is rewritten, both on load and every COMPACT_CHECK_EVERY syncs of a run.
+"""
+import os
+from pathlib import Path
+from typing import List, Optional
+
+from doj.urlset import UrlSet
+
+SYNC_EVERY = 50  # Entries buffered before a write + fsync
+COMPACT_RATIO = 1.5  # Rewrite when lines exceed unique URLs by this factor
+COMPACT_CHECK_EVERY = 20  # Syncs between compaction checks during a run
+
+
+class ProgressJournal:
+    """Crash-tolerant, append-only record of completed URLs."""
+
+    def __init__(self, path: Path, sync_every: int = SYNC_EVERY):
+        self.path = Path(path)
+        self.sync_every = max(1, sync_every)
+        self._pending: List[str] = []
+        self._handle = None
+        # What the file holds, known once load() has read it; until then it can't be compacted
+        self._completed: Optional[UrlSet] = None
+        self._lines = 0
+        self._syncs = 0
+
+    def load(self) -> UrlSet:
+        """Replay the journal, dropping a torn final line and compacting if needed."""
+        completed = UrlSet()
+        self._completed, self._lines = completed, 0
+        if not self.path.exists():
+            return completed
+
+        torn = False
+        entries = 0
+        with self.path.open("r", encoding="utf-8") as handle:
+            for line in handle:
+                if not line.endswith("\n"):
+                    torn = True  # Incomplete write from a crash
+                    break
+                url = line.strip()
+                if url:
+                    completed.add(url)
+                    entries += 1
+
+        self._lines = entries
+        if torn or self._bloated():
+            self.compact(completed)
+        return completed
+
+    def _bloated(self) -> bool:
+        return self._completed is not None and self._lines > len(self._completed) * COMPACT_RATIO
+
+    def compact(self, completed: UrlSet) -> None:
+        """Atomically rewrite the journal with one line per completed URL."""
+        self.close()
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with tmp_path.open("w", encoding="utf-8") as handle:
+            for url in completed:
+                handle.write(url + "\n")
+            handle.flush()
+            os.fsync(handle.fileno())
+        tmp_path.replace(self.path)
+        self._lines = len(completed)
+
+    def append(self, url: str) -> None:
+        self._pending.append(url)
+        if len(self._pending) >= self.sync_every:
+            self.sync()
+
+    def sync(self) -> None:
+        """Write buffered entries and fsync them to disk."""
+        if not self._pending:
+            return
+        if self._handle is None:
+            self._handle = self.path.open("a", encoding="utf-8")
+        self._handle.write("\n".join(self._pending) + "\n")
+        self._handle.flush()
+        os.fsync(self._handle.fileno())
+        if self._completed is not None:
+            self._completed.update(self._pending)
+            self._lines += len(self._pending)
+        self._pending = []
+        self._syncs += 1
+        if self._syncs % COMPACT_CHECK_EVERY == 0 and self._bloated():
+            self.compact(self._completed)  # Reopened in append mode by the next sync
+
+    def close(self) -> None:
+        self.sync()
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
@@ -0,0 +1,45 @@
+"""
+Run one command and report its peak RSS, for benchmark.py.
+
+    python doj/launcher.py REPORT TIMEOUT COMMAND...
+
+A forked child's ru_maxrss starts from its parent's high-water mark, so a
+tool forked straight from the benchmark (mock server bodies and all) would
+report the benchmark's memory rather than its own. This process is exec'd
+fresh and imports only the standard library, so the tool it forks starts
+from a few MB. It kills the command after TIMEOUT seconds and writes
+{"exit_code", "maxrss"} (ru_maxrss as the platform reports it) to REPORT.
+
+Run it by path, not as doj.launcher: it must not import anything else.
+"""
+import json
+import os
+import signal
+import sys
+import time
+
+
+def main() -> None:
+    report, timeout, command = sys.argv[1], float(sys.argv[2]), sys.argv[3:]
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.execvp(command[0], command)
+        finally:
+            os._exit(127)
+    deadline = time.monotonic() + timeout
+    while True:
+        done, status, usage = os.wait4(pid, os.WNOHANG)
+        if done:
+            break
+        if time.monotonic() > deadline:
+            os.kill(pid, signal.SIGKILL)
+            _, status, usage = os.wait4(pid, 0)
+            break
+        time.sleep(0.05)
+    with open(report, "w", encoding="utf-8") as handle:
+        json.dump({"exit_code": os.waitstatus_to_exitcode(status), "maxrss": usage.ru_maxrss}, handle)
+
+
+if __name__ == "__main__":
+    main()
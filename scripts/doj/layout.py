@@ -0,0 +1,97 @@
+"""
+Output directory layout shared by every downloader and maintenance script.
+
+With hundreds of thousands of PDFs in one flat directory, every exists(),
+glob() and iterdir() gets slow. A sharded layout spreads files over
+subdirectories derived from the filename:
+
+    flat    downloads/EFTA00039025.pdf
+    prefix  downloads/EFTA0003/EFTA00039025.pdf   (first `width` chars)
+    hash    downloads/a1f/EFTA00039025.pdf        (first `width` hex chars of md5)
+
+The chosen scheme is stored in `<out_dir>/.layout` so all scripts resolve
+paths the same way; `scripts/migrate_layout.py` moves existing files.
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Iterator, Optional, Set
+
+LAYOUT_FILE = ".layout"
+SCHEMES = ("flat", "prefix", "hash")
+DEFAULT_WIDTH = {"flat": 0, "prefix": 8, "hash": 3}
+
+
+def shard_key(name: str) -> str:
+    """Part of the filename that decides its shard (so X.pdf and X.pdf.part stay together)."""
+    return name.split(".", 1)[0] or name
+
+
+class Layout:
+    """Maps filenames to paths under an output directory."""
+
+    def __init__(self, root: Path, scheme: str = "flat", width: Optional[int] = None):
+        if scheme not in SCHEMES:
+            raise ValueError(f"Unknown layout scheme: {scheme} (expected one of {', '.join(SCHEMES)})")
+        self.root = Path(root)
+        self.scheme = scheme
+        self.width = DEFAULT_WIDTH[scheme] if width is None else width
+        self._made: Set[Path] = set()
+
+    @classmethod
+    def load(cls, root: Path) -> "Layout":
+        """Layout recorded in root/.layout, or flat if there is none."""
+        config_path = Path(root) / LAYOUT_FILE
+        if not config_path.exists():
+            return cls(root)
+        config = json.loads(config_path.read_text(encoding="utf-8"))
+        return cls(root, config.get("scheme", "flat"), config.get("width"))
+
+    def save(self) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        (self.root / LAYOUT_FILE).write_text(
+            json.dumps({"scheme": self.scheme, "width": self.width}) + "\n", encoding="utf-8"
+        )
+
+    def shard(self, name: str) -> str:
+        key = shard_key(name)
+        if self.scheme == "prefix":
+            return key[: self.width]
+        if self.scheme == "hash":
+            return hashlib.md5(key.encode("utf-8")).hexdigest()[: self.width]
+        return ""
+
+    def path_for(self, name: str) -> Path:
+        shard = self.shard(name)
+        return self.root / shard / name if shard else self.root / name
+
+    def ensure_path(self, name: str) -> Path:
+        """path_for(), creating the shard directory on first use."""
+        path = self.path_for(name)
+        if path.parent not in self._made:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._made.add(path.parent)
+        return path
+
+    def iter_files(self, suffix: str = ".pdf") -> Iterator[Path]:
+        """Yield files ending in suffix, at the top level and one shard level down."""
+        if not self.root.exists():
+            return
+        with os.scandir(self.root) as entries:
+            subdirs = []
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif entry.name.endswith(suffix):
+                    yield Path(entry.path)
+        if self.scheme == "flat":
+            return
+        for subdir in subdirs:
+            with os.scandir(subdir) as entries:
+                for entry in entries:
+                    # Symlinks too: with `--cas symlink` every name is one
+                    if entry.name.endswith(suffix) and (entry.is_file(follow_symlinks=False) or entry.is_symlink()):
+                        yield Path(entry.path)
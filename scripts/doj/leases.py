@@ -0,0 +1,442 @@
+"""
+Splitting one download over several machines through a lease coordinator.
+
+    coordinator.py --manifest manifest.sqlite3 --input pdf-links.txt --host 0.0.0.0
+    download_pdfs.py --coordinator http://HOST:8765     # on each machine
+
+The coordinator owns the manifest. A worker claims a lease: a batch of
+pending URLs that no other lease holds, valid for a TTL. While it works it
+sends heartbeats that renew the lease and carry the results so far, and it
+completes the lease with the rest. Only the coordinator writes the
+manifest, so every machine's failures end up in one place.
+
+A lease that is not renewed in time (its worker crashed, was killed or
+lost the network) expires, and its unreported URLs go back to the pool for
+the next claim. A URL is leased to one worker at a time, so nothing is
+downloaded twice unless a worker outlives its lease; a worker told that
+its lease expired takes no more URLs from it. URLs that fail are reissued
+on a later pass until they have been tried max_attempts times.
+
+The manifest itself is not shared between machines: SQLite's locking is
+unreliable on network filesystems, and a single writer is all it needs.
+"""
+import asyncio
+import itertools
+import secrets
+import sys
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Set, Tuple
+
+import aiohttp
+from aiohttp import web
+
+from doj import manifest as mf
+from doj.engine import PROGRESS_INTERVAL, Stats
+from doj.state import StateStore
+from doj.workers import DOWNLOADED, SKIPPED, record_result
+
+DEFAULT_PORT = 8765
+DEFAULT_BATCH = 100  # URLs per lease
+DEFAULT_TTL = 120.0  # Seconds a lease lasts without a heartbeat
+DEFAULT_MAX_ATTEMPTS = 3  # Recorded attempts after which a URL is no longer leased
+WAIT = 5.0  # Seconds a worker waits before claiming again when every pending URL is leased
+LINGER = 2 * WAIT  # Seconds the coordinator keeps answering "done" before it exits
+REPORT_INTERVAL = 5.0  # Longest a worker holds results before sending them (a crash loses at most this much)
+REQUEST_TIMEOUT = 30.0
+REQUEST_RETRIES = 6  # Attempts per coordinator request, 1, 2, 4... seconds apart
+
+
+class LeaseError(Exception):
+    """The coordinator could not be reached or refused a request."""
+
+
+class Lease:
+    """URLs leased to one worker until `expires` (time.monotonic)."""
+
+    __slots__ = ("id", "worker", "urls", "expires")
+
+    def __init__(self, lease_id: str, worker: str, expires: float):
+        self.id = lease_id
+        self.worker = worker
+        self.urls: Dict[str, None] = {}  # Not yet reported, in manifest order
+        self.expires = expires
+
+
+class LeaseTable:
+    """The coordinator's leases over the pending URLs of state's manifest."""
+
+    def __init__(
+        self,
+        state: StateStore,
+        batch: int = DEFAULT_BATCH,
+        ttl: float = DEFAULT_TTL,
+        max_attempts: Optional[int] = DEFAULT_MAX_ATTEMPTS,
+    ):
+        if state.manifest is None:
+            raise ValueError("Leasing needs a manifest")
+        self.state = state
+        self.manifest = state.manifest
+        self.batch = batch
+        self.ttl = ttl
+        self.max_attempts = max_attempts
+        self.leases: Dict[str, Lease] = {}
+        self.holders: Dict[str, str] = {}  # URL -> id of the lease holding it
+        self.stats = Stats()
+        self.expired = 0
+        self.finished = False  # Nothing left to lease and no lease outstanding
+        # Ids from an earlier coordinator run are never taken for current ones
+        self._epoch = secrets.token_hex(4)
+        self._ids = itertools.count(1)
+        self._pending: Optional[Iterator[str]] = None  # Current pass over the manifest
+
+    def claim(self, worker: str, size: Optional[int] = None, now: Optional[float] = None) -> Optional[Lease]:
+        """Lease up to size URLs to worker; None if all pending URLs are leased (or none are left)."""
+        now = time.monotonic() if now is None else now
+        self.expire(now)
+        size = max(1, min(size or self.batch, self.batch))
+        lease = Lease(f"{self._epoch}-{next(self._ids)}", worker, now + self.ttl)
+        restarted = False
+        while len(lease.urls) < size:
+            if self._pending is None:
+                if restarted:
+                    break  # A whole pass found nothing more to lease
+                # A new pass picks up URLs that failed or came back from expired leases
+                self._pending = self.manifest.iter_pending(max_attempts=self.max_attempts)
+                restarted = True
+            url = next(self._pending, None)
+            if url is None:
+                self._pending = None
+            elif url not in self.holders:
+                lease.urls[url] = None
+                self.holders[url] = lease.id
+        if not lease.urls:
+            self.finished = not self.leases
+            return None
+        self.leases[lease.id] = lease
+        return lease
+
+    def report(self, lease_id: str, results: List[Tuple], now: Optional[float] = None) -> bool:
+        """Record results and renew the lease; False if it has expired (the results still count)."""
+        lease = self.leases.get(lease_id)
+        for message in results:
+            record_result(self.state, self.stats, message)
+            url = message[1]
+            if self.holders.get(url) == lease_id:
+                del self.holders[url]
+                lease.urls.pop(url, None)
+        self.manifest.flush()  # A coordinator crash loses no reported result
+        if lease is None:
+            return False
+        lease.expires = (time.monotonic() if now is None else now) + self.ttl
+        return True
+
+    def complete(self, lease_id: str, results: List[Tuple]) -> bool:
+        """Record the last results and end the lease; URLs it didn't report are reissued."""
+        alive = self.report(lease_id, results)
+        lease = self.leases.get(lease_id)
+        if lease:
+            self._release(lease)
+        return alive
+
+    def expire(self, now: Optional[float] = None) -> List[Lease]:
+        """End the leases whose time is up; returns them."""
+        now = time.monotonic() if now is None else now
+        expired = [lease for lease in self.leases.values() if lease.expires < now]
+        for lease in expired:
+            self._release(lease)
+        self.expired += len(expired)
+        return expired
+
+    def _release(self, lease: Lease) -> None:
+        del self.leases[lease.id]
+        for url in lease.urls:
+            if self.holders.get(url) == lease.id:
+                del self.holders[url]
+
+    def status(self) -> Dict[str, Any]:
+        stats = self.stats
+        return {
+            "downloaded": stats.downloaded,
+            "skipped": stats.skipped,
+            "failed": stats.failed,
+            "corrupt": stats.corrupt,
+            "leases": len(self.leases),
+            "leased_urls": len(self.holders),
+            "expired": self.expired,
+            "workers": sorted({lease.worker for lease in self.leases.values()}),
+            "finished": self.finished,
+        }
+
+
+class LeaseServer:
+    """Serves a LeaseTable over HTTP (JSON) and reports progress until the work is done.
+
+    POST /claim      {"worker", "size"} -> {"lease", "urls", "ttl"} | {"wait": s} | {"done": true}
+    POST /heartbeat  {"lease", "results"} -> {"ttl"}, or 410 if the lease expired
+    POST /complete   {"lease", "results"} -> {}
+    GET  /status     counts, leases and workers
+    """
+
+    def __init__(self, table: LeaseTable, host: str = "127.0.0.1", port: int = DEFAULT_PORT, show_progress: bool = True):
+        self.table = table
+        self.host = host
+        self.port = port
+        self.show_progress = show_progress
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/claim", self._claim)
+        app.router.add_post("/heartbeat", self._heartbeat)
+        app.router.add_post("/complete", self._complete)
+        app.router.add_get("/status", self._status)
+        return app
+
+    async def serve(self) -> Stats:
+        """Run until every URL is done or out of attempts; returns the results' Stats."""
+        runner = web.AppRunner(self.app(), access_log=None)
+        await runner.setup()
+        try:
+            await web.TCPSite(runner, self.host, self.port).start()
+            print(f"Leasing on http://{self.host}:{self.port}/ (batch {self.table.batch}, ttl {self.table.ttl:g}s)",
+                  file=sys.stderr)
+            last_len = 0
+            while not self.table.finished:
+                await asyncio.sleep(PROGRESS_INTERVAL)
+                for lease in self.table.expire():
+                    print(f"\n[EXPIRED] Lease {lease.id} of {lease.worker}: {len(lease.urls)} URLs reissued",
+                          file=sys.stderr)
+                if self.show_progress:
+                    last_len = self._print_progress(last_len)
+            if self.show_progress:
+                self._print_progress(last_len, final=True)
+            # Workers still polling learn there's nothing left
+            await asyncio.sleep(LINGER)
+        finally:
+            await runner.cleanup()
+        return self.table.stats
+
+    async def _claim(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        lease = self.table.claim(str(body.get("worker", request.remote)), body.get("size"))
+        if lease is None:
+            return web.json_response({"done": True} if self.table.finished else {"wait": WAIT})
+        return web.json_response({"lease": lease.id, "urls": list(lease.urls), "ttl": self.table.ttl})
+
+    async def _heartbeat(self, request: web.Request) -> web.Response:
+        lease_id, results = await self._read_report(request)
+        if not self.table.report(lease_id, results):
+            return web.json_response({"error": "lease expired"}, status=410)
+        return web.json_response({"ttl": self.table.ttl})
+
+    async def _complete(self, request: web.Request) -> web.Response:
+        lease_id, results = await self._read_report(request)
+        self.table.complete(lease_id, results)
+        return web.json_response({})
+
+    async def _status(self, request: web.Request) -> web.Response:
+        return web.json_response(self.table.status())
+
+    async def _read_report(self, request: web.Request) -> Tuple[str, List[Tuple]]:
+        body = await request.json()
+        results = [tuple(message) for message in body.get("results", ())]
+        if any(len(message) != 6 for message in results):
+            raise web.HTTPBadRequest(text="results are [kind, url, filename, size, sha256, error]")
+        return str(body.get("lease", "")), results
+
+    def _print_progress(self, last_len: int, final: bool = False) -> int:
+        table, stats = self.table, self.table.stats
+        line = (
+            f"[{stats.done}] OK:{stats.downloaded} Skip:{stats.skipped} Fail:{stats.failed} Corrupt:{stats.corrupt} "
+            f"({stats.rate():.1f}/s) leases:{len(table.leases)} workers:{len(table.status()['workers'])}"
+        )
+        padding = " " * max(0, last_len - len(line))
+        print(f"\r{line}{padding}", end="\n" if final else "", file=sys.stderr, flush=True)
+        return len(line)
+
+
+class ClaimedLease:
+    """A worker's view of its lease."""
+
+    def __init__(self, lease_id: str, urls: List[str], ttl: float):
+        self.id = lease_id
+        self.urls = urls
+        self.ttl = ttl
+        self.results: List[Tuple] = []  # Not yet sent to the coordinator
+        self.counts: Dict[str, int] = {}  # Results by kind
+        self.outstanding = 0  # URLs handed to the engine without a result yet
+        self.issued = False  # Every URL handed out, or the lease lost
+        self.lost = False  # Expired on the coordinator: take no more of its URLs
+        self.heartbeat: Optional[asyncio.Task] = None
+
+    def take(self) -> List[Tuple]:
+        results, self.results = self.results, []
+        return results
+
+    def restore(self, results: List[Tuple]) -> None:
+        """Put back results whose report failed, to go with the next one."""
+        self.results[:0] = results
+
+
+class LeaseClient:
+    """A worker's connection to the coordinator."""
+
+    def __init__(self, url: str, worker: str, size: Optional[int] = None, retries: int = REQUEST_RETRIES):
+        self.url = url.rstrip("/")
+        self.worker = worker
+        self.size = size
+        self.retries = retries
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def __aenter__(self) -> "LeaseClient":
+        self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT))
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self._session.close()
+
+    async def _post(self, path: str, payload: Dict[str, Any], retries: Optional[int] = None) -> Tuple[int, Dict[str, Any]]:
+        """(HTTP status, JSON body); retries while the coordinator can't be reached."""
+        retries = retries or self.retries
+        for attempt in range(retries):
+            try:
+                async with self._session.post(f"{self.url}{path}", json=payload) as response:
+                    if response.status >= 500:
+                        raise LeaseError(f"{path}: HTTP {response.status}")
+                    return response.status, await response.json()
+            except (aiohttp.ClientError, asyncio.TimeoutError, LeaseError) as e:
+                error = e
+            if attempt + 1 < retries:
+                await asyncio.sleep(2 ** attempt)
+        raise LeaseError(f"Coordinator {self.url} unreachable: {error}")
+
+    async def claim(self) -> Optional[ClaimedLease]:
+        """The next lease, waiting while others hold the rest; None when all work is done."""
+        while True:
+            _, body = await self._post("/claim", {"worker": self.worker, "size": self.size})
+            if body.get("done"):
+                return None
+            if "lease" in body:
+                return ClaimedLease(body["lease"], body["urls"], body["ttl"])
+            await asyncio.sleep(body.get("wait", WAIT))
+
+    async def heartbeat(self, lease: ClaimedLease, results: List[Tuple]) -> bool:
+        """Report results and renew lease; False if it has expired."""
+        status, _ = await self._post("/heartbeat", {"lease": lease.id, "results": results})
+        return status != 410
+
+    async def complete(self, lease: ClaimedLease, results: List[Tuple], retries: Optional[int] = None) -> None:
+        await self._post("/complete", {"lease": lease.id, "results": results}, retries)
+
+
+class LeaseFeed(StateStore):
+    """Feeds one Engine run from successive leases and reports each result to its lease.
+
+        feed = LeaseFeed(client)
+        await engine.run(feed.urls())     # with feed as the engine's state
+        await feed.finish()
+
+    One session, limiter and set of request slots serve every lease. The
+    next lease is claimed as the engine's queue drains, so leases overlap
+    instead of emptying the pipeline between batches. A lease's results go
+    out with its heartbeats (REPORT_INTERVAL or a third of the TTL apart,
+    whichever is shorter), and it is completed once every URL has one.
+    """
+
+    def __init__(self, client: LeaseClient, report: bool = True):
+        super().__init__()
+        self.client = client
+        self.report = report  # Print one line per completed lease
+        self.active: Dict[str, ClaimedLease] = {}
+        self._owners: Dict[str, ClaimedLease] = {}  # URL handed out -> its lease
+        self._completing: Set[asyncio.Task] = set()
+
+    async def urls(self) -> AsyncIterator[str]:
+        """Every URL of every lease, claiming the next one when the last is handed out."""
+        while True:
+            try:
+                lease = await self.client.claim()
+            except LeaseError as e:
+                print(f"\n[LEASE] {e}; stopping", file=sys.stderr)
+                return
+            if lease is None:
+                return
+            self.active[lease.id] = lease
+            lease.heartbeat = asyncio.create_task(self._heartbeats(lease))
+            for url in lease.urls:
+                if lease.lost:
+                    break
+                previous = self._owners.get(url)
+                if previous:  # Reissued after its old lease expired: that one won't get the result
+                    previous.outstanding -= 1
+                    self._complete_if_done(previous)
+                lease.outstanding += 1
+                self._owners[url] = lease
+                yield url
+            lease.issued = True
+            self._complete_if_done(lease)
+
+    # StateStore: every result goes to the lease its URL came from
+
+    def downloaded(
+        self, url: str, filename: str, size: Optional[int] = None, sha256: Optional[str] = None
+    ) -> None:
+        self._record((DOWNLOADED, url, filename, size, sha256, None))
+
+    def skipped(self, url: str, filename: str, size: Optional[int] = None) -> None:
+        self._record((SKIPPED, url, filename, size, None, None))
+
+    def failed(self, url: str, status: str = mf.FAILED, error: Optional[str] = None) -> None:
+        self._record((status, url, None, None, None, error))
+
+    def _record(self, message: Tuple) -> None:
+        lease = self._owners.pop(message[1], None)
+        if lease is None:
+            return
+        lease.results.append(message)
+        lease.counts[message[0]] = lease.counts.get(message[0], 0) + 1
+        lease.outstanding -= 1
+        self._complete_if_done(lease)
+
+    def _complete_if_done(self, lease: ClaimedLease) -> None:
+        if lease.issued and not lease.outstanding and lease.id in self.active:
+            task = asyncio.create_task(self._complete(lease))
+            self._completing.add(task)
+            task.add_done_callback(self._completing.discard)
+
+    async def _complete(self, lease: ClaimedLease, retries: Optional[int] = None) -> None:
+        del self.active[lease.id]
+        lease.heartbeat.cancel()
+        await asyncio.gather(lease.heartbeat, return_exceptions=True)
+        try:
+            await self.client.complete(lease, lease.take(), retries)
+        except LeaseError as e:
+            print(f"\n[LEASE] Could not complete {lease.id}: {e}", file=sys.stderr)
+        if self.report:
+            ok, skip, corrupt = (lease.counts.get(kind, 0) for kind in (DOWNLOADED, SKIPPED, mf.CORRUPT))
+            failed = sum(lease.counts.values()) - ok - skip - corrupt
+            print(
+                f"[LEASE] {lease.id}: {len(lease.urls)} URLs, OK:{ok} Skip:{skip} Fail:{failed} Corrupt:{corrupt}",
+                file=sys.stderr,
+            )
+
+    async def _heartbeats(self, lease: ClaimedLease) -> None:
+        while True:
+            await asyncio.sleep(min(REPORT_INTERVAL, lease.ttl / 3))
+            results = lease.take()
+            try:
+                if not await self.client.heartbeat(lease, results):
+                    lease.lost = True
+                    print(f"\n[LEASE] {lease.id} expired; stopping it", file=sys.stderr)
+                    return
+            except LeaseError as e:
+                lease.restore(results)
+                print(f"\n[LEASE] Heartbeat failed: {e}", file=sys.stderr)
+
+    async def finish(self, interrupted: bool = False) -> None:
+        """Complete the leases still open, handing back URLs that got no result.
+
+        After an interrupt each gets a single try, not the usual retries.
+        """
+        for lease in list(self.active.values()):
+            await self._complete(lease, retries=1 if interrupted else None)
+        await asyncio.gather(*self._completing, return_exceptions=True)
@@ -0,0 +1,131 @@
+"""
+Adaptive (AIMD) limit on requests in flight.
+
+The limit grows by one for every `limit` healthy responses (additive
+increase: about +1 per round of the whole window) and is cut when the
+server pushes back:
+
+    429 / 503 / Retry-After      limit * OVERLOAD_DECREASE, and new requests
+                                 are held until Retry-After has passed
+    TTFB > LATENCY_FACTOR x the  limit * LATENCY_DECREASE (queues are
+    best smoothed latency        building up on the server side)
+
+Like TCP's congestion window, responses to requests sent before the last
+cut carry no news (they were sent at the old rate), so they neither cut
+nor grow the limit again: a burst of 429s from one window counts as one
+signal rather than collapsing the limit to the floor.
+"""
+import asyncio
+import contextlib
+import time
+from typing import Optional
+
+OVERLOAD_STATUSES = (429, 503)
+OVERLOAD_DECREASE = 0.5
+LATENCY_DECREASE = 0.8
+LATENCY_FACTOR = 3.0
+LATENCY_ALPHA = 0.1  # EWMA weight of each new time-to-first-byte sample
+BASELINE_DRIFT = 0.01  # How fast the latency baseline follows a slower server
+COOLDOWN = 1.0  # Seconds between two back_off() cuts, which carry no request start time
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+class AdaptiveLimiter:
+    """Caps concurrent requests at a limit that adapts to server feedback."""
+
+    def __init__(self, initial: int, minimum: int = 1, maximum: int = 64):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(self.maximum, max(self.minimum, initial)))
+        self.in_flight = 0
+        self.hold_until = 0.0
+        self.cuts = 0
+        self.latency: Optional[float] = None  # Smoothed time to first byte
+        self.baseline: Optional[float] = None  # Best smoothed latency seen
+        self._last_cut = 0.0
+        self._changed = asyncio.Event()
+
+    @property
+    def current(self) -> int:
+        return int(self.limit)
+
+    async def acquire(self) -> None:
+        while True:
+            now = time.monotonic()
+            if now >= self.hold_until and self.in_flight < self.current:
+                self.in_flight += 1
+                return
+            self._changed.clear()
+            timeout = self.hold_until - now if now < self.hold_until else None
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._changed.set()
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield self
+        finally:
+            self.release()
+
+    def record(
+        self,
+        latency: Optional[float],
+        status: Optional[int] = None,
+        retry_after: Optional[float] = None,
+    ) -> None:
+        """Feed back one response: its time to first byte, status and Retry-After."""
+        now = time.monotonic()
+        if retry_after:
+            self.hold_until = max(self.hold_until, now + retry_after)
+        if latency is not None and now - latency < self._last_cut:
+            pass  # Sent before the last cut
+        elif status in OVERLOAD_STATUSES or retry_after is not None:
+            self._cut(OVERLOAD_DECREASE)
+        elif latency is not None:
+            self.latency = latency if self.latency is None else (
+                LATENCY_ALPHA * latency + (1 - LATENCY_ALPHA) * self.latency
+            )
+            if self.baseline is None or self.latency < self.baseline:
+                self.baseline = self.latency
+            else:
+                self.baseline += BASELINE_DRIFT * (self.latency - self.baseline)
+            if self.latency > self.baseline * LATENCY_FACTOR:
+                self._cut(LATENCY_DECREASE)
+            elif status is None or status < 400:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        self._changed.set()
+
+    def back_off(self) -> bool:
+        """Cut the limit for a refusal (e.g. 403). False if it is already at the floor."""
+        if self.current <= self.minimum:
+            return False
+        if time.monotonic() - self._last_cut >= COOLDOWN:
+            self._cut(OVERLOAD_DECREASE)
+        return True
+
+    def _cut(self, factor: float) -> None:
+        self._last_cut = time.monotonic()
+        self.limit = max(self.minimum, self.limit * factor)
+        self.cuts += 1
+
+
+def make_limiter(concurrency: int, max_concurrency: int = 0) -> Optional[AdaptiveLimiter]:
+    """A limiter starting at concurrency and growing up to max_concurrency (None if not larger)."""
+    if max_concurrency <= concurrency:
+        return None
+    return AdaptiveLimiter(concurrency, maximum=max_concurrency)
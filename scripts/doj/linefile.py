@@ -0,0 +1,182 @@
+"""
+Random access to the lines of a large URL list.
+
+    with LineFile(Path("pdf-links.txt")) as lines:
+        len(lines)                  # non-blank lines
+        lines[100_000]              # one line, stripped
+        lines.iter_lines(100_000, 150_000)
+        lines.shard(2, 4)           # range of line numbers for worker 2 of 4
+
+The file is memory-mapped and the start offset of every non-blank line is
+kept in an array (4 bytes a line under 4 GiB). The offsets are cached
+under the user's cache directory ($XDG_CACHE_HOME, else ~/.cache), keyed by
+the list's absolute path, not beside the list where they would end up in
+a checkout. They are reused while the list is unchanged; when it has only
+grown, as the scrapers' output does, just the new tail is scanned. Reading a range of lines touches only the
+pages that hold them.
+"""
+import hashlib
+import mmap
+import os
+import struct
+import zlib
+from array import array
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple, Union
+
+INDEX_MAGIC = b"DOJLIDX1"
+# magic, offset typecode, indexed bytes, file size, file mtime_ns, CRC32 of the first HEAD_BYTES indexed
+INDEX_HEADER = struct.Struct("<8sc7xQQqI")
+HEAD_BYTES = 65536
+ITER_BLOCK = 4096  # Lines decoded per read by iter_lines
+
+
+def cache_dir() -> Path:
+    return Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "doj-scripts" / "line-offsets"
+
+
+def index_path(path: Path) -> Path:
+    key = hashlib.sha1(str(path.resolve()).encode("utf-8", "surrogateescape")).hexdigest()[:16]
+    return cache_dir() / f"{path.name}.{key}.idx"
+
+
+def parse_shard(spec: str) -> Tuple[int, int]:
+    """'K/N' (1-based, as given on the command line) -> (K - 1, N)."""
+    try:
+        number, count = (int(part) for part in spec.split("/"))
+    except ValueError:
+        raise ValueError(f"Shard must look like K/N, e.g. 1/4: {spec!r}") from None
+    if not 1 <= number <= count:
+        raise ValueError(f"Shard {spec!r} out of range: K must be between 1 and N")
+    return number - 1, count
+
+
+class LineFile:
+    """Memory-mapped text file with an index of its non-blank lines."""
+
+    def __init__(self, path: Path, cache: bool = True):
+        self.path = Path(path)
+        self.cache = cache
+        self._file = self.path.open("rb")
+        stat = self.path.stat()
+        self.size = stat.st_size
+        self._mtime_ns = stat.st_mtime_ns
+        # mmap refuses empty files
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+        self._offsets = self._load_offsets()
+
+    def __enter__(self) -> "LineFile":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        self._file.close()
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def __getitem__(self, key: Union[int, slice]) -> Union[str, List[str]]:
+        if isinstance(key, slice):
+            return [self[i] for i in range(*key.indices(len(self)))]
+        return bytes(self.raw(key)).strip().decode("utf-8")
+
+    def raw(self, number: int) -> memoryview:
+        """Line `number` as a view into the mapping, without its newline."""
+        start = self._offsets[number]
+        end = self._mm.find(b"\n", start)
+        return memoryview(self._mm)[start : end if end >= 0 else self.size]
+
+    def iter_lines(self, start: int = 0, stop: Optional[int] = None) -> Iterator[str]:
+        """Stripped lines start..stop-1, decoded ITER_BLOCK lines at a time."""
+        mm, offsets = self._mm, self._offsets
+        stop = len(offsets) if stop is None else min(stop, len(offsets))
+        for first in range(max(0, start), stop, ITER_BLOCK):
+            last = min(first + ITER_BLOCK, stop)
+            end = offsets[last] if last < len(offsets) else self.size
+            # The block may take in blank lines before `last`; they're dropped again
+            for line in mm[offsets[first] : end].decode("utf-8").split("\n"):
+                line = line.strip()
+                if line:
+                    yield line
+
+    def shard(self, index: int, count: int) -> range:
+        """Line numbers of contiguous shard `index` (0-based) of `count`."""
+        total = len(self)
+        return range(total * index // count, total * (index + 1) // count)
+
+    # -- Offsets index --------------------------------------------------
+
+    def _head_crc(self, indexed: int) -> int:
+        return zlib.crc32(self._mm[: min(HEAD_BYTES, indexed)]) if self._mm is not None else 0
+
+    def _load_offsets(self) -> array:
+        typecode = "I" if self.size < 1 << 32 else "Q"
+        offsets, indexed = self._read_cache(typecode)
+        if offsets is not None and indexed == self.size:
+            return offsets
+        if offsets is None:
+            offsets, indexed = array(typecode), 0
+        indexed = self._scan(offsets, indexed)
+        if self.cache:
+            self._write_cache(offsets, indexed)
+        return offsets
+
+    def _scan(self, offsets: array, start: int) -> int:
+        """Append the offsets of non-blank lines from start on; returns the bytes covered by whole lines."""
+        mm, size, pos = self._mm, self.size, start
+        while pos < size:
+            end = mm.find(b"\n", pos)
+            if end < 0:
+                # An unterminated last line (perhaps still being written) isn't cached
+                if mm[pos:size].strip():
+                    offsets.append(pos)
+                return pos
+            if mm[pos:end].strip():
+                offsets.append(pos)
+            pos = end + 1
+        return pos
+
+    def _read_cache(self, typecode: str) -> Tuple[Optional[array], int]:
+        """Cached offsets still valid for the file and the bytes they cover, or (None, 0)."""
+        if not self.cache or self._mm is None:
+            return None, 0
+        try:
+            data = index_path(self.path).read_bytes()
+            magic, code, indexed, size, mtime_ns, head_crc = INDEX_HEADER.unpack_from(data)
+        except (OSError, struct.error):
+            return None, 0
+        if magic != INDEX_MAGIC or code.decode() != typecode or head_crc != self._head_crc(indexed):
+            return None, 0
+        unchanged = size == self.size and mtime_ns == self._mtime_ns
+        # Grown since: reuse the cache if its last line still ends where it did
+        appended = self.size > size and (indexed == 0 or self._mm[indexed - 1 : indexed] == b"\n")
+        if not unchanged and not appended:
+            return None, 0
+        offsets = array(typecode)
+        offsets.frombytes(data[INDEX_HEADER.size :])
+        if unchanged and indexed < self.size:
+            self._scan(offsets, indexed)  # Unterminated last line
+            return offsets, self.size
+        return offsets, indexed
+
+    def _write_cache(self, offsets: array, indexed: int) -> None:
+        if self._mm is None:
+            return
+        # Only whole lines go in the cache; the unterminated one is rescanned next time
+        cached = offsets if not offsets or offsets[-1] < indexed else offsets[:-1]
+        header = INDEX_HEADER.pack(
+            INDEX_MAGIC, offsets.typecode.encode(), indexed, self.size, self._mtime_ns, self._head_crc(indexed)
+        )
+        path = index_path(self.path)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp.write_bytes(header + cached.tobytes())
+            tmp.replace(path)
+        except OSError:
+            pass  # No writable cache directory: just index again next time
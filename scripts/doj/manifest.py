@@ -0,0 +1,321 @@
+"""
+SQLite-backed manifest of every known PDF URL and scraped listing page.
+
+Replaces the flat state files (pdf-links.txt, *-progress.txt, failed-*.txt,
+failed-pages.txt) with one indexed database that all scripts share.
+"""
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+DEFAULT_MANIFEST = "manifest.sqlite3"
+WRITE_BATCH = 500  # Buffered status updates per transaction
+PAGE_SIZE = 1000  # Rows fetched per query by iter_pending
+
+# File statuses
+PENDING = "pending"
+DOWNLOADED = "downloaded"
+FAILED = "failed"
+CORRUPT = "corrupt"
+BLOCKED = "blocked"
+
+# Page statuses (FAILED is shared)
+DONE = "done"
+
+# Statuses that still need work
+RETRYABLE = (PENDING, FAILED, CORRUPT, BLOCKED)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL UNIQUE,
+    filename TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    size INTEGER,
+    sha256 TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    added_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_status ON files (status, id);
+CREATE INDEX IF NOT EXISTS files_filename ON files (filename);
+CREATE INDEX IF NOT EXISTS files_sha256 ON files (sha256);
+
+CREATE TABLE IF NOT EXISTS pages (
+    page INTEGER PRIMARY KEY,
+    status TEXT NOT NULL,
+    links INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    updated_at REAL NOT NULL,
+    first_id INTEGER,
+    last_id INTEGER
+);
+CREATE INDEX IF NOT EXISTS pages_status ON pages (status, page);
+
+CREATE TABLE IF NOT EXISTS sources (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL
+);
+"""
+
+
+class Manifest:
+    """Indexed download/scrape state with batched writes."""
+
+    def __init__(self, path: Path, write_batch: int = WRITE_BATCH):
+        self.path = Path(path)
+        self.write_batch = write_batch
+        self.conn = sqlite3.connect(str(self.path))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._migrate()
+        self._updates: List[Tuple] = []
+
+    def __enter__(self) -> "Manifest":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.flush()
+        self.conn.close()
+
+    def _migrate(self) -> None:
+        """Add columns introduced after a manifest was created."""
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(pages)")}
+        with self.conn:
+            for column in ("first_id", "last_id"):
+                if column not in columns:
+                    self.conn.execute(f"ALTER TABLE pages ADD COLUMN {column} INTEGER")
+
+    # -- URLs -----------------------------------------------------------
+
+    def add_urls(self, urls: Iterable[str]) -> int:
+        """Insert URLs that aren't known yet. Returns the number added."""
+        now = time.time()
+        before = self.conn.total_changes
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO files (url, added_at, updated_at) VALUES (?, ?, ?)",
+                ((url, now, now) for url in urls),
+            )
+        return self.conn.total_changes - before
+
+    def import_url_file(self, path: Path, force: bool = False) -> int:
+        """Import a one-URL-per-line file, skipping it if unchanged since the last import."""
+        path = Path(path)
+        stat = path.stat()
+        key = str(path.resolve())
+        row = self.conn.execute(
+            "SELECT size, mtime FROM sources WHERE path = ?", (key,)
+        ).fetchone()
+        if not force and row == (stat.st_size, stat.st_mtime):
+            return 0
+
+        with path.open("r", encoding="utf-8") as handle:
+            added = self.add_urls(line.strip() for line in handle if line.strip())
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sources (path, size, mtime) VALUES (?, ?, ?)",
+                (key, stat.st_size, stat.st_mtime),
+            )
+        return added
+
+    def import_status_file(self, path: Path, status: str) -> int:
+        """Mark every URL listed in a progress/failed file with the given status."""
+        path = Path(path)
+        if not path.exists():
+            return 0
+        with path.open("r", encoding="utf-8") as handle:
+            urls = [line.strip() for line in handle if line.strip()]
+        self.add_urls(urls)
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE files SET status = ?, updated_at = ? WHERE url = ?",
+                ((status, now, url) for url in urls),
+            )
+        return len(urls)
+
+    def pending(
+        self,
+        limit: Optional[int] = None,
+        statuses: Sequence[str] = RETRYABLE,
+        max_attempts: Optional[int] = None,
+    ) -> List[str]:
+        """Return URLs that still need downloading, in insertion order."""
+        return list(self.iter_pending(limit, statuses, max_attempts))
+
+    def iter_pending(
+        self,
+        limit: Optional[int] = None,
+        statuses: Sequence[str] = RETRYABLE,
+        max_attempts: Optional[int] = None,
+        page_size: int = PAGE_SIZE,
+        shard: Optional[Tuple[int, int]] = None,
+    ) -> Iterator[str]:
+        """Yield pending URLs lazily, one keyset page at a time.
+
+        No cursor stays open between pages, so callers can record() results
+        (and trigger flushes) while iterating. shard (index, count) yields
+        only the rows whose id is index modulo count.
+        """
+        where = f"status IN ({','.join('?' * len(statuses))}) AND id > ?"
+        if max_attempts is not None:
+            where += " AND attempts < ?"
+        if shard is not None:
+            where += " AND id % ? = ?"
+        last_id = 0
+        remaining = limit
+        while remaining is None or remaining > 0:
+            self.flush()
+            params: List = [*statuses, last_id]
+            if max_attempts is not None:
+                params.append(max_attempts)
+            if shard is not None:
+                params += [shard[1], shard[0]]
+            size = page_size if remaining is None else min(page_size, remaining)
+            rows = self.conn.execute(
+                f"SELECT id, url FROM files WHERE {where} ORDER BY id LIMIT ?", (*params, size)
+            ).fetchall()
+            for _, url in rows:
+                yield url
+            if len(rows) < size:
+                return
+            last_id = rows[-1][0]
+            if remaining is not None:
+                remaining -= len(rows)
+
+    def count_pending(self, statuses: Sequence[str] = RETRYABLE) -> int:
+        self.flush()
+        row = self.conn.execute(
+            f"SELECT COUNT(*) FROM files WHERE status IN ({','.join('?' * len(statuses))})",
+            tuple(statuses),
+        ).fetchone()
+        return row[0]
+
+    def urls_with_status(self, status: str) -> List[str]:
+        self.flush()
+        rows = self.conn.execute(
+            "SELECT url FROM files WHERE status = ? ORDER BY id", (status,)
+        )
+        return [url for (url,) in rows]
+
+    def mark_files(self, filenames: Iterable[str], status: str, error: Optional[str] = None) -> int:
+        """Set the status of every row whose file is one of filenames. Returns rows changed."""
+        self.flush()
+        now = time.time()
+        with self.conn:
+            cur = self.conn.executemany(
+                "UPDATE files SET status = ?, last_error = ?, updated_at = ? WHERE filename = ?",
+                [(status, error, now, filename) for filename in filenames],
+            )
+        return cur.rowcount
+
+    def digests(self) -> Dict[str, str]:
+        """filename -> SHA-256 for every downloaded file with a recorded digest."""
+        self.flush()
+        rows = self.conn.execute(
+            "SELECT filename, sha256 FROM files WHERE status = ? AND sha256 IS NOT NULL", (DOWNLOADED,)
+        )
+        return {filename: sha256 for filename, sha256 in rows}
+
+    def iter_statuses(self) -> Iterator[Tuple[str, str]]:
+        """(url, status) of every file, in insertion order."""
+        self.flush()
+        return iter(self.conn.execute("SELECT url, status FROM files ORDER BY id").fetchall())
+
+    def get(self, url: str) -> Optional[Dict]:
+        self.flush()
+        cur = self.conn.execute("SELECT * FROM files WHERE url = ?", (url,))
+        row = cur.fetchone()
+        if row is None:
+            return None
+        return dict(zip([col[0] for col in cur.description], row))
+
+    def record(
+        self,
+        url: str,
+        status: str,
+        filename: Optional[str] = None,
+        size: Optional[int] = None,
+        sha256: Optional[str] = None,
+        error: Optional[str] = None,
+        attempted: bool = True,
+    ) -> None:
+        """Queue a status update; written in batches of `write_batch`."""
+        now = time.time()
+        self._updates.append(
+            (url, now, now, status, filename, size, sha256, int(attempted), error)
+        )
+        if len(self._updates) >= self.write_batch:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._updates:
+            return
+        updates, self._updates = self._updates, []
+        with self.conn:
+            self.conn.executemany(
+                """
+                INSERT INTO files (url, added_at, updated_at, status, filename, size, sha256, attempts, last_error)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (url) DO UPDATE SET
+                    status = excluded.status,
+                    filename = COALESCE(excluded.filename, filename),
+                    size = COALESCE(excluded.size, size),
+                    sha256 = COALESCE(excluded.sha256, sha256),
+                    attempts = attempts + excluded.attempts,
+                    last_error = excluded.last_error,
+                    updated_at = excluded.updated_at
+                """,
+                updates,
+            )
+
+    def counts(self) -> Dict[str, int]:
+        self.flush()
+        rows = self.conn.execute("SELECT status, COUNT(*) FROM files GROUP BY status")
+        return {status: count for status, count in rows}
+
+    # -- Listing pages --------------------------------------------------
+
+    def record_page(
+        self,
+        page: int,
+        status: str,
+        links: int = 0,
+        error: Optional[str] = None,
+        ids: Optional[Tuple[int, int]] = None,
+    ) -> None:
+        """ids is the (lowest, highest) EFTA number the page listed, if any."""
+        first_id, last_id = ids or (None, None)
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO pages (page, status, links, last_error, updated_at, first_id, last_id) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (page, status, links, error, time.time(), first_id, last_id),
+            )
+
+    def iter_pages(self) -> Iterator[Tuple[int, str, Optional[int], Optional[int]]]:
+        """(page, status, first_id, last_id) of every recorded page, in page order."""
+        return iter(
+            self.conn.execute("SELECT page, status, first_id, last_id FROM pages ORDER BY page").fetchall()
+        )
+
+    def failed_pages(self) -> List[int]:
+        rows = self.conn.execute(
+            "SELECT page FROM pages WHERE status = ? ORDER BY page", (FAILED,)
+        )
+        return [page for (page,) in rows]
+
+    def last_completed_page(self) -> int:
+        """Highest page number that was scraped successfully (0 if none)."""
+        row = self.conn.execute(
+            "SELECT MAX(page) FROM pages WHERE status = ?", (DONE,)
+        ).fetchone()
+        return row[0] or 0
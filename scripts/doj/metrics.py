@@ -0,0 +1,297 @@
+"""
+Run metrics in the Prometheus text exposition format.
+
+    metrics = RunMetrics()
+    engine = Engine(..., metrics=metrics)
+    async with MetricsExporter(metrics, port=9108, textfile="doj.prom"):
+        await engine.run(urls)
+
+The exporter serves GET /metrics for a Prometheus scrape and/or rewrites a
+textfile every few seconds for node_exporter's textfile collector. Gauges
+that sample run state (queue depth, block pause, ...) are filled in by
+collectors right before each render, so the hot path only ever bumps
+counters. No client library is needed.
+"""
+import asyncio
+import os
+import time
+from bisect import bisect_left
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import aiohttp
+from aiohttp import web
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+TEXTFILE_INTERVAL = 5.0  # Seconds between textfile rewrites
+# Seconds; spans a local mirror's TTFB up to a slow multi-MB body
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Labels of doj_phase_seconds
+CONNECT = "connect"  # New connection: DNS, TCP and TLS
+TTFB = "ttfb"  # Request sent -> response headers
+BODY = "body"  # Headers -> last byte, minus disk time
+DISK = "disk"  # Writing, renaming and linking the file
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(int(value)) if float(value).is_integer() else repr(value)
+
+
+class Metric:
+    """A named family of samples, one per combination of label values."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        if not self.labelnames:
+            self._values[()] = 0.0
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, key)} {_number(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket (the last one is +Inf), sum]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        super().__init__(name, help, labels)
+        self._values.clear()
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def count(self, **labels) -> int:
+        series = self._series.get(self._key(labels))
+        return sum(series[0]) if series else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        names = self.labelnames + ("le",)
+        for key, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(names, key + (_number(bound),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Metrics rendered together, plus callbacks that refresh gauges first."""
+
+    def __init__(self):
+        self.metrics: List[Metric] = []
+        self.collectors: List[Callable[[], None]] = []
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def _register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], None]) -> None:
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self.collectors:
+            collector()
+        lines: List[str] = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class RunMetrics(Registry):
+    """The metrics one downloader or scraper run reports."""
+
+    def __init__(self):
+        super().__init__()
+        self.start_time = self.gauge("doj_start_time_seconds", "Unix time the run started.")
+        self.start_time.set(time.time())
+        self.files = self.counter("doj_files_total", "URLs finished, by result.", ("status",))
+        self.responses = self.counter("doj_responses_total", "HTTP responses, by status code.", ("code",))
+        self.body_bytes = self.counter("doj_body_bytes_total", "Response body bytes written to disk.")
+        self.in_flight = self.gauge("doj_requests_in_flight", "Requests sent and not yet fully read.")
+        self.queue_depth = self.gauge("doj_queue_depth", "URLs buffered between the producer and the workers.")
+        self.concurrency_limit = self.gauge("doj_concurrency_limit", "Requests the adaptive limiter currently allows.")
+        self.blocked = self.counter("doj_blocked_responses_total", "Responses treated as an IP block.")
+        self.block_pauses = self.counter("doj_block_pauses_total", "Global pauses started after a block.")
+        self.block_pause_seconds = self.counter(
+            "doj_block_pause_seconds_total", "Seconds of global pause started after blocks."
+        )
+        self.block_remaining = self.gauge("doj_block_pause_remaining_seconds", "Seconds left in the current pause.")
+        self.phases = self.histogram("doj_phase_seconds", "Time spent per request phase.", ("phase",))
+        self.pages = self.counter("doj_pages_total", "Listing pages finished, by result.", ("status",))
+        self.links = self.counter("doj_links_total", "PDF links found on listing pages.", ("new",))
+
+    def observe(self, phase: str, seconds: float) -> None:
+        self.phases.observe(seconds, phase=phase)
+
+    def record_body(self, size: int, body_seconds: float, disk_seconds: float) -> None:
+        self.body_bytes.inc(size)
+        self.phases.observe(body_seconds, phase=BODY)
+        self.phases.observe(disk_seconds, phase=DISK)
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        """aiohttp hooks timing new connections as the connect phase."""
+
+        async def on_start(session, ctx, params) -> None:
+            ctx.connect_started = time.monotonic()
+
+        async def on_end(session, ctx, params) -> None:
+            started = getattr(ctx, "connect_started", None)
+            if started is not None:
+                self.observe(CONNECT, time.monotonic() - started)
+
+        config = aiohttp.TraceConfig()
+        config.on_connection_create_start.append(on_start)
+        config.on_connection_create_end.append(on_end)
+        return config
+
+
+def write_textfile(registry: Registry, path: Path) -> None:
+    """Replace path atomically, so a collector never reads half a file."""
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_text(registry.render(), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+class MetricsExporter:
+    """Publishes a registry over HTTP and/or as a textfile while a run lasts."""
+
+    def __init__(
+        self,
+        registry: Registry,
+        port: int = 0,
+        host: str = "127.0.0.1",
+        textfile: Optional[Path] = None,
+        interval: float = TEXTFILE_INTERVAL,
+    ):
+        """
+        port      serve GET /metrics here (0 = no HTTP endpoint)
+        textfile  rewrite this file every `interval` seconds and once at exit
+        """
+        self.registry = registry
+        self.port = port
+        self.host = host
+        self.textfile = Path(textfile) if textfile else None
+        self.interval = interval
+        self._runner: Optional[web.AppRunner] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def __aenter__(self) -> "MetricsExporter":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    async def start(self) -> None:
+        if self.port:
+            app = web.Application()
+            app.router.add_get("/metrics", self._handle)
+            self._runner = web.AppRunner(app, access_log=None)
+            await self._runner.setup()
+            await web.TCPSite(self._runner, self.host, self.port).start()
+        if self.textfile:
+            self._task = asyncio.create_task(self._write_loop())
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            write_textfile(self.registry, self.textfile)  # Final counts
+        if self._runner:
+            await self._runner.cleanup()
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(body=self.registry.render().encode("utf-8"), headers={"Content-Type": CONTENT_TYPE})
+
+    async def _write_loop(self) -> None:
+        while True:
+            write_textfile(self.registry, self.textfile)
+            await asyncio.sleep(self.interval)
+
+
+def add_metrics_arguments(parser) -> None:
+    parser.add_argument(
+        "--metrics-port", type=int, default=0, help="Serve Prometheus metrics on this port at /metrics (default: off)"
+    )
+    parser.add_argument("--metrics-host", default="127.0.0.1", help="Address for --metrics-port (default: 127.0.0.1)")
+    parser.add_argument(
+        "--metrics-file", default="", help="Rewrite Prometheus metrics to this file every few seconds (textfile collector)"
+    )
+
+
+def exporter_from_args(args) -> Optional[MetricsExporter]:
+    """The exporter asked for by add_metrics_arguments' flags, or None."""
+    if not args.metrics_port and not args.metrics_file:
+        return None
+    return MetricsExporter(RunMetrics(), args.metrics_port, args.metrics_host, args.metrics_file or None)
@@ -0,0 +1,90 @@
+"""
+Helpers for resuming interrupted downloads with HTTP Range requests.
+
+A partial download lives in `<dest>.part`. When the server advertised
+`Accept-Ranges: bytes`, the `.part` file is kept across retries and runs,
+and the response's ETag (or Last-Modified) is stored next to it in
+`<dest>.part.validator` so the continuation can be sent with If-Range:
+if the document changed in between, the server answers with a full 200
+instead of stitching two versions together.
+"""
+import re
+from pathlib import Path
+from typing import Dict, Mapping, Optional, Tuple
+
+CONTENT_RANGE_RE = re.compile(r"bytes\s+(\d+)-(\d+)/(\d+|\*)")
+
+
+def part_path(dest: Path) -> Path:
+    return dest.with_suffix(dest.suffix + ".part")
+
+
+def validator_path(dest: Path) -> Path:
+    return dest.with_suffix(dest.suffix + ".part.validator")
+
+
+def resume_offset(dest: Path) -> Tuple[int, Optional[str]]:
+    """Return (bytes already on disk, If-Range validator) for dest's .part file."""
+    try:
+        offset = part_path(dest).stat().st_size
+    except OSError:
+        return 0, None
+    try:
+        validator = validator_path(dest).read_text(encoding="utf-8").strip() or None
+    except OSError:
+        validator = None
+    return offset, validator
+
+
+def range_headers(offset: int, validator: Optional[str]) -> Dict[str, str]:
+    # Byte offsets refer to the identity encoding, so don't negotiate compression
+    headers = {"Range": f"bytes={offset}-", "Accept-Encoding": "identity"}
+    if validator:
+        headers["If-Range"] = validator
+    return headers
+
+
+def accepts_ranges(headers: Mapping[str, str]) -> bool:
+    return headers.get("Accept-Ranges", "").strip().lower() == "bytes"
+
+
+def remember_validator(dest: Path, headers: Mapping[str, str]) -> None:
+    """Store the validator a later Range request should send as If-Range."""
+    validator = headers.get("ETag") or headers.get("Last-Modified")
+    if validator and not validator.startswith("W/"):  # Weak ETags can't be used with If-Range
+        validator_path(dest).write_text(validator, encoding="utf-8")
+    else:
+        validator_path(dest).unlink(missing_ok=True)
+
+
+def parse_content_range(value: Optional[str]) -> Optional[Tuple[int, int, Optional[int]]]:
+    """Parse 'bytes start-end/total' into (start, end, total or None)."""
+    if not value:
+        return None
+    match = CONTENT_RANGE_RE.fullmatch(value.strip())
+    if not match:
+        return None
+    start, end, total = match.groups()
+    return int(start), int(end), None if total == "*" else int(total)
+
+
+def expected_total(status: int, headers: Mapping[str, str]) -> Optional[int]:
+    """Full size of the document, if the response says so."""
+    if status == 206:
+        parsed = parse_content_range(headers.get("Content-Range"))
+        return parsed[2] if parsed else None
+    if headers.get("Content-Encoding"):
+        return None
+    value = headers.get("Content-Length")
+    return int(value) if value and value.isdigit() else None
+
+
+def discard(dest: Path) -> None:
+    part_path(dest).unlink(missing_ok=True)
+    validator_path(dest).unlink(missing_ok=True)
+
+
+def finish(dest: Path) -> None:
+    """Move the completed .part file into place."""
+    part_path(dest).replace(dest)
+    validator_path(dest).unlink(missing_ok=True)
@@ -0,0 +1,96 @@
+"""
+Where a run's results go, and which URLs a run should start from.
+
+The SQLite manifest is the preferred state store; scripts without one keep
+the older plain files (an append-only progress journal of completed URLs
+and a failed-URL list written at the end). URL sources are iterated
+lazily so the engine's producer never holds the whole list.
+"""
+import sys
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+from doj import manifest as mf
+from doj.journal import ProgressJournal
+from doj.urls import iter_urls
+from doj.urlset import UrlSet
+
+
+class StateStore:
+    """Records per-URL outcomes in the manifest and/or progress journal."""
+
+    def __init__(
+        self,
+        manifest: Optional[mf.Manifest] = None,
+        journal: Optional[ProgressJournal] = None,
+    ):
+        self.manifest = manifest
+        self.journal = journal
+        self.failed_urls: List[str] = []
+
+    def downloaded(
+        self, url: str, filename: str, size: Optional[int] = None, sha256: Optional[str] = None
+    ) -> None:
+        if self.manifest:
+            self.manifest.record(url, mf.DOWNLOADED, filename=filename, size=size, sha256=sha256)
+        if self.journal:
+            self.journal.append(url)
+
+    def skipped(self, url: str, filename: str, size: Optional[int] = None) -> None:
+        """The file was already there (or unchanged on the server)."""
+        if self.manifest:
+            self.manifest.record(url, mf.DOWNLOADED, filename=filename, size=size, attempted=False)
+
+    def failed(self, url: str, status: str = mf.FAILED, error: Optional[str] = None) -> None:
+        self.failed_urls.append(url)
+        if self.manifest:
+            self.manifest.record(url, status, error=error)
+
+    def write_failed(self, path: Optional[Path], remove_stale: bool = False) -> None:
+        """Write this run's failed URLs to path (optionally deleting an old list if none failed)."""
+        if not path:
+            return
+        if self.failed_urls:
+            path.write_text("\n".join(self.failed_urls) + "\n", encoding="utf-8")
+        elif remove_stale and path.exists():
+            path.unlink()
+
+    def close(self) -> None:
+        if self.journal:
+            self.journal.close()
+        if self.manifest:
+            self.manifest.close()
+
+
+def select_urls(
+    input_path: Path,
+    manifest: Optional[mf.Manifest] = None,
+    journal: Optional[ProgressJournal] = None,
+    deduplicate: bool = True,
+    statuses: Sequence[str] = mf.RETRYABLE,
+    shard: Optional[Tuple[int, int]] = None,
+) -> Tuple[Iterator[str], Optional[int], int]:
+    """Return (lazy iterator of URLs still to fetch, how many if known, URLs already done).
+
+    With a manifest, new lines from input_path are imported first and the
+    pending rows are paged out of SQLite; otherwise input_path is streamed
+    and URLs listed in the progress journal are dropped on the way. shard
+    (index, count) takes only that share: a contiguous run of input_path's
+    lines, or the manifest rows whose id is index modulo count.
+    """
+    if manifest:
+        if input_path.exists():
+            added = manifest.import_url_file(input_path)
+            if added:
+                print(f"Added {added} new URLs from {input_path} to {manifest.path}", file=sys.stderr)
+        done = manifest.counts().get(mf.DOWNLOADED, 0)
+        pending = manifest.count_pending(statuses) if shard is None else None
+        return manifest.iter_pending(statuses=statuses, shard=shard), pending, done
+
+    completed = journal.load() if journal else UrlSet()
+    if completed:
+        print(f"Resuming: {len(completed)} URLs already completed")
+    urls = iter_urls(input_path, deduplicate=deduplicate, shard=shard)
+    if completed:
+        urls = (url for url in urls if url not in completed)
+    return urls, None, len(completed)
@@ -0,0 +1,196 @@
+"""
+Writing response bodies into the output directory.
+
+Bodies stream into `<dest>.part` (kept for a Range resume when the server
+supports one) and are renamed into place once complete. Only the first
+SNIFF_SIZE bytes are held in memory, to reject HTML error pages before
+anything touches the disk. The SHA-256 of the body is computed on the way
+through, for the manifest and the optional content-addressed store.
+"""
+import hashlib
+import os
+import time
+from pathlib import Path
+from typing import Dict, Optional, Set, Tuple
+
+from doj import partial, trace
+from doj.cas import READ_SIZE, ContentStore
+from doj.layout import Layout
+from doj.metrics import RunMetrics
+from doj.urls import filename_from_url
+from doj.validators import ValidatorCache
+
+PDF_MAGIC = b"%PDF"  # PDF files start with this magic byte sequence
+SNIFF_SIZE = 20  # Leading bytes buffered before the body is streamed to disk
+
+# Results of StorageWriter.write()
+DOWNLOADED = "downloaded"
+UNCHANGED = "unchanged"
+CORRUPT = "corrupt"
+
+
+class PayloadError(Exception):
+    """The body didn't match what the response headers promised."""
+
+
+def sniff_pdf_error(head: bytes) -> Optional[str]:
+    """Return an error message if the leading bytes don't look like a PDF."""
+    if head.startswith(PDF_MAGIC):
+        return None
+    # Check if it's HTML (common when redirected to login/captcha page)
+    if head.startswith(b"<!DOCTYPE") or head.startswith(b"<html") or head.startswith(b"\n<!DOCTYPE"):
+        return "Received HTML instead of PDF (likely captcha/auth page)"
+    return f"Invalid PDF: missing magic bytes (got: {head[:20]!r})"
+
+
+def has_pdf_magic(path: Path) -> bool:
+    try:
+        with path.open("rb") as f:
+            return f.read(len(PDF_MAGIC)) == PDF_MAGIC
+    except OSError:
+        return False
+
+
+def unique_name(name: str, layout: Layout, reserved: Set[str]) -> str:
+    if name not in reserved and not layout.path_for(name).exists():
+        reserved.add(name)
+        return name
+    stem, suffix = os.path.splitext(name)
+    idx = 2
+    while True:
+        candidate = f"{stem}-{idx}{suffix}"
+        if candidate not in reserved and not layout.path_for(candidate).exists():
+            reserved.add(candidate)
+            return candidate
+        idx += 1
+
+
+class StorageWriter:
+    """Maps URLs to destination paths and writes response bodies to them."""
+
+    def __init__(
+        self,
+        layout: Layout,
+        validate_pdf: bool = True,
+        validator_cache: Optional[ValidatorCache] = None,
+        content_store: Optional[ContentStore] = None,
+        metrics: Optional[RunMetrics] = None,
+    ):
+        self.layout = layout
+        self.validate_pdf = validate_pdf
+        self.validator_cache = validator_cache
+        self.content_store = content_store
+        self.metrics = metrics
+        self._reserved: Set[str] = set()
+        self._digests: Dict[Path, str] = {}
+
+    def take_digest(self, dest: Path) -> Optional[str]:
+        """SHA-256 (hex) of the body write() last stored at dest, if any."""
+        return self._digests.pop(dest, None)
+
+    def _record_body(self, size: int, body_seconds: float, disk_seconds: float) -> None:
+        if self.metrics:
+            self.metrics.record_body(size, body_seconds, disk_seconds)
+        trace.record_body(size, body_seconds, disk_seconds)
+
+    def existing(self, url: str) -> Tuple[str, Path]:
+        """(filename, path) the URL maps to before de-duplicating names."""
+        filename = filename_from_url(url)
+        return filename, self.layout.path_for(filename)
+
+    def reserve(self, url: str) -> Tuple[str, Path]:
+        """A fresh (filename, path) for url that no other download in this run will use."""
+        filename = unique_name(filename_from_url(url), self.layout, self._reserved)
+        return filename, self.layout.ensure_path(filename)
+
+    async def write(self, url: str, dest: Path, resp, offset: int = 0) -> Tuple[str, Optional[str]]:
+        """Store resp's body at dest. Returns (DOWNLOADED | UNCHANGED | CORRUPT, error)."""
+        # Stale or bogus .part file - drop it and fetch in full
+        if resp.status == 416:
+            partial.discard(dest)
+            raise PayloadError("range not satisfiable")
+
+        # Conditional GET: the copy on disk is still current
+        if resp.status == 304:
+            partial.discard(dest)  # A .part from an interrupted refresh is stale
+            if self.validator_cache:
+                cached = self.validator_cache.headers(url)
+                for name in ("ETag", "Last-Modified"):
+                    if name in resp.headers:
+                        cached[name] = resp.headers[name]
+                self.validator_cache.put(url, dest, cached)
+            return UNCHANGED, None
+
+        body_started = time.monotonic()
+        disk_time = 0.0  # Spent on file I/O, told apart from waiting on the network
+        chunks = resp.iter_chunks()
+        head = b""
+        digest = hashlib.sha256()
+        if resp.status == 206:
+            # Range honoured - must continue exactly where the .part file ends
+            content_range = partial.parse_content_range(resp.headers.get("Content-Range"))
+            if content_range is None or content_range[0] != offset:
+                partial.discard(dest)
+                raise PayloadError(
+                    f"unexpected Content-Range {resp.headers.get('Content-Range')!r} for offset {offset}"
+                )
+            mode = "ab"
+            # The digest covers the whole file, so take in what the .part already holds
+            with partial.part_path(dest).open("rb") as f:
+                for block in iter(lambda: f.read(READ_SIZE), b""):
+                    digest.update(block)
+            disk_time = time.monotonic() - body_started
+        else:
+            # Full body: stream to disk; only the leading bytes are held for validation
+            async for chunk in chunks:
+                head += chunk
+                if len(head) >= SNIFF_SIZE:
+                    break
+            if self.validate_pdf:
+                error = sniff_pdf_error(head)
+                if error:
+                    return CORRUPT, error
+            mode = "wb"
+
+        # Keep the .part file for a Range resume if the server supports one
+        resumable = partial.accepts_ranges(resp.headers) or resp.status == 206
+        if mode == "wb":
+            if resumable:
+                partial.remember_validator(dest, resp.headers)
+            else:
+                partial.validator_path(dest).unlink(missing_ok=True)
+        tmp_path = partial.part_path(dest)
+        written = len(head)
+        try:
+            with tmp_path.open(mode) as handle:
+                handle.write(head)
+                digest.update(head)
+                async for chunk in chunks:
+                    tick = time.monotonic()
+                    handle.write(chunk)
+                    disk_time += time.monotonic() - tick
+                    digest.update(chunk)
+                    written += len(chunk)
+        except BaseException:
+            if not resumable:
+                partial.discard(dest)
+            self._record_body(written, time.monotonic() - body_started - disk_time, disk_time)
+            raise
+        body_time = time.monotonic() - body_started - disk_time
+        total = partial.expected_total(resp.status, resp.headers)
+        size = tmp_path.stat().st_size
+        if total is not None and size != total:
+            if not resumable:
+                partial.discard(dest)
+            self._record_body(written, body_time, disk_time)
+            raise PayloadError(f"incomplete body: {size} of {total} bytes")
+        tick = time.monotonic()
+        partial.finish(dest)
+        hexdigest = digest.hexdigest()
+        if self.content_store:
+            self.content_store.store(dest, hexdigest)
+        self._record_body(written, body_time, disk_time + time.monotonic() - tick)
+        self._digests[dest] = hexdigest
+        if self.validator_cache:
+            self.validator_cache.put(url, dest, resp.headers)
+        return DOWNLOADED, None
@@ -0,0 +1,65 @@
+"""
+Request pacing: a token bucket per host.
+
+Each host has a `rate` of send slots per second and lets up to `burst`
+requests through back to back. Slots are handed out with GCRA (a virtual
+"theoretical arrival time" per host): a caller reserves its slot with a
+couple of arithmetic operations and then sleeps until it comes up, so no
+lock is held across the sleep and concurrent callers for one host get
+consecutive slots instead of queueing behind each other.
+"""
+import asyncio
+import random
+import time
+from typing import Dict, Optional
+
+from doj.urls import domain_of
+
+
+class HostRateLimiter:
+    """Paces requests to `rate` per second per host, allowing bursts of `burst`."""
+
+    def __init__(self, rate: float, burst: int = 1, jitter: float = 0.0):
+        """
+        jitter  spread each slot's length uniformly over interval * [1 - jitter, 1 + jitter]
+                so the spacing doesn't look mechanical; the mean rate is unchanged
+        """
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.jitter = min(1.0, max(0.0, jitter))
+        self.waited = 0.0  # Total seconds callers spent waiting for a slot
+        self._tat: Dict[str, float] = {}
+
+    @classmethod
+    def from_delays(cls, min_delay: float, max_delay: float, burst: int = 1) -> Optional["HostRateLimiter"]:
+        """Limiter spacing requests per host by min_delay..max_delay seconds (None if both are 0)."""
+        max_delay = max(min_delay, max_delay)
+        mean = (min_delay + max_delay) / 2
+        if mean <= 0:
+            return None
+        return cls(1 / mean, burst, jitter=(max_delay - min_delay) / (max_delay + min_delay))
+
+    def reserve(self, url: str) -> float:
+        """Claim the next send slot for url's host; returns seconds until it opens."""
+        host = domain_of(url)
+        now = time.monotonic()
+        interval = 1 / self.rate
+        if self.jitter:
+            interval *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        tat = self._claim(host, now, interval)
+        # The bucket holds `burst` slots: up to burst - 1 may be taken ahead of time
+        return max(0.0, tat - (self.burst - 1) / self.rate - now)
+
+    def _claim(self, host: str, now: float, interval: float) -> float:
+        """Advance host's theoretical arrival time by interval; returns the slot claimed."""
+        tat = max(self._tat.get(host, now), now)
+        self._tat[host] = tat + interval
+        return tat
+
+    async def wait(self, url: str) -> None:
+        delay = self.reserve(url)
+        if delay > 0:
+            self.waited += delay
+            await asyncio.sleep(delay)
@@ -0,0 +1,183 @@
+"""
+Per-request trace log: one JSON line per download attempt.
+
+    {"ts": 1760000000.12, "url": "https://.../EFTA00039025.pdf", "attempt": 1,
+     "status": 200, "outcome": "downloaded", "error": null, "retried": false,
+     "bytes": 183220, "total": 0.412,
+     "phases": {"throttle": 0.1, "limiter": 0.002, "dns": 0.004, "connect": 0.01,
+                "ttfb": 0.2, "body": 0.09, "disk": 0.001}}
+
+Phases (seconds; absent when they didn't happen):
+
+    block_wait  waiting out a global block pause (or a cookie refresh)
+    throttle    waiting for the per-host rate limiter
+    delay       random pre-request sleep
+    limiter     waiting for an adaptive concurrency slot
+    queued      waiting for a free connection in the aiohttp pool
+    dns         resolving the host (cache misses only)
+    connect     TCP and TLS set-up of a new connection
+    ttfb        request sent -> response headers, i.e. the server's share
+    body        receiving the body, minus disk time
+    disk        writing, renaming and linking the file
+    backoff     sleeping before the retry this attempt caused
+
+The record being built lives in a context variable, so the aiohttp trace
+hooks and the StorageWriter add to it without being handed it. Summarise a
+log with scripts/trace_report.py.
+"""
+import contextlib
+import json
+import time
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Dict, Optional
+
+import aiohttp
+
+from doj.metrics import BODY, CONNECT, DISK, TTFB
+
+BLOCK_WAIT = "block_wait"
+THROTTLE = "throttle"
+DELAY = "delay"
+LIMITER = "limiter"
+QUEUED = "queued"
+DNS = "dns"
+BACKOFF = "backoff"
+PHASES = (BLOCK_WAIT, THROTTLE, DELAY, LIMITER, QUEUED, DNS, CONNECT, TTFB, BODY, DISK, BACKOFF)
+
+
+class RequestTrace:
+    """Timings and result of one attempt, filled in as it happens."""
+
+    __slots__ = ("url", "attempt", "ts", "started", "status", "bytes", "phases")
+
+    def __init__(self, url: str, attempt: int):
+        self.url = url
+        self.attempt = attempt
+        self.ts = time.time()
+        self.started = time.monotonic()
+        self.status: Optional[int] = None
+        self.bytes = 0
+        self.phases: Dict[str, float] = {}
+
+    def add(self, phase: str, seconds: float) -> None:
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def to_dict(self, outcome: str, error: Optional[str], retried: bool) -> dict:
+        phases = dict(self.phases)
+        # The engine times the whole request up to the headers, and aiohttp's
+        # connection set-up (which includes DNS) happens inside it
+        setup = phases.get(QUEUED, 0.0) + phases.get(CONNECT, 0.0)
+        if TTFB in phases:
+            phases[TTFB] = max(0.0, phases[TTFB] - setup)
+        if CONNECT in phases:
+            phases[CONNECT] = max(0.0, phases[CONNECT] - phases.get(DNS, 0.0))
+        return {
+            "ts": round(self.ts, 3),
+            "url": self.url,
+            "attempt": self.attempt,
+            "status": self.status,
+            "outcome": outcome,
+            "error": error,
+            "retried": retried,
+            "bytes": self.bytes,
+            "total": round(time.monotonic() - self.started, 6),
+            "phases": {phase: round(seconds, 6) for phase, seconds in phases.items()},
+        }
+
+
+_current: ContextVar[Optional[RequestTrace]] = ContextVar("doj_request_trace", default=None)
+
+
+def current() -> Optional[RequestTrace]:
+    """The attempt being traced in this task, if any."""
+    return _current.get()
+
+
+def note(phase: str, seconds: float) -> None:
+    record = _current.get()
+    if record:
+        record.add(phase, seconds)
+
+
+def record_body(size: int, body_seconds: float, disk_seconds: float) -> None:
+    record = _current.get()
+    if record:
+        record.bytes += size
+        record.add(BODY, body_seconds)
+        record.add(DISK, disk_seconds)
+
+
+@contextlib.contextmanager
+def timed(phase: str):
+    """Add the time spent in the block to the current attempt's phase."""
+    if _current.get() is None:
+        yield
+        return
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        note(phase, time.monotonic() - started)
+
+
+class TraceLog:
+    """Appends one JSON line per finished attempt to a file."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.records = 0
+        # Line-buffered: each record reaches the file as it is written, so a crash keeps the tail
+        self._file = self.path.open("a", encoding="utf-8", buffering=1)
+
+    def __enter__(self) -> "TraceLog":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._file.close()
+
+    def begin(self, url: str, attempt: int) -> RequestTrace:
+        """Start tracing an attempt in the calling task."""
+        record = RequestTrace(url, attempt)
+        _current.set(record)
+        return record
+
+    def end(self, outcome: str, error: Optional[str] = None, retried: bool = False) -> None:
+        """Write the calling task's attempt, if one was begun."""
+        record = _current.get()
+        if record is None:
+            return
+        _current.set(None)
+        self._file.write(json.dumps(record.to_dict(outcome, error, retried)) + "\n")
+        self.records += 1
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        """aiohttp hooks timing pool waits, DNS and connection set-up."""
+        config = aiohttp.TraceConfig()
+        for phase, start, end in (
+            (QUEUED, config.on_connection_queued_start, config.on_connection_queued_end),
+            (DNS, config.on_dns_resolvehost_start, config.on_dns_resolvehost_end),
+            (CONNECT, config.on_connection_create_start, config.on_connection_create_end),
+        ):
+            start.append(_start_hook(phase))
+            end.append(_end_hook(phase))
+        return config
+
+
+def _start_hook(phase: str):
+    async def on_start(session, ctx, params) -> None:
+        setattr(ctx, f"{phase}_started", time.monotonic())
+
+    return on_start
+
+
+def _end_hook(phase: str):
+    async def on_end(session, ctx, params) -> None:
+        started = getattr(ctx, f"{phase}_started", None)
+        if started is not None:
+            note(phase, time.monotonic() - started)
+
+    return on_end
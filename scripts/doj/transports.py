@@ -0,0 +1,355 @@
+"""
+Ways of fetching a URL, behind one interface the download engine drives.
+
+    aiohttp   plain HTTP client; streams bodies, supports Range/conditional GET
+    request   Playwright APIRequestContext; shares a browser context's cookies
+    tab       real browser tabs navigating to each PDF (slowest, hardest to block)
+
+Every transport yields a Response with status, headers and the body as an
+async iterator of chunks, so the engine and storage writer don't care which
+one produced it.
+"""
+import asyncio
+import base64
+import contextlib
+from typing import AsyncIterator, Callable, Dict, List, Mapping, Optional
+
+import aiohttp
+
+from doj.storage import PDF_MAGIC
+
+CHUNK_SIZE = 1024 * 256
+BASE64_CHUNK = 0x8000  # Bytes per base64 chunk in the in-page fetch fallback
+
+
+class Blocked(Exception):
+    """The site (or its CDN) refused the request; all workers should pause."""
+
+
+class TransportError(Exception):
+    """A fetch failed in a way worth retrying (captcha page, empty body, ...)."""
+
+
+class Headers(dict):
+    """Case-insensitive header mapping (Playwright reports lower-cased names)."""
+
+    def __init__(self, headers: Optional[Mapping[str, str]] = None):
+        super().__init__((k.lower(), v) for k, v in (headers or {}).items())
+
+    def __getitem__(self, key: str) -> str:
+        return super().__getitem__(key.lower())
+
+    def __contains__(self, key: object) -> bool:
+        return isinstance(key, str) and super().__contains__(key.lower())
+
+    def get(self, key: str, default=None):
+        return super().get(key.lower(), default)
+
+
+class Response:
+    """Status, headers and body of one fetch, whatever the transport."""
+
+    def __init__(
+        self,
+        status: int,
+        headers: Mapping[str, str],
+        url: str,
+        body: Optional[bytes] = None,
+        stream: Optional[AsyncIterator[bytes]] = None,
+    ):
+        self.status = status
+        self.headers = headers
+        self.url = url
+        self._body = body
+        self._stream = stream
+
+    async def iter_chunks(self) -> AsyncIterator[bytes]:
+        if self._stream is not None:
+            async for chunk in self._stream:
+                yield chunk
+        elif self._body:
+            yield self._body
+
+
+class Transport:
+    """Base class; use as `async with transport:` around a run."""
+
+    name = "base"
+    supports_headers = True  # Range / conditional request headers are honoured
+
+    async def start(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    async def __aenter__(self) -> "Transport":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    def get(self, url: str, headers: Optional[Dict[str, str]] = None):
+        """Async context manager yielding a Response."""
+        raise NotImplementedError
+
+    async def head(self, url: str) -> Optional[Mapping[str, str]]:
+        """Response headers of a HEAD request, or None if unsupported/failed."""
+        return None
+
+
+class AiohttpTransport(Transport):
+    name = "aiohttp"
+
+    def __init__(
+        self,
+        concurrency: int,
+        timeout: float,
+        cookies: Optional[Dict[str, str]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        header_factory: Optional[Callable[[], Dict[str, str]]] = None,
+        limit_per_host: int = 0,
+        connect_timeout: Optional[float] = None,
+        trace_configs: Optional[List[aiohttp.TraceConfig]] = None,
+    ):
+        self.concurrency = concurrency
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=connect_timeout)
+        self.cookies = cookies or {}
+        self.headers = headers
+        self.header_factory = header_factory
+        self.limit_per_host = limit_per_host
+        self.trace_configs = trace_configs
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    async def start(self) -> None:
+        connector = aiohttp.TCPConnector(
+            limit=self.concurrency,
+            limit_per_host=self.limit_per_host,
+            ttl_dns_cache=600,
+            enable_cleanup_closed=True,
+        )
+        # unsafe=True allows cookies for IP addresses (local mirrors, tests)
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            cookie_jar=aiohttp.CookieJar(unsafe=True),
+            headers=self.headers,
+            timeout=self.timeout,
+            trace_configs=self.trace_configs,
+        )
+        if self.cookies:
+            self.update_cookies(self.cookies)
+
+    async def close(self) -> None:
+        if self.session:
+            await self.session.close()
+
+    def update_cookies(self, cookies: Dict[str, str]) -> None:
+        """Cookies without a domain are sent to every host."""
+        self.session.cookie_jar.update_cookies(cookies)
+
+    def _request_headers(self, headers: Optional[Dict[str, str]]) -> Dict[str, str]:
+        request_headers = self.header_factory() if self.header_factory else {}
+        if headers:
+            request_headers.update(headers)
+        return request_headers
+
+    @contextlib.asynccontextmanager
+    async def get(self, url: str, headers: Optional[Dict[str, str]] = None):
+        async with self.session.get(url, headers=self._request_headers(headers)) as resp:
+            yield Response(
+                resp.status, resp.headers, str(resp.url), stream=resp.content.iter_chunked(CHUNK_SIZE)
+            )
+
+    async def head(self, url: str) -> Optional[Mapping[str, str]]:
+        try:
+            async with self.session.head(url, allow_redirects=True, headers=self._request_headers(None)) as resp:
+                if resp.status >= 400:
+                    return None
+                return dict(resp.headers)
+        except Exception:
+            return None
+
+
+class PlaywrightRequestTransport(Transport):
+    """Playwright's APIRequestContext: browser cookies, binary bodies, no tab."""
+
+    name = "request"
+
+    def __init__(self, request_context, timeout_ms: float):
+        self.request = request_context
+        self.timeout_ms = timeout_ms
+
+    @contextlib.asynccontextmanager
+    async def get(self, url: str, headers: Optional[Dict[str, str]] = None):
+        resp = await self.request.get(url, headers=headers, timeout=self.timeout_ms, fail_on_status_code=False)
+        try:
+            body = await resp.body()
+            yield Response(resp.status, Headers(resp.headers), resp.url, body=body)
+        finally:
+            await resp.dispose()
+
+    async def head(self, url: str) -> Optional[Mapping[str, str]]:
+        try:
+            resp = await self.request.head(url, timeout=self.timeout_ms, fail_on_status_code=False)
+        except Exception:
+            return None
+        try:
+            return None if resp.status >= 400 else Headers(resp.headers)
+        finally:
+            await resp.dispose()
+
+
+async def handle_verification(page) -> bool:
+    """Handle CAPTCHA and age verification. Returns True if handled."""
+    handled = False
+
+    try:
+        # Check for CAPTCHA
+        captcha_button = page.get_by_role("button", name="I am not a robot")
+        if await captcha_button.count() > 0:
+            print("\n[CAPTCHA] Detected - clicking...")
+            await captcha_button.click()
+            await page.wait_for_load_state("networkidle", timeout=10000)
+            handled = True
+
+            # Check if manual intervention needed
+            if await captcha_button.count() > 0:
+                print("[CAPTCHA] Manual intervention required. Solve and press Enter...")
+                await asyncio.get_event_loop().run_in_executor(None, input)
+    except Exception:
+        pass
+
+    try:
+        # Check for age verification
+        age_button = page.get_by_role("button", name="I am over 18")
+        if await age_button.count() > 0:
+            print("\n[AGE] Clicking age verification...")
+            await age_button.click()
+            await page.wait_for_load_state("networkidle", timeout=10000)
+            handled = True
+    except Exception:
+        pass
+
+    return handled
+
+
+async def fetch_pdf_bytes(page, url: str, timeout_ms: float) -> Optional[bytes]:
+    """Fetch url as raw bytes, sharing the browser context's cookies.
+
+    Uses Playwright's APIRequestContext so the body arrives as binary instead of
+    being serialized over CDP as a JSON array of numbers. Falls back to an
+    in-page fetch returned as base64 chunks if the API request fails.
+    """
+    try:
+        response = await page.context.request.get(url, timeout=timeout_ms)
+        if response.ok:
+            return await response.body()
+    except Exception:
+        pass
+
+    chunks = await page.evaluate(
+        """
+        async ([url, chunkSize]) => {
+            try {
+                const response = await fetch(url);
+                const bytes = new Uint8Array(await response.arrayBuffer());
+                const chunks = [];
+                for (let i = 0; i < bytes.length; i += chunkSize) {
+                    chunks.push(btoa(String.fromCharCode.apply(null, bytes.subarray(i, i + chunkSize))));
+                }
+                return chunks;
+            } catch (e) {
+                return null;
+            }
+        }
+        """,
+        [url, BASE64_CHUNK],
+    )
+    if not chunks:
+        return None
+    return b"".join(base64.b64decode(chunk) for chunk in chunks)
+
+
+class PlaywrightTabTransport(Transport):
+    """A pool of browser tabs; each fetch navigates one tab to the URL."""
+
+    name = "tab"
+    supports_headers = False  # Navigations can't carry Range/conditional headers
+
+    def __init__(self, context, tabs: int, timeout_ms: float):
+        self.context = context
+        self.tabs = tabs
+        self.timeout_ms = timeout_ms
+        self._pages: List = []
+        self._idle: asyncio.Queue = asyncio.Queue()
+
+    async def start(self) -> None:
+        for _ in range(self.tabs):
+            page = await self.context.new_page()
+            self._pages.append(page)
+            self._idle.put_nowait(page)
+            await asyncio.sleep(0.5)  # Stagger tab creation
+
+    async def close(self) -> None:
+        for page in self._pages:
+            await page.close()
+
+    @contextlib.asynccontextmanager
+    async def get(self, url: str, headers: Optional[Dict[str, str]] = None):
+        page = await self._idle.get()
+        try:
+            yield await self._navigate(page, url)
+        finally:
+            self._idle.put_nowait(page)
+
+    async def _navigate(self, page, url: str) -> Response:
+        try:
+            # Returning at "commit" means the PDF viewer isn't waited on; the
+            # body is read from the navigation response itself
+            response = await page.goto(url, wait_until="commit", timeout=self.timeout_ms)
+
+            # Check for verification pages
+            if response and ("age-verify" in page.url or "queue" in page.url.lower()):
+                await page.wait_for_load_state("load", timeout=self.timeout_ms)
+                if await handle_verification(page):
+                    response = await page.goto(url, wait_until="commit", timeout=self.timeout_ms)
+        except Exception as exc:
+            if "net::ERR" in str(exc):
+                raise Blocked(f"Network error: {str(exc)[:100]}") from exc
+            raise
+        if not response:
+            raise TransportError("No response")
+
+        headers = Headers(response.headers)
+        content = ""
+        if response.status == 200 and "application/pdf" in headers.get("content-type", "").lower():
+            # Single fetch: reuse the navigation's body instead of requesting the URL again
+            try:
+                body = await response.body()
+            except Exception:
+                body = None  # Body not retained (e.g. handed to the PDF viewer)
+            if body:
+                return Response(response.status, headers, page.url, body=body)
+        else:
+            # Only non-PDF responses need the rendered page inspected
+            await page.wait_for_load_state("load", timeout=self.timeout_ms)
+            content = await page.content()
+            if "Access Denied" in content or "SERVE_404" in content:
+                raise Blocked("Access Denied by CDN")
+            if response.status == 404 and len(content) < 1000:
+                raise Blocked("404 rate limit")
+            if response.status != 200:
+                return Response(response.status, headers, page.url, body=content.encode("utf-8"))
+
+        # Second request only when the navigation body wasn't usable
+        body = await fetch_pdf_bytes(page, page.url, self.timeout_ms)
+        if not body:
+            if "captcha" in content.lower() or "robot" in content.lower():
+                await handle_verification(page)
+                raise TransportError("CAPTCHA page")
+            raise TransportError("Could not fetch PDF data")
+        if not body.startswith(PDF_MAGIC) and b"Access Denied" in body:
+            raise Blocked("Access Denied in PDF response")
+        # The navigation's headers describe a different body
+        return Response(200, Headers(), page.url, body=body)
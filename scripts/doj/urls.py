@@ -0,0 +1,79 @@
+"""URL list reading and URL -> filename mapping."""
+import itertools
+import os
+import re
+import sys
+import zlib
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from doj.linefile import LineFile
+from doj.urlset import UrlSet
+
+
+def iter_urls(
+    path: Path,
+    deduplicate: bool = True,
+    shard: Optional[Tuple[int, int]] = None,
+    partition: Optional[Tuple[int, int]] = None,
+) -> Iterator[str]:
+    """Yield URLs from file lazily, optionally deduplicating while preserving order.
+
+    shard (index, count) limits it to that contiguous share of the lines,
+    read straight from the mapped file. partition (index, count) instead
+    keeps the URLs that partition_of() puts in share index: every line is
+    read, but a URL listed twice can't end up in two shares.
+    """
+    seen = UrlSet()
+    duplicates = 0
+    with LineFile(path) as lines:
+        span = lines.shard(*shard) if shard else range(len(lines))
+        for line in lines.iter_lines(span.start, span.stop):
+            if partition and partition_of(line, partition[1]) != partition[0]:
+                continue
+            if deduplicate and not seen.add(line):
+                duplicates += 1
+                continue
+            yield line
+    if deduplicate and duplicates > 0:
+        print(f"Removed {duplicates} duplicate URLs from input", file=sys.stderr)
+
+
+def read_urls(path: Path, deduplicate: bool = True) -> List[str]:
+    """Read URLs from file, optionally deduplicating while preserving order."""
+    return list(iter_urls(path, deduplicate))
+
+
+def peek(urls: Iterable[str]) -> Optional[Iterator[str]]:
+    """None if urls is empty, else an iterator over all of it (first item included)."""
+    iterator = iter(urls)
+    for first in iterator:
+        return itertools.chain((first,), iterator)
+    return None
+
+
+def sanitize_filename(name: str) -> str:
+    name = name.strip()
+    name = re.sub(r"[^A-Za-z0-9._-]+", "_", name)
+    return name or "downloaded.pdf"
+
+
+def filename_from_url(url: str) -> str:
+    parsed = urlparse(url)
+    base = os.path.basename(parsed.path)
+    if not base:
+        return "downloaded.pdf"
+    base = sanitize_filename(base)
+    if "." not in base:
+        base += ".pdf"
+    return base
+
+
+def partition_of(url: str, count: int) -> int:
+    """Which of count shares url belongs to, by its filename: the same file never goes to two workers."""
+    return zlib.crc32(filename_from_url(url).encode("utf-8")) % count
+
+
+def domain_of(url: str) -> str:
+    return urlparse(url).netloc
@@ -0,0 +1,127 @@
+"""
+A compact set of URLs, for de-duplicating link lists.
+
+Nearly every URL is a shared prefix, a zero-padded number and a suffix:
+
+    https://www.justice.gov/epstein/files/DataSet%209/EFTA00039025.pdf
+    '------------------- prefix ----------------------''number''suf'
+
+Each distinct (prefix, digit count, suffix) template is stored once, and a
+URL becomes an integer key: template id in the high bits, number in the low
+ones. Keys are kept as bits in bitmaps of BLOCK_SIZE consecutive numbers,
+created as numbers in their range show up. EFTA numbers are dense, so a
+URL costs little more than one bit (a Python set of str costs over 150
+bytes per URL) and a lookup is a dict get and a bit test. URLs without a
+trailing number, or with one too large to pack, are kept as plain strings.
+"""
+import re
+from collections.abc import Set as AbstractSet
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+NUMBER_BITS = 40  # Up to 12 digits; the rest of the key numbers the template
+BLOCK_BITS = 12
+BLOCK_SIZE = 1 << BLOCK_BITS  # Numbers per bitmap (512 bytes)
+OFFSET_MASK = BLOCK_SIZE - 1
+MAX_TEMPLATES = 1 << 20
+
+# Last run of ASCII digits and whatever follows it
+NUMBERED_RE = re.compile(r"(.*?)([0-9]+)([^0-9]*)", re.DOTALL)
+
+Template = Tuple[str, int, str]  # (prefix, digit count, suffix)
+
+
+class UrlSet(AbstractSet):
+    """Exact set of URL strings, stored as bits in numbered blocks where possible."""
+
+    def __init__(self, urls: Iterable[str] = ()):
+        self._templates: List[Template] = []
+        self._template_ids: Dict[Template, int] = {}
+        # (prefix, suffix, URL length, digits start, digits end, key base) of the last template matched
+        self._last: Optional[Tuple[str, str, int, int, int, int]] = None
+        self._blocks: Dict[int, bytearray] = {}
+        self._count = 0  # URLs stored as bits
+        self._other: Set[str] = set()
+        for url in urls:
+            self.add(url)
+
+    def _key(self, url: str, create: bool = False) -> Optional[int]:
+        """url's packed key, or None if it has to be stored as a string."""
+        last = self._last
+        # Fast path: consecutive URLs nearly always share a template
+        if last and len(url) == last[2] and url.startswith(last[0]) and url.endswith(last[1]):
+            digits = url[last[3]:last[4]]
+            if digits.isdigit() and digits.isascii():
+                number = int(digits)
+                if not number >> NUMBER_BITS:
+                    return last[5] | number
+                return None  # Too large to pack; the slow path would say the same
+
+        match = NUMBERED_RE.fullmatch(url)
+        if not match:
+            return None
+        prefix, digits, suffix = match.groups()
+        number = int(digits)
+        if number >> NUMBER_BITS:
+            return None
+        template = (prefix, len(digits), suffix)
+        template_id = self._template_ids.get(template)
+        if template_id is None:
+            if not create or len(self._templates) >= MAX_TEMPLATES:
+                return None
+            template_id = len(self._templates)
+            self._templates.append(template)
+            self._template_ids[template] = template_id
+        base = template_id << NUMBER_BITS
+        self._last = (prefix, suffix, len(url), len(prefix), len(prefix) + len(digits), base)
+        return base | number
+
+    def __contains__(self, url: object) -> bool:
+        if not isinstance(url, str):
+            return False
+        key = self._key(url)
+        if key is None:
+            return url in self._other
+        block = self._blocks.get(key >> BLOCK_BITS)
+        offset = key & OFFSET_MASK
+        return block is not None and bool(block[offset >> 3] & (1 << (offset & 7)))
+
+    def add(self, url: str) -> bool:
+        """Add url; returns False if it was already present."""
+        key = self._key(url, create=True)
+        if key is None:
+            if url in self._other:
+                return False
+            self._other.add(url)
+            return True
+        block = self._blocks.get(key >> BLOCK_BITS)
+        if block is None:
+            block = self._blocks[key >> BLOCK_BITS] = bytearray(BLOCK_SIZE // 8)
+        offset = key & OFFSET_MASK
+        bit = 1 << (offset & 7)
+        if block[offset >> 3] & bit:
+            return False
+        block[offset >> 3] |= bit
+        self._count += 1
+        return True
+
+    def update(self, urls: Iterable[str]) -> None:
+        for url in urls:
+            self.add(url)
+
+    def __len__(self) -> int:
+        return self._count + len(self._other)
+
+    def __iter__(self) -> Iterator[str]:
+        """URLs grouped by template, in numeric order within each, then the rest."""
+        mask = (1 << NUMBER_BITS) - 1
+        for block_id in sorted(self._blocks):
+            block = self._blocks[block_id]
+            first = block_id << BLOCK_BITS
+            prefix, width, suffix = self._templates[first >> NUMBER_BITS]
+            for index, byte in enumerate(block):
+                if not byte:
+                    continue
+                for bit in range(8):
+                    if byte >> bit & 1:
+                        yield f"{prefix}{(first + index * 8 + bit) & mask:0{width}d}{suffix}"
+        yield from self._other
@@ -0,0 +1,156 @@
+"""
+Persistent cache of HTTP validators seen when a file was downloaded.
+
+Stores Content-Length, ETag and Last-Modified per URL together with the
+size and mtime of the file written, so a resume can confirm a file is
+complete with a local stat() instead of a HEAD request.
+"""
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, List, Mapping, NamedTuple, Optional, Tuple
+
+CACHE_NAME = ".validators.sqlite3"  # Kept inside the output directory
+WRITE_BATCH = 500
+REVALIDATE_AFTER = 30 * 24 * 3600  # Seconds before a cached entry is re-checked
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS validators (
+    url TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    content_length INTEGER,
+    etag TEXT,
+    last_modified TEXT,
+    checked_at REAL NOT NULL
+);
+"""
+
+
+class Validators(NamedTuple):
+    size: int
+    mtime: float
+    content_length: Optional[int]
+    etag: Optional[str]
+    last_modified: Optional[str]
+    checked_at: float
+
+
+def parse_content_length(headers: Mapping[str, str]) -> Optional[int]:
+    value = headers.get("Content-Length")
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+def conditional_headers(entry: Validators) -> Dict[str, str]:
+    """Request headers that turn a GET into a revalidation."""
+    headers: Dict[str, str] = {}
+    if entry.etag:
+        headers["If-None-Match"] = entry.etag
+    if entry.last_modified:
+        headers["If-Modified-Since"] = entry.last_modified
+    return headers
+
+
+class ValidatorCache:
+    """URL -> validators store with batched writes."""
+
+    def __init__(
+        self,
+        path: Path,
+        revalidate_after: float = REVALIDATE_AFTER,
+        write_batch: int = WRITE_BATCH,
+    ):
+        self.path = Path(path)
+        self.revalidate_after = revalidate_after
+        self.write_batch = write_batch
+        self.conn = sqlite3.connect(str(self.path))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._pending: Dict[str, Tuple] = {}
+
+    def __enter__(self) -> "ValidatorCache":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.flush()
+        self.conn.close()
+
+    def get(self, url: str) -> Optional[Validators]:
+        row = self._pending.get(url)
+        if row is None:
+            row = self.conn.execute(
+                "SELECT size, mtime, content_length, etag, last_modified, checked_at "
+                "FROM validators WHERE url = ?",
+                (url,),
+            ).fetchone()
+        return Validators(*row) if row else None
+
+    def headers(self, url: str) -> Dict[str, str]:
+        """Cached validators as response-style headers."""
+        entry = self.get(url)
+        headers: Dict[str, str] = {}
+        if entry is None:
+            return headers
+        if entry.content_length is not None:
+            headers["Content-Length"] = str(entry.content_length)
+        if entry.etag:
+            headers["ETag"] = entry.etag
+        if entry.last_modified:
+            headers["Last-Modified"] = entry.last_modified
+        return headers
+
+    def is_fresh(self, url: str, dest: Path) -> bool:
+        """True if dest matches what was recorded and the entry isn't stale."""
+        entry = self.get(url)
+        if entry is None:
+            return False
+        try:
+            stat = dest.stat()
+        except OSError:
+            return False
+        if stat.st_size != entry.size or stat.st_mtime != entry.mtime:
+            return False
+        if entry.content_length is not None and entry.content_length != entry.size:
+            return False
+        if self.revalidate_after and time.time() - entry.checked_at > self.revalidate_after:
+            return False
+        return True
+
+    def put(self, url: str, dest: Path, headers: Optional[Mapping[str, str]] = None) -> None:
+        """Record dest's current size/mtime and the response validators."""
+        stat = dest.stat()
+        headers = headers or {}
+        # A compressed transfer's Content-Length says nothing about the file on disk
+        content_length = None if headers.get("Content-Encoding") else parse_content_length(headers)
+        self._pending[url] = (
+            stat.st_size,
+            stat.st_mtime,
+            content_length,
+            headers.get("ETag"),
+            headers.get("Last-Modified"),
+            time.time(),
+        )
+        if len(self._pending) >= self.write_batch:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+        rows: List[Tuple] = [(url, *values) for url, values in self._pending.items()]
+        self._pending = {}
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO validators "
+                "(url, size, mtime, content_length, etag, last_modified, checked_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
@@ -0,0 +1,255 @@
+"""
+Integrity checks for the downloaded corpus.
+
+A quick check reads only the first and last KiB of each file:
+
+    header    starts with %PDF (HTML error pages saved as .pdf fail here)
+    trailer   %%EOF within the last TRAILER_WINDOW bytes (truncated files fail)
+    xref      startxref points inside the file at an xref table or stream
+
+A full check additionally parses the document with pypdf, if installed.
+Results are cached in `<out_dir>/.verify.sqlite3` keyed by each file's
+(inode, size, mtime), so later runs only re-check files that changed.
+"""
+import os
+import re
+import sqlite3
+import time
+from concurrent.futures import FIRST_COMPLETED, Executor, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from doj.layout import Layout
+from doj.storage import sniff_pdf_error
+
+try:
+    import pypdf
+except ImportError:
+    pypdf = None
+
+CACHE_NAME = ".verify.sqlite3"  # Kept inside the output directory
+WRITE_BATCH = 1000
+HEAD_SIZE = 1024
+TRAILER_WINDOW = 1024  # %%EOF must appear within this many bytes of the end
+XREF_PROBE = 64  # Bytes read around the startxref offset
+DEFAULT_WORKERS = min(32, (os.cpu_count() or 1) * 4)  # Quick checks are I/O bound
+BATCH_SIZE = 64  # Files per task handed to the pool
+BATCHES_PER_WORKER = 2  # Tasks queued per worker, so the file list is never held in full
+
+STARTXREF_RE = re.compile(rb"startxref\s+(\d+)")
+XREF_RE = re.compile(rb"xref|\d+\s+\d+\s+obj")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checks (
+    path TEXT PRIMARY KEY,
+    inode INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    full INTEGER NOT NULL,
+    error TEXT,
+    checked_at REAL NOT NULL
+);
+"""
+
+
+class Check(NamedTuple):
+    inode: int
+    size: int
+    mtime_ns: int
+    full: bool
+    error: Optional[str]
+
+
+def check_pdf(path: Path, full: bool = False) -> Optional[str]:
+    """Return why path isn't a complete PDF, or None if it looks fine."""
+    with path.open("rb") as f:
+        head = f.read(HEAD_SIZE)
+        error = sniff_pdf_error(head)
+        if error:
+            return error
+        size = f.seek(0, os.SEEK_END)
+        f.seek(max(0, size - TRAILER_WINDOW))
+        tail = f.read()
+        if b"%%EOF" not in tail:
+            return "missing %%EOF trailer (truncated?)"
+        pos = tail.rfind(b"startxref")
+        match = STARTXREF_RE.match(tail, pos) if pos >= 0 else None
+        if not match:
+            return "missing startxref"
+        offset = int(match.group(1))
+        if offset >= size:
+            return f"startxref {offset} points past the end of the file ({size} bytes)"
+        # Allow for writers whose offsets are a few bytes off, as readers do
+        f.seek(max(0, offset - XREF_PROBE // 4))
+        if not XREF_RE.search(f.read(XREF_PROBE)):
+            return f"no xref table or stream at offset {offset}"
+    if full:
+        try:
+            reader = pypdf.PdfReader(str(path), strict=False)
+            for page in reader.pages:
+                page.get_contents()
+        except Exception as exc:
+            return f"parse error: {type(exc).__name__}: {exc}"
+    return None
+
+
+def _check_file(path: Path, cached: Optional[Check], full: bool) -> Tuple[Path, Optional[Check], bool]:
+    """Check one file unless its cached result still applies. Returns (path, result, from_cache)."""
+    try:
+        stat = path.stat()
+    except OSError:
+        return path, None, False  # Deleted while we were scanning
+    if (
+        cached
+        and (cached.inode, cached.size, cached.mtime_ns) == (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        and (cached.full or not full)
+    ):
+        return path, cached, True
+    try:
+        error = check_pdf(path, full)
+    except OSError as exc:
+        error = f"unreadable: {exc}"
+    return path, Check(stat.st_ino, stat.st_size, stat.st_mtime_ns, full, error), False
+
+
+def _check_batch(
+    batch: List[Tuple[Path, Optional[Check]]], full: bool
+) -> List[Tuple[Path, Optional[Check], bool]]:
+    return [_check_file(path, cached, full) for path, cached in batch]
+
+
+class VerifyCache:
+    """Relative path -> last check result, with batched writes."""
+
+    def __init__(self, path: Path, write_batch: int = WRITE_BATCH):
+        self.path = Path(path)
+        self.write_batch = write_batch
+        self.conn = sqlite3.connect(str(self.path))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._pending: List[Tuple] = []
+
+    def __enter__(self) -> "VerifyCache":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.flush()
+        self.conn.close()
+
+    def load(self) -> Dict[str, Check]:
+        rows = self.conn.execute("SELECT path, inode, size, mtime_ns, full, error FROM checks")
+        return {path: Check(inode, size, mtime_ns, bool(full), error) for path, inode, size, mtime_ns, full, error in rows}
+
+    def put(self, path: str, check: Check) -> None:
+        self._pending.append((path, check.inode, check.size, check.mtime_ns, int(check.full), check.error, time.time()))
+        if len(self._pending) >= self.write_batch:
+            self.flush()
+
+    def forget(self, paths: List[str]) -> None:
+        self.flush()
+        with self.conn:
+            self.conn.executemany("DELETE FROM checks WHERE path = ?", [(path,) for path in paths])
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+        rows, self._pending = self._pending, []
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO checks (path, inode, size, mtime_ns, full, error, checked_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+
+class VerifyStats:
+    """Counters and throughput for one verify run."""
+
+    def __init__(self):
+        self.files = 0
+        self.checked = 0  # Actually read this run
+        self.cached = 0  # Unchanged since an earlier run
+        self.bad = 0
+        self.bytes_checked = 0
+        self.start_time = time.monotonic()
+
+    def report(self) -> str:
+        elapsed = max(0.001, time.monotonic() - self.start_time)
+        return (
+            f"Verified {self.files} files in {elapsed:.1f}s ({self.files / elapsed:.0f} files/s): "
+            f"{self.checked} checked ({self.bytes_checked / 1e6 / elapsed:.1f} MB/s of PDFs), "
+            f"{self.cached} unchanged since last run, {self.bad} bad"
+        )
+
+
+def verify_corpus(
+    out_dir: Path,
+    full: bool = False,
+    workers: int = DEFAULT_WORKERS,
+    use_cache: bool = True,
+    stats: Optional[VerifyStats] = None,
+) -> Iterator[Tuple[Path, str]]:
+    """Yield (path, error) for every PDF under out_dir that fails the checks.
+
+    Quick checks run on a thread pool; full parses are CPU bound and run
+    on a process pool instead.
+    """
+    if full and pypdf is None:
+        raise RuntimeError("Full verification needs pypdf (pip install pypdf)")
+    out_dir = Path(out_dir)
+    stats = stats if stats is not None else VerifyStats()
+    cache = VerifyCache(out_dir / CACHE_NAME) if use_cache else None
+    known = cache.load() if cache else {}
+    seen = set()
+
+    def jobs():
+        for path in Layout.load(out_dir).iter_files(".pdf"):
+            key = os.path.relpath(path, out_dir)
+            seen.add(key)
+            yield path, known.get(key)
+
+    executor: Executor
+    if full:
+        workers = min(workers, os.cpu_count() or 1)
+        executor = ProcessPoolExecutor(max_workers=workers)
+    else:
+        executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        with executor:
+            pending = jobs()
+            in_flight = set()
+            while True:
+                while len(in_flight) < workers * BATCHES_PER_WORKER:
+                    batch = list(islice(pending, BATCH_SIZE))
+                    if not batch:
+                        break
+                    in_flight.add(executor.submit(_check_batch, batch, full))
+                if not in_flight:
+                    break
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for path, check, from_cache in future.result():
+                        if check is None:
+                            continue
+                        stats.files += 1
+                        if from_cache:
+                            stats.cached += 1
+                        else:
+                            stats.checked += 1
+                            stats.bytes_checked += check.size
+                            if cache:
+                                cache.put(os.path.relpath(path, out_dir), check)
+                        if check.error:
+                            stats.bad += 1
+                            yield path, check.error
+        if cache:
+            # Drop entries for files that are gone
+            cache.forget([key for key in known if key not in seen])
+    finally:
+        if cache:
+            cache.close()
@@ -0,0 +1,229 @@
+"""
+Running one download over several processes.
+
+A single asyncio loop does hashing, PDF checks, file writes and progress
+output on one core between network events. With --workers N a supervisor
+starts N processes, each with its own event loop, session and Engine over
+its share of the pending URLs, and keeps what must stay global in one place:
+
+    SharedHostRateLimiter  per-host send slots in shared memory: N workers
+                           together stay within --rate / the request delays
+    SharedBlockState       one block pause, started by whichever worker is
+                           refused first and honoured by all of them
+    RemoteState            workers send every result over a queue; only the
+                           supervisor writes the manifest and failed list,
+                           and it renders the one progress line
+
+time.monotonic() is a system-wide clock, so deadlines kept in shared memory
+mean the same thing in every process.
+"""
+import multiprocessing
+import queue
+import sys
+import time
+import zlib
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+from doj import manifest as mf
+from doj.blocking import BlockState
+from doj.engine import PROGRESS_INTERVAL, Stats
+from doj.state import StateStore
+from doj.throttle import HostRateLimiter
+
+HOST_SLOTS = 64  # Shared rate-limiter buckets; hosts hashing to one share it
+JOIN_TIMEOUT = 10.0  # Seconds to wait for workers after Ctrl+C before killing them
+
+# Result messages: (kind, url, filename, size, sha256, error)
+DOWNLOADED = "downloaded"
+SKIPPED = "skipped"
+# Sent once by each worker when it is done: (WORKER_DONE, index, counters)
+WORKER_DONE = "worker-done"
+
+
+class SharedHostRateLimiter(HostRateLimiter):
+    """HostRateLimiter whose slot times live in shared memory, one budget for all processes."""
+
+    def __init__(self, rate: float, burst: int = 1, jitter: float = 0.0):
+        super().__init__(rate, burst, jitter)
+        self._shared = multiprocessing.Array("d", HOST_SLOTS)
+
+    def _claim(self, host: str, now: float, interval: float) -> float:
+        slot = zlib.crc32(host.encode("utf-8")) % HOST_SLOTS
+        with self._shared.get_lock():
+            tat = max(self._shared[slot], now)
+            self._shared[slot] = tat + interval
+        return tat
+
+
+class SharedBlockState(BlockState):
+    """BlockState whose pause deadline and block count are shared between processes."""
+
+    def __init__(self, pause: float):
+        self._until = multiprocessing.Value("d", 0.0)
+        self._blocks = multiprocessing.Value("i", 0)
+        super().__init__(pause)
+
+    @property
+    def blocked_until(self) -> float:
+        return self._until.value
+
+    @blocked_until.setter
+    def blocked_until(self, value: float) -> None:
+        self._until.value = value
+
+    @property
+    def blocks(self) -> int:
+        return self._blocks.value
+
+    @blocks.setter
+    def blocks(self, value: int) -> None:
+        self._blocks.value = value
+
+    def trigger(self, reason: str = "") -> bool:
+        # Two workers refused at once must still start only one pause
+        with self._until.get_lock():
+            return super().trigger(reason)
+
+
+def record_result(state: StateStore, stats: Stats, message: Tuple) -> None:
+    """Count a result message sent by RemoteState and record it in state."""
+    kind, url, filename, size, sha256, error = message
+    if kind == DOWNLOADED:
+        stats.downloaded += 1
+        state.downloaded(url, filename, size, sha256)
+    elif kind == SKIPPED:
+        stats.skipped += 1
+        state.skipped(url, filename, size)
+    else:
+        if kind == mf.CORRUPT:
+            stats.corrupt += 1
+        else:
+            stats.failed += 1
+        state.failed(url, kind, error)
+
+
+class RemoteState(StateStore):
+    """A worker's StateStore: forwards every result to the supervisor.
+
+    results is anything with put(): a multiprocessing queue, or a lease's buffer.
+    """
+
+    def __init__(self, results: Any):
+        super().__init__()
+        self.results = results
+
+    def downloaded(
+        self, url: str, filename: str, size: Optional[int] = None, sha256: Optional[str] = None
+    ) -> None:
+        self.results.put((DOWNLOADED, url, filename, size, sha256, None))
+
+    def skipped(self, url: str, filename: str, size: Optional[int] = None) -> None:
+        self.results.put((SKIPPED, url, filename, size, None, None))
+
+    def failed(self, url: str, status: str = mf.FAILED, error: Optional[str] = None) -> None:
+        self.results.put((status, url, None, None, None, error))
+
+
+class Supervisor:
+    """Starts worker processes, records their results and reports progress."""
+
+    def __init__(
+        self,
+        state: StateStore,
+        workers: int,
+        block_state: Optional[BlockState] = None,
+        show_progress: bool = True,
+    ):
+        self.state = state
+        self.workers = max(1, workers)
+        self.block_state = block_state
+        self.show_progress = show_progress
+        self.stats = Stats()
+        self.counters: Dict[str, int] = {}  # Summed from the workers' final reports
+        self.results: multiprocessing.Queue = multiprocessing.Queue()
+
+    def run(self, target: Callable[..., None], args: Sequence[Any] = ()) -> Stats:
+        """Run target(index, count, results, *args) in each worker; returns the combined Stats.
+
+        target must send (WORKER_DONE, index, counters) last, even on error.
+        """
+        processes = [
+            multiprocessing.Process(
+                target=target, args=(index, self.workers, self.results, *args), name=f"download-worker-{index + 1}"
+            )
+            for index in range(self.workers)
+        ]
+        for process in processes:
+            process.start()
+        running = set(range(self.workers))
+        last_len = 0
+        next_progress = time.monotonic()
+        try:
+            while running:
+                self._drain(running, PROGRESS_INTERVAL)
+                dead = [index for index in running if not processes[index].is_alive()]
+                if dead:
+                    self._drain(running, 0.1)  # Its last messages may still be in the pipe
+                    for index in dead:
+                        if index in running:
+                            running.discard(index)
+                            print(
+                                f"\n[WORKER {index + 1}] exited with code {processes[index].exitcode} before finishing",
+                                file=sys.stderr,
+                            )
+                if self.show_progress and time.monotonic() >= next_progress:
+                    last_len = self._print_progress(len(running), last_len)
+                    next_progress = time.monotonic() + PROGRESS_INTERVAL
+        except KeyboardInterrupt:
+            # The workers got the signal too; let them stop, keeping what they report
+            print("\n[SHUTDOWN] Waiting for workers to stop...", file=sys.stderr)
+            deadline = time.monotonic() + JOIN_TIMEOUT
+            # Keep reading: a worker can't exit while its queue feeder is blocked on a full pipe
+            while any(process.is_alive() for process in processes) and time.monotonic() < deadline:
+                self._drain(running, 0.1)
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+            while self._drain(running, 0.1):
+                pass
+        for process in processes:
+            process.join()
+        if self.show_progress:
+            self._print_progress(0, last_len, final=True)
+        self.stats.blocked = self.counters.get("blocked", 0)
+        return self.stats
+
+    def _drain(self, running: set, timeout: float) -> int:
+        """Record queued messages, waiting up to timeout for the first; returns how many."""
+        handled = 0
+        try:
+            message = self.results.get(timeout=timeout)
+            while True:
+                self._handle(message, running)
+                handled += 1
+                message = self.results.get_nowait()
+        except queue.Empty:
+            pass
+        return handled
+
+    def _handle(self, message: Tuple, running: set) -> None:
+        kind = message[0]
+        if kind == WORKER_DONE:
+            _, index, counters = message
+            running.discard(index)
+            for name, value in counters.items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            return
+        record_result(self.state, self.stats, message)
+
+    def _print_progress(self, running: int, last_len: int, final: bool = False) -> int:
+        stats = self.stats
+        counts = f"OK:{stats.downloaded} Skip:{stats.skipped} Fail:{stats.failed} Corrupt:{stats.corrupt}"
+        paused = self.block_state.remaining() if self.block_state else 0
+        if paused > 0 and not final:
+            line = f"[PAUSED {int(paused)}s] {counts} Blocked:{self.block_state.blocks}"
+        else:
+            line = f"[{stats.done}] {counts} ({stats.rate():.1f}/s) workers:{running}/{self.workers}"
+        padding = " " * max(0, last_len - len(line))
+        print(f"\r{line}{padding}", end="\n" if final else "", file=sys.stderr, flush=True)
+        return len(line)
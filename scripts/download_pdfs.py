@@ -1,20 +1,33 @@
 #!/usr/bin/env python3
 import argparse
 import asyncio
-import json
+import contextlib
 import os
 import random
-import re
+import socket
 import sys
-import time
-from collections import defaultdict
 from pathlib import Path
-from typing import Dict, Iterable, List, Optional, Set, Tuple
-from urllib.parse import urlparse
-
-import aiohttp
-import yarl
-from http.cookies import SimpleCookie
+from typing import Any, AsyncIterable, Dict, Iterable, Optional, Tuple, Union
+
+from doj import manifest as mf
+from doj.blocking import BlockState
+from doj.cas import LINK_MODES, ContentStore
+from doj.cookies import load_cookies_from_file, load_cookies_from_storage_state, parse_cookies
+from doj.engine import Engine, Stats
+from doj.layout import Layout
+from doj.leases import LeaseClient, LeaseFeed
+from doj.limiter import make_limiter
+from doj.linefile import parse_shard
+from doj.metrics import MetricsExporter, add_metrics_arguments, exporter_from_args
+from doj.state import StateStore, select_urls
+from doj.storage import StorageWriter
+from doj.throttle import HostRateLimiter
+from doj.trace import TraceLog
+from doj.transports import AiohttpTransport
+from doj.urls import iter_urls, peek
+from doj.validators import CACHE_NAME, REVALIDATE_AFTER, ValidatorCache
+from doj.verify import VerifyStats, verify_corpus
+from doj.workers import WORKER_DONE, RemoteState, SharedBlockState, SharedHostRateLimiter, Supervisor
 
 
 DEFAULT_INPUT = "pdf-links.txt"
@@ -22,12 +35,9 @@ DEFAULT_OUT_DIR = "downloads"
 DEFAULT_CONCURRENCY = 5  # Reduced from 32 to avoid detection
 DEFAULT_TIMEOUT = 60
 DEFAULT_RETRIES = 5  # More retries with longer backoff
-CHUNK_SIZE = 1024 * 256
 MIN_DELAY = 1.0  # Minimum delay between requests (seconds)
 MAX_DELAY = 3.0  # Maximum delay between requests (seconds)
 BLOCK_PAUSE = 1200  # 20 minutes pause when IP is blocked (403)
-CORRUPT_THRESHOLD = 5  # Trigger cookie refresh after this many consecutive corrupt downloads
-PDF_MAGIC = b'%PDF'  # PDF files start with this magic byte sequence
 
 # Rotate through realistic User-Agent strings
 USER_AGENTS = [
@@ -55,102 +65,21 @@ def get_random_headers() -> Dict[str, str]:
     }
 
 
-def parse_cookies(cookie_string: str) -> Dict[str, str]:
-    """Parse cookies from string format 'name=value; name2=value2' or 'name=value,name2=value2'."""
-    cookies: Dict[str, str] = {}
-    if not cookie_string:
-        return cookies
-    
-    # Support both semicolon and comma separators
-    for sep in [';', ',']:
-        if sep in cookie_string:
-            parts = cookie_string.split(sep)
-            break
-    else:
-        parts = [cookie_string]
-    
-    for part in parts:
-        part = part.strip()
-        if '=' in part:
-            name, value = part.split('=', 1)
-            cookies[name.strip()] = value.strip()
-    
-    return cookies
-
-
-def load_cookies_from_file(path: Path) -> Dict[str, str]:
-    """Load cookies from a file (one 'name=value' per line or Netscape format)."""
-    cookies: Dict[str, str] = {}
-    if not path.exists():
-        return cookies
-    
-    with path.open("r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line or line.startswith('#'):
-                continue
-            # Simple format: name=value
-            if '=' in line and '\t' not in line:
-                name, value = line.split('=', 1)
-                cookies[name.strip()] = value.strip()
-            # Netscape format: domain\tflag\tpath\tsecure\texpiry\tname\tvalue
-            elif '\t' in line:
-                parts = line.split('\t')
-                if len(parts) >= 7:
-                    cookies[parts[5]] = parts[6]
-    
-    return cookies
-
-
-def load_cookies_from_storage_state(path: Path) -> Dict[str, str]:
-    """Load cookies from Playwright storage-state.json format."""
-    cookies: Dict[str, str] = {}
-    if not path.exists():
-        return cookies
-
-    try:
-        with path.open("r", encoding="utf-8") as f:
-            data = json.load(f)
-            for cookie in data.get("cookies", []):
-                cookies[cookie["name"]] = cookie["value"]
-    except (json.JSONDecodeError, KeyError):
-        pass
-
-    return cookies
-
-
-def find_corrupt_pdfs(out_dir: Path, verbose: bool = False) -> List[Path]:
-    """Find downloaded files that are actually HTML, not PDF."""
-    corrupt = []
-    pdf_files = list(out_dir.glob("*.pdf"))
-    total = len(pdf_files)
-
-    for i, pdf_file in enumerate(pdf_files):
-        if verbose and i % 10000 == 0:
-            print(f"Checking files: {i}/{total}...", file=sys.stderr)
-        try:
-            with pdf_file.open("rb") as f:
-                header = f.read(10)
-                if not header.startswith(PDF_MAGIC):
-                    corrupt.append(pdf_file)
-        except (IOError, OSError):
-            continue
-
-    return corrupt
-
-
 def clean_corrupt_pdfs(out_dir: Path, verbose: bool = False) -> int:
-    """Delete corrupted PDF files (HTML masquerading as PDF)."""
-    corrupt = find_corrupt_pdfs(out_dir, verbose=verbose)
+    """Delete downloaded files that aren't complete PDFs (HTML error pages, truncated bodies)."""
+    stats = VerifyStats()
+    corrupt = list(verify_corpus(out_dir, stats=stats))
+    if verbose:
+        print(stats.report(), file=sys.stderr)
     count = len(corrupt)
 
     if count > 0:
-        print(f"Found {count} corrupt PDF files (HTML content)", file=sys.stderr)
-        for pdf_file in corrupt:
+        print(f"Found {count} corrupt PDF files", file=sys.stderr)
+        for pdf_file, error in corrupt:
             try:
                 pdf_file.unlink()
                 if verbose:
-                    print(f"Deleted: {pdf_file.name}", file=sys.stderr)
+                    print(f"Deleted: {pdf_file.name} ({error})", file=sys.stderr)
             except (IOError, OSError) as e:
                 print(f"Failed to delete {pdf_file}: {e}", file=sys.stderr)
 
@@ -201,238 +130,8 @@ async def refresh_cookies_with_playwright(
     return cookies
 
 
-def create_cookie_jar(cookies: Dict[str, str], domains: List[str]) -> aiohttp.CookieJar:
-    """Create an aiohttp CookieJar with pre-set cookies for given domains."""
-    jar = aiohttp.CookieJar(unsafe=True)  # unsafe=True allows cookies for IP addresses
-    
-    for domain in domains:
-        for name, value in cookies.items():
-            # Create a morsel for each cookie
-            jar.update_cookies({name: value}, response_url=yarl.URL(f"https://{domain}/"))
-    
-    return jar
-
-
-def read_urls(path: Path, deduplicate: bool = True) -> List[str]:
-    """Read URLs from file, optionally deduplicating while preserving order."""
-    urls: List[str] = []
-    seen: Set[str] = set()
-    duplicates = 0
-    with path.open("r", encoding="utf-8") as handle:
-        for raw in handle:
-            line = raw.strip()
-            if not line:
-                continue
-            if deduplicate:
-                if line in seen:
-                    duplicates += 1
-                    continue
-                seen.add(line)
-            urls.append(line)
-    if deduplicate and duplicates > 0:
-        print(f"Removed {duplicates} duplicate URLs from input", file=sys.stderr)
-    return urls
-
-
-def sanitize_filename(name: str) -> str:
-    name = name.strip()
-    name = re.sub(r"[^A-Za-z0-9._-]+", "_", name)
-    return name or "downloaded.pdf"
-
-
-def filename_from_url(url: str) -> str:
-    parsed = urlparse(url)
-    base = os.path.basename(parsed.path)
-    if not base:
-        return "downloaded.pdf"
-    base = sanitize_filename(base)
-    if "." not in base:
-        base += ".pdf"
-    return base
-
-
-def unique_name(name: str, out_dir: Path, reserved: Set[str]) -> str:
-    if name not in reserved and not (out_dir / name).exists():
-        reserved.add(name)
-        return name
-    stem, suffix = os.path.splitext(name)
-    idx = 2
-    while True:
-        candidate = f"{stem}-{idx}{suffix}"
-        if candidate not in reserved and not (out_dir / candidate).exists():
-            reserved.add(candidate)
-            return candidate
-        idx += 1
-
-
-async def head_content_length(
-    session: aiohttp.ClientSession, url: str, timeout: aiohttp.ClientTimeout
-) -> Optional[int]:
-    try:
-        headers = get_random_headers()
-        async with session.head(url, timeout=timeout, allow_redirects=True, headers=headers) as resp:
-            if resp.status >= 400:
-                return None
-            value = resp.headers.get("Content-Length")
-            if value is None:
-                return None
-            return int(value)
-    except Exception:
-        return None
-
-
-def parse_retry_after(value: Optional[str]) -> Optional[int]:
-    if not value:
-        return None
-    try:
-        return int(value)
-    except ValueError:
-        return None
-
-
-class GlobalBlockState:
-    """Tracks global IP block state across all workers."""
-    def __init__(self, block_pause: float):
-        self.block_pause = block_pause
-        self.blocked_until: float = 0
-        self.lock = asyncio.Lock()
-    
-    async def check_and_wait(self) -> None:
-        """If we're in a block period, wait until it expires."""
-        while True:
-            async with self.lock:
-                now = time.monotonic()
-                if now >= self.blocked_until:
-                    return
-                wait_time = self.blocked_until - now
-            
-            mins = int(wait_time // 60)
-            secs = int(wait_time % 60)
-            print(f"\r[BLOCKED] IP blocked, waiting {mins}m {secs}s...   ", end="", file=sys.stderr, flush=True)
-            await asyncio.sleep(min(10, wait_time))  # Check every 10s
-    
-    async def trigger_block(self) -> None:
-        """Called when a 403 is detected - triggers global pause."""
-        async with self.lock:
-            new_blocked_until = time.monotonic() + self.block_pause
-            if new_blocked_until > self.blocked_until:
-                self.blocked_until = new_blocked_until
-                mins = int(self.block_pause // 60)
-                print(f"\n[403 DETECTED] IP appears blocked. Pausing ALL requests for {mins} minutes...", file=sys.stderr)
-
-
-async def download_one(
-    session: aiohttp.ClientSession,
-    url: str,
-    dest: Path,
-    timeout: aiohttp.ClientTimeout,
-    retries: int,
-    resume: bool,
-    domain_locks: Dict[str, asyncio.Lock],
-    domain_last_request: Dict[str, float],
-    min_delay: float,
-    max_delay: float,
-    block_state: GlobalBlockState,
-    validate_pdf: bool = True,
-) -> Tuple[str, Optional[str]]:
-    if resume and dest.exists():
-        length = await head_content_length(session, url, timeout)
-        if length is not None and dest.stat().st_size == length:
-            return ("skipped", None)
-
-    # Extract domain for per-domain rate limiting
-    parsed = urlparse(url)
-    domain = parsed.netloc
-
-    attempt = 0
-    while True:
-        try:
-            # Check if we're in a global block period (IP blocked)
-            await block_state.check_and_wait()
-
-            # Per-domain rate limiting to avoid hammering single servers
-            if domain not in domain_locks:
-                domain_locks[domain] = asyncio.Lock()
-
-            async with domain_locks[domain]:
-                # Enforce minimum delay between requests to same domain
-                now = time.monotonic()
-                last = domain_last_request.get(domain, 0)
-                elapsed = now - last
-                min_wait = random.uniform(min_delay, max_delay)
-                if elapsed < min_wait:
-                    await asyncio.sleep(min_wait - elapsed)
-                domain_last_request[domain] = time.monotonic()
-
-            # Use random browser-like headers
-            headers = get_random_headers()
-
-            async with session.get(url, timeout=timeout, headers=headers) as resp:
-                # Handle 403 - trigger global pause since IP is blocked
-                if resp.status == 403:
-                    await block_state.trigger_block()
-                    raise aiohttp.ClientResponseError(
-                        request_info=resp.request_info,
-                        history=resp.history,
-                        status=resp.status,
-                        message="IP blocked (403)",
-                        headers=resp.headers,
-                    )
-                # Other retryable errors
-                if resp.status in (429, 500, 502, 503, 504):
-                    raise aiohttp.ClientResponseError(
-                        request_info=resp.request_info,
-                        history=resp.history,
-                        status=resp.status,
-                        message=f"retryable ({resp.status})",
-                        headers=resp.headers,
-                    )
-                resp.raise_for_status()
-
-                # Read content into memory first for validation
-                content = await resp.read()
-
-                # Validate PDF magic bytes if enabled
-                if validate_pdf:
-                    if not content.startswith(PDF_MAGIC):
-                        # Check if it's HTML (common when redirected to login/captcha page)
-                        if content.startswith(b'<!DOCTYPE') or content.startswith(b'<html') or content.startswith(b'\n<!DOCTYPE'):
-                            return ("corrupt", "Received HTML instead of PDF (likely captcha/auth page)")
-                        return ("corrupt", f"Invalid PDF: missing magic bytes (got: {content[:20]!r})")
-
-                # Write validated content to file
-                tmp_path = dest.with_suffix(dest.suffix + ".part")
-                with tmp_path.open("wb") as handle:
-                    handle.write(content)
-                tmp_path.replace(dest)
-                return ("downloaded", None)
-        except Exception as exc:
-            if attempt >= retries:
-                return ("failed", f"{type(exc).__name__}: {exc}")
-            attempt += 1
-
-            # For 403, the global pause handles the wait - just do a short delay before retry
-            is_403 = isinstance(exc, aiohttp.ClientResponseError) and getattr(exc, "status", 0) == 403
-            if is_403:
-                # Global pause already triggered, just wait a moment before retry
-                await asyncio.sleep(random.uniform(1, 3))
-                continue
-
-            # Calculate backoff for other errors
-            retry_after = None
-            if isinstance(exc, aiohttp.ClientResponseError):
-                retry_after = parse_retry_after(
-                    getattr(exc, "headers", {}).get("Retry-After")
-                )
-
-            if retry_after is None:
-                retry_after = min(60, 5 * (2 ** (attempt - 1))) * random.uniform(0.8, 1.2)
-
-            await asyncio.sleep(retry_after)
-
-
 async def run_downloads(
-    urls: Iterable[str],
+    urls: Union[Iterable[str], AsyncIterable[str]],
     out_dir: Path,
     concurrency: int,
     timeout_seconds: int,
@@ -442,210 +141,120 @@ async def run_downloads(
     verbose: bool,
     min_delay: float = MIN_DELAY,
     max_delay: float = MAX_DELAY,
+    burst: int = 1,
     block_pause: float = BLOCK_PAUSE,
     cookies: Optional[Dict[str, str]] = None,
     fast_skip: bool = False,
     validate_pdf: bool = True,
     storage_state_path: Optional[str] = None,
-) -> Tuple[int, int, int, int, List[str]]:
-    timeout = aiohttp.ClientTimeout(total=timeout_seconds)
-    connector = aiohttp.TCPConnector(limit=concurrency, enable_cleanup_closed=True)
-
-    # Create cookie jar - unsafe=True allows cookies for IP addresses
-    cookie_jar = aiohttp.CookieJar(unsafe=True)
-    reserved: Set[str] = set()
-    reserved_lock = asyncio.Lock()
-    counter_lock = asyncio.Lock()
-    done_event = asyncio.Event()
-
-    # Per-domain rate limiting
-    domain_locks: Dict[str, asyncio.Lock] = {}
-    domain_last_request: Dict[str, float] = defaultdict(float)
-
-    # Global block state for IP-level blocks
-    block_state = GlobalBlockState(block_pause)
-
-    # Corrupt download tracking for auto-refresh
-    corrupt_streak = [0]  # Use list to allow modification in nested function
-    needs_refresh = [False]
-
-    queue: asyncio.Queue[str] = asyncio.Queue()
-    url_list = list(urls)
-    for url in url_list:
-        queue.put_nowait(url)
-
-    total = len(url_list)
-
-    # Pre-populate cookies for all unique domains
-    unique_domains: Set[str] = set()
-    for url in url_list:
-        parsed = urlparse(url)
-        if parsed.netloc:
-            unique_domains.add(parsed.netloc)
-
+    manifest: Optional[mf.Manifest] = None,
+    validator_cache: Optional[ValidatorCache] = None,
+    refresh: bool = False,
+    max_concurrency: int = 0,
+    content_store: Optional[ContentStore] = None,
+    exporter: Optional[MetricsExporter] = None,
+    tracer: Optional[TraceLog] = None,
+    state: Optional[StateStore] = None,
+    block_state: Optional[BlockState] = None,
+    throttle: Optional[HostRateLimiter] = None,
+) -> Tuple[Stats, StateStore]:
+    """Download urls in this process; state, block_state and throttle default to private ones."""
+    limiter = make_limiter(concurrency, max_concurrency)
+    metrics = exporter.registry if exporter else None
+    transport = AiohttpTransport(
+        max(concurrency, max_concurrency),
+        timeout_seconds,
+        cookies=cookies,
+        header_factory=get_random_headers,
+        trace_configs=[hooks.trace_config() for hooks in (metrics, tracer) if hooks] or None,
+    )
     if cookies:
-        for domain in unique_domains:
-            for name, value in cookies.items():
-                cookie_jar.update_cookies({name: value}, response_url=yarl.URL(f"https://{domain}/"))
-
-        print(f"Loaded {len(cookies)} cookie(s) for {len(unique_domains)} domain(s)", file=sys.stderr)
-
-    counters = {"downloaded": 0, "skipped": 0, "failed": 0, "corrupt": 0}
-    failed_urls: List[str] = []
-
-    async def progress_loop() -> None:
-        spinner = ["|", "/", "-", "\\"]
-        idx = 0
-        last_len = 0
-        start = time.monotonic()
-        while not done_event.is_set():
-            async with counter_lock:
-                downloaded = counters["downloaded"]
-                skipped = counters["skipped"]
-                failed = counters["failed"]
-                corrupt = counters["corrupt"]
-            done = downloaded + skipped + failed + corrupt
-            elapsed = max(0.001, time.monotonic() - start)
-            rate = done / elapsed
-            width = 30
-            filled = int(width * (done / total)) if total else width
-            bar = "=" * filled + "." * (width - filled)
-            line = (
-                f"{spinner[idx % len(spinner)]} [{bar}] {done}/{total} "
-                f"(ok {downloaded} skip {skipped} fail {failed} corrupt {corrupt}) "
-                f"{rate:.1f}/s"
-            )
-            idx += 1
-            padding = " " * max(0, last_len - len(line))
-            print(f"\r{line}{padding}", end="", file=sys.stderr, flush=True)
-            last_len = len(line)
-            await asyncio.sleep(0.2)
-        print("\r" + (" " * last_len) + "\r", end="", file=sys.stderr, flush=True)
-
-    async with aiohttp.ClientSession(connector=connector, cookie_jar=cookie_jar) as session:
-        async def worker() -> None:
-            nonlocal cookies
-            while True:
-                # Check if cookie refresh was triggered
-                if needs_refresh[0] and storage_state_path:
-                    async with counter_lock:
-                        if needs_refresh[0]:  # Double-check under lock
-                            needs_refresh[0] = False
-                            print("\n[REFRESH] Too many corrupt downloads - refreshing cookies...", file=sys.stderr)
-                            new_cookies = await refresh_cookies_with_playwright(storage_state_path)
-                            if new_cookies:
-                                cookies = new_cookies
-                                # Update cookie jar
-                                for domain in unique_domains:
-                                    for name, value in new_cookies.items():
-                                        cookie_jar.update_cookies({name: value}, response_url=yarl.URL(f"https://{domain}/"))
-                                corrupt_streak[0] = 0
+        print(f"Loaded {len(cookies)} cookie(s)", file=sys.stderr)
 
-                try:
-                    url = queue.get_nowait()
-                except asyncio.QueueEmpty:
-                    return
-
-                # Check for existing file BEFORE generating unique name
-                base_filename = filename_from_url(url)
-                base_dest = out_dir / base_filename
-
-                if resume and base_dest.exists():
-                    # File exists - check if we should skip
-                    should_skip = False
-                    if fast_skip:
-                        # Fast mode: skip without verifying size
-                        should_skip = True
-                    else:
-                        # Also validate that existing file is actually a PDF
-                        if validate_pdf:
-                            try:
-                                with base_dest.open("rb") as f:
-                                    if not f.read(4).startswith(PDF_MAGIC):
-                                        should_skip = False  # Re-download corrupt file
-                                    else:
-                                        # Valid PDF, check size
-                                        length = await head_content_length(session, url, timeout)
-                                        if length is not None and base_dest.stat().st_size == length:
-                                            should_skip = True
-                            except (IOError, OSError):
-                                should_skip = False
-                        else:
-                            length = await head_content_length(session, url, timeout)
-                            if length is not None and base_dest.stat().st_size == length:
-                                should_skip = True
-
-                    if should_skip:
-                        async with counter_lock:
-                            counters["skipped"] += 1
-                        if verbose:
-                            print(f"SKIP   {url}")
-                        queue.task_done()
-                        continue
-
-                # File doesn't exist or is incomplete - get unique name and download
-                async with reserved_lock:
-                    filename = unique_name(base_filename, out_dir, reserved)
-                dest = out_dir / filename
-                status, error = await download_one(
-                    session=session,
-                    url=url,
-                    dest=dest,
-                    timeout=timeout,
-                    retries=retries,
-                    resume=False,
-                    domain_locks=domain_locks,
-                    domain_last_request=domain_last_request,
-                    min_delay=min_delay,
-                    max_delay=max_delay,
-                    block_state=block_state,
-                    validate_pdf=validate_pdf,
-                )
-                async with counter_lock:
-                    if status == "downloaded":
-                        counters["downloaded"] += 1
-                        corrupt_streak[0] = 0  # Reset on successful download
-                    elif status == "skipped":
-                        counters["skipped"] += 1
-                    elif status == "corrupt":
-                        counters["corrupt"] += 1
-                        failed_urls.append(url)
-                        corrupt_streak[0] += 1
-                        # Trigger refresh if too many consecutive corrupt downloads
-                        if corrupt_streak[0] >= CORRUPT_THRESHOLD and storage_state_path:
-                            needs_refresh[0] = True
-                    else:
-                        counters["failed"] += 1
-                        failed_urls.append(url)
-                if verbose:
-                    if status == "downloaded":
-                        print(f"OK     {url}")
-                    elif status == "skipped":
-                        print(f"SKIP   {url}")
-                    elif status == "corrupt":
-                        print(f"CORRUPT {url} ({error})")
-                    else:
-                        print(f"FAIL   {url} ({error})")
-                queue.task_done()
-
-        progress_task = None
-        if show_progress and total:
-            progress_task = asyncio.create_task(progress_loop())
-        workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
-        await queue.join()
-        for task in workers:
-            task.cancel()
-        await asyncio.gather(*workers, return_exceptions=True)
-        done_event.set()
-        if progress_task:
-            await progress_task
-
-    downloaded = counters["downloaded"]
-    skipped = counters["skipped"]
-    failed = counters["failed"]
-    corrupt = counters["corrupt"]
-
-    return downloaded, skipped, failed, corrupt, failed_urls
+    async def refresh_cookies() -> None:
+        print("\n[REFRESH] Too many corrupt downloads - refreshing cookies...", file=sys.stderr)
+        new_cookies = await refresh_cookies_with_playwright(storage_state_path)
+        if new_cookies:
+            transport.update_cookies(new_cookies)
+
+    state = state or StateStore(manifest)
+    engine = Engine(
+        transport,
+        StorageWriter(
+            Layout.load(out_dir),
+            validate_pdf=validate_pdf,
+            validator_cache=validator_cache,
+            content_store=content_store,
+            metrics=metrics,
+        ),
+        state,
+        concurrency=concurrency,
+        retries=retries,
+        resume=resume,
+        verify_existing=not fast_skip,
+        refresh=refresh,
+        block_state=block_state or BlockState(block_pause),
+        limiter=limiter,
+        throttle=throttle or HostRateLimiter.from_delays(min_delay, max_delay, burst),
+        backoff_base=5.0,
+        on_corrupt_streak=refresh_cookies if storage_state_path else None,
+        show_progress=show_progress,
+        verbose=verbose,
+        metrics=metrics,
+        tracer=tracer,
+    )
+    async with exporter or contextlib.nullcontext():
+        stats = await engine.run(urls)
+    return stats, state
+
+
+def download_worker(index: int, count: int, results, setup: Dict[str, Any], options: Dict[str, Any]) -> None:
+    """One --workers process: downloads share `index` of `count` and reports every result to the supervisor.
+
+    The share is the manifest rows whose id is index modulo count, or
+    without a manifest the --input URLs whose filename hashes to index.
+
+    setup names what the worker opens itself (input, manifest, caches,
+    trace); options go to run_downloads, shared limiter and block state included.
+    """
+    manifest = mf.Manifest(Path(setup["manifest"])) if setup["manifest"] else None
+    validator_cache = None
+    if setup["validator_cache"]:
+        validator_cache = ValidatorCache(Path(setup["validator_cache"]), revalidate_after=setup["revalidate_after"])
+    content_store = ContentStore(options["out_dir"], setup["cas"]) if setup["cas"] else None
+    tracer = None
+    if setup["trace"]:
+        # One log per worker: trace.jsonl -> trace.2.jsonl; trace_report.py reads them together
+        trace_path = Path(setup["trace"])
+        tracer = TraceLog(trace_path.with_name(f"{trace_path.stem}.{index + 1}{trace_path.suffix}"))
+    stats = None
+    try:
+        if manifest:
+            # The supervisor already imported the input; just page this worker's rows
+            urls = manifest.iter_pending(statuses=setup["statuses"], shard=(index, count))
+        else:
+            urls = iter_urls(Path(setup["input"]), deduplicate=setup["deduplicate"], partition=(index, count))
+        stats, _ = asyncio.run(
+            run_downloads(
+                urls=urls,
+                validator_cache=validator_cache,
+                content_store=content_store,
+                tracer=tracer,
+                state=RemoteState(results),
+                **options,
+            )
+        )
+    except KeyboardInterrupt:
+        pass  # The supervisor got the Ctrl+C too and keeps what was reported
+    finally:
+        for resource in (tracer, validator_cache, manifest):
+            if resource:
+                resource.close()
+        counters = {
+            "blocked": stats.blocked if stats else 0,
+            "deduplicated": content_store.deduplicated if content_store else 0,
+        }
+        results.put((WORKER_DONE, index, counters))
 
 
 def build_arg_parser() -> argparse.ArgumentParser:
@@ -655,7 +264,8 @@ def build_arg_parser() -> argparse.ArgumentParser:
 Anti-blocking features:
   - Cookie support for age gates and authentication (--cookies, --cookie-file)
   - Randomized browser User-Agent headers
-  - Per-domain rate limiting (--min-delay, --max-delay)
+  - Per-domain rate limiting (--min-delay, --max-delay, --burst): requests to
+    one domain are spaced a random min..max delay apart on average
   - GLOBAL PAUSE on 403: When any request gets 403, ALL workers pause
     for --block-pause seconds (default 20 min) since your IP is blocked
   - Exponential backoff on 429/5xx errors
@@ -685,6 +295,30 @@ If you're still getting blocked, try:
         default=DEFAULT_CONCURRENCY,
         help=f"Number of concurrent downloads (default: {DEFAULT_CONCURRENCY}, lower = safer).",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Split the URLs over this many processes, each running --concurrency downloads; "
+        "rate limits and block pauses stay shared (default: 1).",
+    )
+    parser.add_argument(
+        "--coordinator",
+        default="",
+        help="Take URLs in leases from this coordinator.py (e.g. http://host:8765) instead of --input; "
+        "results go to its manifest.",
+    )
+    parser.add_argument(
+        "--worker-name",
+        default=f"{socket.gethostname()}-{os.getpid()}",
+        help="Name this worker reports to the coordinator (default: host-pid).",
+    )
+    parser.add_argument(
+        "--max-concurrency",
+        type=int,
+        default=0,
+        help="Adapt concurrency between 1 and this many downloads, starting at --concurrency (default: fixed).",
+    )
     parser.add_argument(
         "--timeout",
         type=int,
@@ -706,6 +340,12 @@ If you're still getting blocked, try:
         default=MAX_DELAY,
         help=f"Maximum delay between requests to same domain (default: {MAX_DELAY}s).",
     )
+    parser.add_argument(
+        "--burst",
+        type=int,
+        default=1,
+        help="Requests to the same domain that may go out back to back before the delays apply (default: 1).",
+    )
     parser.add_argument(
         "--block-pause",
         type=int,
@@ -740,6 +380,28 @@ If you're still getting blocked, try:
         action="store_true",
         help="Skip existing files without verifying size (faster, assumes previous downloads are complete).",
     )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help=(
+            "Re-sync existing files with conditional GETs (If-None-Match/If-Modified-Since): "
+            "unchanged files return 304 with no body, republished ones are replaced in place."
+        ),
+    )
+    parser.add_argument(
+        "--revalidate-days",
+        type=float,
+        default=REVALIDATE_AFTER / 86400,
+        help=(
+            "On resume, trust cached size/ETag for this many days before re-checking with HEAD "
+            f"(default: {REVALIDATE_AFTER / 86400:g}, 0 = never re-check)."
+        ),
+    )
+    parser.add_argument(
+        "--no-validator-cache",
+        action="store_true",
+        help=f"Don't keep the resume validator cache ({CACHE_NAME} in --out-dir); HEAD every existing file.",
+    )
     parser.add_argument(
         "--failed-file",
         default="failed.txt",
@@ -755,6 +417,11 @@ If you're still getting blocked, try:
         action="store_true",
         help="Print per-file status lines.",
     )
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        help="Only download shard K/N: the K-th of N equal runs of --input's lines, e.g. 2/4 (not with --manifest).",
+    )
     parser.add_argument(
         "--no-dedupe",
         action="store_true",
@@ -768,25 +435,55 @@ If you're still getting blocked, try:
     parser.add_argument(
         "--clean-corrupt",
         action="store_true",
-        help="Delete corrupted PDF files (HTML masquerading as PDF) before starting downloads.",
+        help="Delete corrupt PDF files (HTML masquerading as PDF, truncated downloads) before starting downloads.",
+    )
+    parser.add_argument(
+        "--manifest",
+        type=str,
+        default="",
+        help=f"SQLite manifest to read pending URLs from and record results in (e.g. {mf.DEFAULT_MANIFEST}).",
+    )
+    parser.add_argument(
+        "--cas",
+        choices=LINK_MODES,
+        help="Store each distinct file once under out-dir/.cas by SHA-256 and link its name(s) to it.",
     )
     parser.add_argument(
         "--refresh-cookies",
         action="store_true",
         help="Launch browser to refresh cookies before starting downloads.",
     )
+    add_metrics_arguments(parser)
+    parser.add_argument(
+        "--trace",
+        default="",
+        help="Append one JSON line per request attempt with its phase timings to this file (see trace_report.py).",
+    )
     return parser
 
 
 def main() -> None:
     parser = build_arg_parser()
     args = parser.parse_args()
+    if args.refresh and args.no_validator_cache:
+        parser.error("--refresh needs the validator cache; drop --no-validator-cache")
 
     input_path = Path(args.input)
     out_dir = Path(args.out_dir)
     out_dir.mkdir(parents=True, exist_ok=True)
 
-    if not input_path.exists():
+    if args.shard and args.manifest:
+        parser.error("--shard splits --input; it can't be combined with --manifest")
+    if args.workers > 1 and (args.shard or args.metrics_port or args.metrics_file):
+        parser.error("--workers can't be combined with --shard or the --metrics-* options")
+    if args.coordinator and (
+        args.manifest or args.shard or args.workers > 1 or args.refresh or args.metrics_port or args.metrics_file
+    ):
+        parser.error(
+            "--coordinator can't be combined with --manifest, --shard, --workers, --refresh or the --metrics-* options"
+        )
+    manifest = mf.Manifest(Path(args.manifest)) if args.manifest else None
+    if not input_path.exists() and not manifest and not args.coordinator:
         print(f"Input file not found: {input_path}")
         return
 
@@ -799,10 +496,16 @@ def main() -> None:
         else:
             print("No corrupt files found", file=sys.stderr)
 
-    urls = read_urls(input_path, deduplicate=not args.no_dedupe)
-    if not urls:
-        print("No URLs found.")
-        return
+    # A refresh revisits completed files too
+    statuses = mf.RETRYABLE + (mf.DOWNLOADED,) if args.refresh else mf.RETRYABLE
+    if not args.coordinator:
+        urls, _, _ = select_urls(
+            input_path, manifest, deduplicate=not args.no_dedupe, statuses=statuses, shard=args.shard
+        )
+        urls = peek(urls)
+        if urls is None:
+            print("No URLs found.")
+            return
 
     # Load cookies from command line, file, and/or Playwright storage state
     cookies: Dict[str, str] = {}
@@ -834,39 +537,121 @@ def main() -> None:
         cookies.update(parse_cookies(args.cookies))
 
     show_progress = not args.no_progress and not args.verbose
-    downloaded, skipped, failed, corrupt, failed_urls = asyncio.run(
-        run_downloads(
-            urls=urls,
-            out_dir=out_dir,
-            concurrency=max(1, args.concurrency),
-            timeout_seconds=max(1, args.timeout),
-            retries=max(0, args.retries),
-            resume=not args.no_resume,
-            show_progress=show_progress,
-            verbose=args.verbose,
-            min_delay=max(0.0, args.min_delay),
-            max_delay=max(args.min_delay, args.max_delay),
-            block_pause=max(60, args.block_pause),
-            cookies=cookies if cookies else None,
-            fast_skip=args.fast_skip,
-            validate_pdf=not args.no_validate,
-            storage_state_path=storage_state_path,
-        )
+    options = dict(
+        out_dir=out_dir,
+        concurrency=max(1, args.concurrency),
+        timeout_seconds=max(1, args.timeout),
+        retries=max(0, args.retries),
+        resume=not args.no_resume,
+        verbose=args.verbose,
+        min_delay=max(0.0, args.min_delay),
+        max_delay=max(args.min_delay, args.max_delay),
+        burst=args.burst,
+        block_pause=max(60, args.block_pause),
+        cookies=cookies if cookies else None,
+        fast_skip=args.fast_skip,
+        validate_pdf=not args.no_validate,
+        refresh=args.refresh,
+        max_concurrency=args.max_concurrency,
     )
+    validator_path = None if args.no_validator_cache else out_dir / CACHE_NAME
+    revalidate_after = args.revalidate_days * 86400
+
+    if args.workers > 1:
+        state = StateStore(manifest)
+        block_state = SharedBlockState(options["block_pause"])
+        throttle = SharedHostRateLimiter.from_delays(options["min_delay"], options["max_delay"], args.burst)
+        setup = {
+            "input": str(input_path),
+            "manifest": args.manifest or None,
+            "deduplicate": not args.no_dedupe,
+            "statuses": statuses,
+            "validator_cache": str(validator_path) if validator_path else None,
+            "revalidate_after": revalidate_after,
+            "cas": args.cas,
+            "trace": args.trace or None,
+        }
+        # Each worker reads its own shard of the URLs. Workers don't open a browser
+        # for a cookie refresh or draw progress; the supervisor does the latter
+        options.update(show_progress=False, block_state=block_state, throttle=throttle)
+        print(f"Starting {args.workers} workers x {options['concurrency']} downloads", file=sys.stderr)
+        supervisor = Supervisor(state, args.workers, block_state, show_progress)
+        stats = supervisor.run(download_worker, (setup, options))
+        deduplicated = supervisor.counters.get("deduplicated", 0)
+        state.close()
+    elif args.coordinator:
+        validator_cache = ValidatorCache(validator_path, revalidate_after=revalidate_after) if validator_path else None
+        content_store = ContentStore(out_dir, args.cas) if args.cas else None
+        tracer = TraceLog(Path(args.trace)) if args.trace else None
+
+        async def lease_downloads() -> Stats:
+            # One engine, session and limiter for every lease this machine takes
+            async with LeaseClient(args.coordinator, args.worker_name) as client:
+                feed = LeaseFeed(client, report=args.verbose)
+                interrupted = True
+                try:
+                    lease_stats, _ = await run_downloads(
+                        urls=feed.urls(),
+                        show_progress=show_progress,
+                        storage_state_path=storage_state_path,
+                        validator_cache=validator_cache,
+                        content_store=content_store,
+                        tracer=tracer,
+                        state=feed,
+                        **options,
+                    )
+                    interrupted = False
+                finally:
+                    # Also on Ctrl+C: hand back what wasn't done rather than leave it until the TTL runs out
+                    await feed.finish(interrupted)
+                return lease_stats
 
-    if args.failed_file:
-        failed_path = Path(args.failed_file)
-        if failed_urls:
-            failed_path.write_text("\n".join(failed_urls) + "\n", encoding="utf-8")
-        elif failed_path.exists():
-            failed_path.unlink()
+        print(f"Taking leases from {args.coordinator} as {args.worker_name}", file=sys.stderr)
+        try:
+            stats = asyncio.run(lease_downloads())
+        except KeyboardInterrupt:
+            print("\n[SHUTDOWN] Interrupted; unfinished URLs were handed back", file=sys.stderr)
+            return
+        finally:
+            deduplicated = content_store.deduplicated if content_store else 0
+            if tracer:
+                tracer.close()
+            if validator_cache:
+                validator_cache.close()
+        state = None  # Failures are recorded by the coordinator
+    else:
+        validator_cache = ValidatorCache(validator_path, revalidate_after=revalidate_after) if validator_path else None
+        content_store = ContentStore(out_dir, args.cas) if args.cas else None
+        tracer = TraceLog(Path(args.trace)) if args.trace else None
+        stats, state = asyncio.run(
+            run_downloads(
+                urls=urls,
+                show_progress=show_progress,
+                storage_state_path=storage_state_path,
+                manifest=manifest,
+                validator_cache=validator_cache,
+                content_store=content_store,
+                exporter=exporter_from_args(args),
+                tracer=tracer,
+                **options,
+            )
+        )
+        deduplicated = content_store.deduplicated if content_store else 0
+        state.close()
+        if tracer:
+            tracer.close()
+        if validator_cache:
+            validator_cache.close()
+
+    if state:
+        state.write_failed(Path(args.failed_file) if args.failed_file else None, remove_stale=True)
 
-    total = downloaded + skipped + failed + corrupt
     print(
-        f"Done. Total: {total}, Downloaded: {downloaded}, "
-        f"Skipped: {skipped}, Failed: {failed}, Corrupt: {corrupt}"
+        f"Done. Total: {stats.done}, Downloaded: {stats.downloaded}, "
+        f"Skipped: {stats.skipped}, Failed: {stats.failed}, Corrupt: {stats.corrupt}"
     )
-
+    if deduplicated:
+        print(f"Identical content already stored for {deduplicated} download(s); linked instead")
 
 if __name__ == "__main__":
     main()
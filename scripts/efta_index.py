@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""Build and query the EFTA ID range index: what is missing and which pages to re-scrape."""
+
+import argparse
+import sys
+from pathlib import Path
+from typing import Optional, Sequence
+
+from doj.idindex import DEFAULT_INDEX, IdIndex, efta_id
+from doj.manifest import DEFAULT_MANIFEST, Manifest
+
+
+def describe_pages(pages: Optional[Sequence[int]]) -> str:
+    if pages is None:
+        return "pages unknown"
+    if len(pages) == 1:
+        return f"page {pages[0]}"
+    return f"pages {pages[0]}-{pages[-1]}"
+
+
+def cmd_build(args: argparse.Namespace) -> None:
+    manifest_path = Path(args.manifest)
+    if manifest_path.exists() and not args.links:
+        with Manifest(manifest_path) as manifest:
+            index = IdIndex.from_manifest(manifest)
+        source = str(manifest_path)
+    else:
+        links = Path(args.links or "pdf-links.txt")
+        index = IdIndex.from_files(links, Path(args.dir))
+        source = f"{links} and {args.dir}"
+    index.save(Path(args.index))
+    counts = ", ".join(f"{status}:{count}" for status, count in sorted(index.counts().items()))
+    print(
+        f"Indexed {source}: {len(index.ids)} IDs in {len(index.status)} status runs ({counts}), "
+        f"{len(index.pages)} page ranges"
+    )
+    print(f"Wrote {args.index}")
+
+
+def cmd_gaps(args: argparse.Namespace) -> None:
+    index = IdIndex.load(Path(args.index))
+    pages = set(index.failed_pages)
+    count = 0
+    try:
+        for gap in index.gaps(max(1, args.min_size)):
+            count += 1
+            print(f"EFTA{gap.start:08d}-EFTA{gap.end:08d} ({gap.end - gap.start + 1} IDs): {describe_pages(gap.pages)}")
+            pages.update(gap.pages)
+    except ValueError as e:
+        print(f"Can't find gaps: {e}", file=sys.stderr)
+        print("EFTA numbers skip by each document's page count, so holes alone don't show a missing page.",
+              file=sys.stderr)
+        sys.exit(1)
+    if index.failed_pages:
+        print(f"Failed pages: {len(index.failed_pages)}")
+    print(f"{count} gaps, {len(pages)} pages to re-scrape")
+    if args.pages_out:
+        with open(args.pages_out, "w", encoding="utf-8") as out:
+            out.writelines(f"{page}\n" for page in sorted(pages))
+        print(f"Wrote {args.pages_out}; re-scrape with: scrape_links.py --pages-file {args.pages_out}")
+
+
+def cmd_missing(args: argparse.Namespace) -> None:
+    index = IdIndex.load(Path(args.index))
+    out = open(args.urls_out, "w", encoding="utf-8") if args.urls_out else None
+    runs = ids = 0
+    try:
+        for run in index.missing():
+            runs += 1
+            ids += len(run.ids)
+            if args.verbose or not out:
+                print(f"EFTA{run.start:08d}-EFTA{run.end:08d} {run.status}, {len(run.ids)} IDs ({describe_pages(run.pages)})")
+            if out:
+                urls = map(index.url, run.ids)
+                out.writelines(url + "\n" for url in urls if url)
+    finally:
+        if out:
+            out.close()
+    print(f"{ids} IDs in {runs} runs still to download")
+    if args.urls_out:
+        print(f"Wrote {args.urls_out}; download with: download_pdfs.py --input {args.urls_out}")
+
+
+def cmd_locate(args: argparse.Namespace) -> None:
+    index = IdIndex.load(Path(args.index))
+    for name in args.ids:
+        file_id = int(name) if name.isdigit() else efta_id(name)
+        if file_id is None:
+            print(f"{name}: not an EFTA number", file=sys.stderr)
+            continue
+        status, pages = index.locate(file_id)
+        print(f"EFTA{file_id:08d}: {status or 'not listed'}, {describe_pages(pages) if pages is None or len(pages) else 'on no page'}")
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Index EFTA IDs by range to find what is missing without diffing full lists.",
+        epilog="""
+Example usage:
+  python scripts/efta_index.py build
+  python scripts/efta_index.py build --links pdf-links.txt --dir downloads
+  python scripts/efta_index.py gaps --pages-out gap-pages.txt
+  python scripts/scrape_links.py --manifest manifest.sqlite3 --pages-file gap-pages.txt
+  python scripts/efta_index.py missing --urls-out missing.txt
+  python scripts/efta_index.py locate EFTA00039025.pdf 39100
+        """,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--index", default=DEFAULT_INDEX, help=f"Index file (default: {DEFAULT_INDEX}).")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_build = sub.add_parser("build", help="Build the index from the manifest, or from a link list and download folder.")
+    p_build.add_argument(
+        "--manifest", default=DEFAULT_MANIFEST, help=f"Manifest to index, if it exists (default: {DEFAULT_MANIFEST})."
+    )
+    p_build.add_argument("--links", default="", help="Index this URL list and --dir instead of the manifest.")
+    p_build.add_argument("--dir", default="downloads", help="Download folder used with --links (default: downloads).")
+    p_build.set_defaults(func=cmd_build)
+
+    p_gaps = sub.add_parser(
+        "gaps", help="List pages missing between scraped ones, and their ID ranges (needs scrapes in the manifest)."
+    )
+    p_gaps.add_argument("--min-size", type=int, default=1, help="Ignore gaps spanning fewer IDs (default: 1).")
+    p_gaps.add_argument("--pages-out", default="", help="Write the page numbers to re-scrape, failed pages included.")
+    p_gaps.set_defaults(func=cmd_gaps)
+
+    p_missing = sub.add_parser("missing", help="List runs of IDs that are listed but not downloaded.")
+    p_missing.add_argument("--urls-out", default="", help="Write their URLs here, for --input of a downloader.")
+    p_missing.add_argument("--verbose", action="store_true", help="List the runs even with --urls-out.")
+    p_missing.set_defaults(func=cmd_missing)
+
+    p_locate = sub.add_parser("locate", help="Show the status and listing page of IDs.")
+    p_locate.add_argument("ids", nargs="+", help="EFTA numbers, filenames or URLs.")
+    p_locate.set_defaults(func=cmd_locate)
+    return parser
+
+
+def main() -> None:
+    args = build_arg_parser().parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,22 @@
 #!/usr/bin/env python3
 import asyncio
-import os
 from pathlib import Path
-from urllib.parse import urlparse, unquote
 
-import aiohttp
+from doj import manifest as mf
+from doj.engine import Engine
+from doj.layout import Layout
+from doj.state import StateStore
+from doj.storage import StorageWriter
+from doj.transports import AiohttpTransport
+from doj.urls import filename_from_url, iter_urls, peek
+from doj.urlset import UrlSet
 
 LINKS_FILE = "pdf-links.txt"
+MANIFEST_FILE = mf.DEFAULT_MANIFEST  # Used instead of LINKS_FILE when present
 DOWNLOAD_DIR = "downloads"
 COOKIE = {"justiceGovAgeVerified": "true"}
 CONCURRENCY = 10
-
-
-async def download_one(session, url, filename, download_dir, semaphore, counter, total):
-    async with semaphore:
-        dest = download_dir / filename
-        try:
-            async with session.get(url) as resp:
-                resp.raise_for_status()
-                content = await resp.read()
-                dest.write_bytes(content)
-                counter[0] += 1
-                print(f"[{counter[0]}/{total}] Downloaded: {filename}")
-        except Exception as e:
-            counter[0] += 1
-            print(f"[{counter[0]}/{total}] Failed: {filename} - {e}")
+TIMEOUT = 300
 
 
 async def main():
@@ -32,33 +24,29 @@ async def main():
     download_dir.mkdir(exist_ok=True)
 
     # Get existing files
-    existing = set(f.name for f in download_dir.glob("*.pdf"))
+    layout = Layout.load(download_dir)
+    existing = UrlSet(f.name for f in layout.iter_files(".pdf"))
 
     # Read URLs and filter missing
-    with open(LINKS_FILE) as f:
-        urls = [line.strip() for line in f if line.strip()]
-
-    missing = []
-    for url in urls:
-        filename = unquote(os.path.basename(urlparse(url).path))
-        if filename not in existing:
-            missing.append((url, filename))
-
-    total = len(missing)
-    print(f"Total URLs: {len(urls)}, Already downloaded: {len(existing)}, To download: {total}")
-
-    if not missing:
-        return
-
-    semaphore = asyncio.Semaphore(CONCURRENCY)
-    counter = [0]  # Use list for mutable counter
-
-    async with aiohttp.ClientSession(cookies=COOKIE) as session:
-        tasks = [
-            download_one(session, url, filename, download_dir, semaphore, counter, total)
-            for url, filename in missing
-        ]
-        await asyncio.gather(*tasks)
+    manifest = mf.Manifest(Path(MANIFEST_FILE)) if Path(MANIFEST_FILE).exists() else None
+    urls = manifest.iter_pending() if manifest else iter_urls(Path(LINKS_FILE))
+    missing = peek(url for url in urls if filename_from_url(url) not in existing)
+
+    print(f"Already downloaded: {len(existing)}")
+
+    state = StateStore(manifest)
+    if missing is not None:
+        engine = Engine(
+            AiohttpTransport(CONCURRENCY, TIMEOUT, cookies=COOKIE),
+            StorageWriter(layout, validate_pdf=False),
+            state,
+            concurrency=CONCURRENCY,
+            retries=0,
+            verbose=True,
+            show_progress=False,
+        )
+        await engine.run(missing)
+    state.close()
 
     print("Done!")
 
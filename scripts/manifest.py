@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""Import, inspect and export the SQLite download manifest."""
+
+import argparse
+import sys
+from pathlib import Path
+
+from doj.manifest import (
+    CORRUPT,
+    DEFAULT_MANIFEST,
+    DOWNLOADED,
+    FAILED,
+    Manifest,
+)
+from doj.verify import DEFAULT_WORKERS, VerifyStats, verify_corpus
+
+
+def cmd_import(manifest: Manifest, args: argparse.Namespace) -> None:
+    for links in args.links:
+        added = manifest.import_url_file(Path(links), force=True)
+        print(f"{links}: {added} new URLs")
+    for progress in args.progress:
+        count = manifest.import_status_file(Path(progress), DOWNLOADED)
+        print(f"{progress}: {count} URLs marked {DOWNLOADED}")
+    for failed in args.failed:
+        count = manifest.import_status_file(Path(failed), FAILED)
+        print(f"{failed}: {count} URLs marked {FAILED}")
+    for pages in args.failed_pages:
+        count = 0
+        with Path(pages).open("r", encoding="utf-8") as handle:
+            for line in handle:
+                line = line.strip()
+                if line.isdigit():
+                    manifest.record_page(int(line), FAILED)
+                    count += 1
+        print(f"{pages}: {count} pages marked {FAILED}")
+
+
+def cmd_status(manifest: Manifest, args: argparse.Namespace) -> None:
+    counts = manifest.counts()
+    total = sum(counts.values())
+    for status, count in sorted(counts.items()):
+        print(f"{status:>12}: {count}")
+    print(f"{'total':>12}: {total}")
+    print(f"Last completed page: {manifest.last_completed_page()}")
+    failed_pages = manifest.failed_pages()
+    if failed_pages:
+        print(f"Failed pages: {len(failed_pages)}")
+
+
+def cmd_export(manifest: Manifest, args: argparse.Namespace) -> None:
+    urls = manifest.urls_with_status(args.status)
+    out = open(args.out, "w", encoding="utf-8") if args.out else sys.stdout
+    try:
+        for url in urls:
+            out.write(url + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    if args.out:
+        print(f"Wrote {len(urls)} {args.status} URLs to {args.out}")
+
+
+def cmd_verify(manifest: Manifest, args: argparse.Namespace) -> None:
+    stats = VerifyStats()
+    bad = []
+    try:
+        for path, error in verify_corpus(
+            Path(args.dir), full=args.full, workers=max(1, args.workers), use_cache=not args.no_cache, stats=stats
+        ):
+            bad.append(path)
+            if args.verbose:
+                print(f"BAD    {path} ({error})")
+    except RuntimeError as exc:
+        sys.exit(str(exc))
+    print(stats.report())
+    if not bad or not args.delete:
+        return
+    deleted = []
+    for path in bad:
+        try:
+            path.unlink()
+            deleted.append(path.name)
+        except OSError as exc:
+            print(f"Failed to delete {path}: {exc}", file=sys.stderr)
+    # Deleted files go back in the queue for the next download run
+    marked = manifest.mark_files(deleted, CORRUPT, "failed verification")
+    print(f"Deleted {len(deleted)} bad files; {marked} manifest rows marked {CORRUPT}")
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Manage the SQLite manifest shared by the scrapers and downloaders.",
+        epilog="""
+Example usage:
+  python scripts/manifest.py import --links pdf-links.txt \\
+      --progress download-browser-progress.txt --failed failed-browser.txt \\
+      --failed-pages failed-pages.txt
+  python scripts/manifest.py status
+  python scripts/manifest.py export --status failed --out failed.txt
+  python scripts/manifest.py verify --dir downloads --delete
+        """,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "--manifest",
+        default=DEFAULT_MANIFEST,
+        help=f"Manifest database path (default: {DEFAULT_MANIFEST}).",
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_import = sub.add_parser("import", help="Import legacy flat state files.")
+    p_import.add_argument("--links", action="append", default=[], help="URL list file.")
+    p_import.add_argument(
+        "--progress", action="append", default=[], help="Completed-URL progress file."
+    )
+    p_import.add_argument("--failed", action="append", default=[], help="Failed-URL file.")
+    p_import.add_argument(
+        "--failed-pages", action="append", default=[], help="Failed listing page numbers."
+    )
+    p_import.set_defaults(func=cmd_import)
+
+    p_status = sub.add_parser("status", help="Show counts by status.")
+    p_status.set_defaults(func=cmd_status)
+
+    p_export = sub.add_parser("export", help="Write URLs with a given status.")
+    p_export.add_argument("--status", default=FAILED, help=f"Status to export (default: {FAILED}).")
+    p_export.add_argument("--out", default="", help="Output file (default: stdout).")
+    p_export.set_defaults(func=cmd_export)
+
+    p_verify = sub.add_parser(
+        "verify",
+        help="Check downloaded PDFs for a header, %%%%EOF trailer and xref (only files changed since the last run).",
+    )
+    p_verify.add_argument("--dir", default="downloads", help="Download folder (default: downloads).")
+    p_verify.add_argument("--full", action="store_true", help="Also parse every file with pypdf (slow).")
+    p_verify.add_argument(
+        "--workers", type=int, default=DEFAULT_WORKERS, help=f"Parallel checks (default: {DEFAULT_WORKERS})."
+    )
+    p_verify.add_argument("--no-cache", action="store_true", help="Re-check every file, ignoring earlier results.")
+    p_verify.add_argument(
+        "--delete", action="store_true", help=f"Delete bad files and mark them {CORRUPT} for re-download."
+    )
+    p_verify.add_argument("--verbose", action="store_true", help="List every bad file.")
+    p_verify.set_defaults(func=cmd_verify)
+    return parser
+
+
+def main() -> None:
+    parser = build_arg_parser()
+    args = parser.parse_args()
+    with Manifest(Path(args.manifest)) as manifest:
+        args.func(manifest, args)
+
+
+if __name__ == "__main__":
+    main()
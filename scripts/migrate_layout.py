@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""Move downloaded files into a (different) sharded output layout."""
+
+import argparse
+import os
+from pathlib import Path
+from typing import Iterator
+
+from doj.layout import LAYOUT_FILE, SCHEMES, Layout
+
+
+def is_file_or_link(entry: os.DirEntry) -> bool:
+    return entry.is_file(follow_symlinks=False) or entry.is_symlink()
+
+
+def iter_all_files(root: Path) -> Iterator[Path]:
+    """Every non-hidden file (or symlink, as left by --cas symlink) at the top level or one directory down."""
+    with os.scandir(root) as entries:
+        subdirs = []
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
+            elif is_file_or_link(entry):
+                yield Path(entry.path)
+    for subdir in subdirs:
+        with os.scandir(subdir) as entries:
+            for entry in entries:
+                if is_file_or_link(entry):
+                    yield Path(entry.path)
+
+
+def move(path: Path, new_path: Path) -> None:
+    """Rename path to new_path; a relative symlink is re-pointed from its new directory."""
+    if path.is_symlink() and not os.path.isabs(os.readlink(path)):
+        target = os.path.normpath(os.path.join(path.parent, os.readlink(path)))
+        os.symlink(os.path.relpath(target, new_path.parent), new_path)
+        path.unlink()
+    else:
+        os.replace(path, new_path)
+
+
+def migrate(root: Path, target: Layout, dry_run: bool = False) -> tuple[int, int]:
+    """Move files under root to target's paths. Returns (moved, conflicts)."""
+    moved = 0
+    conflicts = 0
+    old_dirs = set()
+    for path in iter_all_files(root):
+        new_path = target.path_for(path.name)
+        if new_path == path:
+            continue
+        if new_path.exists() or new_path.is_symlink():
+            print(f"Conflict, leaving in place: {path} (target exists: {new_path})")
+            conflicts += 1
+            continue
+        if not dry_run:
+            target.ensure_path(path.name)
+            move(path, new_path)
+        if path.parent != root:
+            old_dirs.add(path.parent)
+        moved += 1
+        if moved % 10000 == 0:
+            print(f"Moved {moved} files...")
+
+    if not dry_run:
+        for directory in old_dirs:
+            try:
+                directory.rmdir()  # Only succeeds once empty
+            except OSError:
+                pass
+    return moved, conflicts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Move downloaded files into a sharded directory layout.",
+        epilog="""
+Example usage:
+  python scripts/migrate_layout.py --dir downloads --layout prefix
+  python scripts/migrate_layout.py --dir downloads --layout hash --width 3
+  python scripts/migrate_layout.py --dir downloads --layout flat
+        """,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--dir", default="downloads", help="Output directory (default: downloads)")
+    parser.add_argument("--layout", choices=SCHEMES, required=True, help="Target layout scheme")
+    parser.add_argument(
+        "--width",
+        type=int,
+        help="Prefix length (prefix) or hex digits (hash); default 8 / 3",
+    )
+    parser.add_argument("--dry-run", action="store_true", help="Report what would move")
+    args = parser.parse_args()
+
+    root = Path(args.dir)
+    if not root.exists():
+        print(f"Directory not found: {root}")
+        return
+
+    current = Layout.load(root)
+    target = Layout(root, args.layout, args.width)
+    print(f"Migrating {root}: {current.scheme} -> {target.scheme} (width {target.width})")
+
+    moved, conflicts = migrate(root, target, dry_run=args.dry_run)
+    if args.dry_run:
+        print(f"Would move {moved} files ({conflicts} conflicts)")
+        return
+
+    target.save()
+    print(f"Moved {moved} files ({conflicts} conflicts); layout saved to {root / LAYOUT_FILE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the justice.gov listing pages and PDF files.
+
+Serves synthetic `data-set-9-files?page=N` listing pages (PER_PAGE links
+each, in the same markup as the real site) and PDFs whose sizes follow a
+log-normal distribution, with optional latency and fault injection, so
+the scrapers and downloaders can be exercised and benchmarked offline:
+
+    python scripts/mock_doj_server.py --pages 20 --fault-429 0.05
+    python scripts/scrape_links.py --base-url http://127.0.0.1:8800/epstein/doj-disclosures/data-set-9-files
+
+Every file's size and content are derived from its EFTA number, so
+repeated runs (and Range resumes) see the same bytes. Range requests,
+ETags and HEAD are supported.
+"""
+import argparse
+import asyncio
+import hashlib
+import math
+import random
+import threading
+import time
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+DEFAULT_PORT = 8800
+LISTING_PATH = "/epstein/doj-disclosures/data-set-9-files"
+FILES_PATH = "/epstein/files/DataSet 9"
+PER_PAGE = 50  # Links per listing page, as on the real site
+FIRST_ID = 39025  # EFTA number of the first file
+LISTING_PADDING = 60_000  # Filler bytes per listing page (real pages are ~70 KB)
+CHUNK_SIZE = 64 * 1024
+CLIENT_CLOSED = 499  # Recorded when the client hangs up mid-response (nginx's convention)
+
+
+class MockConfig:
+    """What the mock server serves and how badly it behaves."""
+
+    def __init__(
+        self,
+        pages: int = 10,
+        size_median: int = 200_000,
+        size_sigma: float = 1.0,
+        size_max: int = 20_000_000,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        fault_403: float = 0.0,
+        fault_429: float = 0.0,
+        fault_503: float = 0.0,
+        fault_html: float = 0.0,
+        retry_after: int = 1,
+        seed: int = 0,
+    ):
+        """
+        size_median / size_sigma  log-normal PDF sizes in bytes (sigma 0 = all the same)
+        latency / jitter          seconds added before every response, plus up to jitter
+        fault_*                   probability of a 403 / 429 / 503 / HTML-instead-of-PDF reply
+        """
+        self.pages = pages
+        self.size_median = size_median
+        self.size_sigma = size_sigma
+        self.size_max = size_max
+        self.latency = latency
+        self.jitter = jitter
+        self.fault_403 = fault_403
+        self.fault_429 = fault_429
+        self.fault_503 = fault_503
+        self.fault_html = fault_html
+        self.retry_after = retry_after
+        self.seed = seed
+
+    @property
+    def files(self) -> int:
+        return self.pages * PER_PAGE
+
+
+class ServerStats:
+    """Per-request timings and counters, read by the benchmark harness."""
+
+    def __init__(self):
+        self.requests = 0
+        self.bytes_sent = 0
+        self.statuses: Dict[int, int] = {}
+        self.latencies: List[float] = []  # Seconds from request to last byte written
+
+    def reset(self) -> None:
+        self.__init__()
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def file_name(file_id: int) -> str:
+    return f"EFTA{file_id:08d}.pdf"
+
+
+def file_size(config: MockConfig, file_id: int) -> int:
+    rng = random.Random(f"{config.seed}:{file_id}")
+    size = int(config.size_median * math.exp(rng.gauss(0, config.size_sigma)))
+    return max(256, min(config.size_max, size))
+
+
+def pdf_bytes(file_id: int, size: int) -> bytes:
+    """A structurally valid PDF of about `size` bytes (header, filler, xref, trailer)."""
+    head = b"%PDF-1.4\n1 0 obj\n<< /Type /Catalog >>\nendobj\n"
+    tail_template = b"xref\n0 2\n0000000000 65535 f \n0000000009 00000 n \ntrailer\n<< /Root 1 0 R /Size 2 >>\nstartxref\n%d\n%%%%EOF\n"
+    seed = hashlib.sha256(str(file_id).encode()).digest()
+    filler_len = max(0, size - len(head) - len(tail_template % size))
+    filler = (b"%" + seed.hex().encode() + b"\n") * (filler_len // 66 + 1)
+    body = head + filler[:filler_len]
+    return body + tail_template % len(body)
+
+
+def listing_html(config: MockConfig, page: int) -> str:
+    links = []
+    if 0 <= page < config.pages:
+        start = FIRST_ID + page * PER_PAGE
+        for file_id in range(start, start + PER_PAGE):
+            name = file_name(file_id)
+            links.append(f'<li><a href="{FILES_PATH.replace(" ", "%20")}/{name}">{name}</a></li>')
+    filler = "<!-- " + "x" * LISTING_PADDING + " -->"
+    return (
+        "<!DOCTYPE html><html><head><title>Data Set 9 Files</title></head><body>"
+        f"{filler}<ul>{''.join(links)}</ul>"
+        f'<nav><a href="?page={page + 1}">Next</a></nav></body></html>'
+    )
+
+
+def build_app(config: MockConfig, stats: Optional[ServerStats] = None) -> web.Application:
+    stats = stats if stats is not None else ServerStats()
+    rng = random.Random(config.seed)
+    bodies: Dict[int, bytes] = {}  # Recently served files, so Range resumes don't rebuild them
+
+    def fault() -> Optional[web.Response]:
+        roll = rng.random()
+        for probability, status in ((config.fault_403, 403), (config.fault_429, 429), (config.fault_503, 503)):
+            if roll < probability:
+                headers = {"Retry-After": str(config.retry_after)} if status != 403 else {}
+                return web.Response(status=status, text="Access Denied" if status == 403 else "", headers=headers)
+            roll -= probability
+        if roll < config.fault_html:
+            return web.Response(text="<!DOCTYPE html><html>Please verify you are human</html>", content_type="text/html")
+        return None
+
+    @web.middleware
+    async def instrument(request: web.Request, handler):
+        started = time.monotonic()
+        if config.latency or config.jitter:
+            await asyncio.sleep(config.latency + rng.random() * config.jitter)
+        response = fault()
+        status = response.status if response else 200
+        try:
+            if response is None:
+                response = await handler(request)
+                status = response.status
+            if not response.prepared:
+                # Send it here so the timing covers the whole body
+                await response.prepare(request)
+                await response.write_eof()
+        except ConnectionResetError:
+            if response is None:
+                raise
+            status = CLIENT_CLOSED
+        stats.requests += 1
+        stats.statuses[status] = stats.statuses.get(status, 0) + 1
+        if status != CLIENT_CLOSED:
+            stats.bytes_sent += response.body_length
+            stats.latencies.append(time.monotonic() - started)
+        return response
+
+    async def listing(request: web.Request) -> web.Response:
+        page = int(request.query.get("page", "0") or 0)
+        return web.Response(text=listing_html(config, page), content_type="text/html")
+
+    async def pdf(request: web.Request) -> web.StreamResponse:
+        name = request.match_info["name"]
+        if not (name.startswith("EFTA") and name.endswith(".pdf") and name[4:-4].isdigit()):
+            return web.Response(status=404)
+        file_id = int(name[4:-4])
+        if not FIRST_ID <= file_id < FIRST_ID + config.files:
+            return web.Response(status=404)
+        body = bodies.get(file_id)
+        if body is None:
+            if len(bodies) > 256:
+                bodies.clear()
+            body = bodies[file_id] = pdf_bytes(file_id, file_size(config, file_id))
+        headers = {"Accept-Ranges": "bytes", "ETag": f'"{file_id:x}-{len(body):x}"'}
+        start = 0
+        range_header = request.headers.get("Range", "")
+        if range_header.startswith("bytes=") and request.headers.get("If-Range", headers["ETag"]) == headers["ETag"]:
+            first = range_header[len("bytes="):].split("-", 1)[0]
+            if first.isdigit():
+                start = int(first)
+                if start >= len(body):
+                    return web.Response(status=416, headers={"Content-Range": f"bytes */{len(body)}"})
+                headers["Content-Range"] = f"bytes {start}-{len(body) - 1}/{len(body)}"
+        headers["Content-Length"] = str(len(body) - start)
+        response = web.StreamResponse(status=206 if start else 200, headers=headers)
+        response.content_type = "application/pdf"
+        await response.prepare(request)
+        if request.method != "HEAD":
+            view = memoryview(body)
+            for offset in range(start, len(body), CHUNK_SIZE):
+                await response.write(view[offset:offset + CHUNK_SIZE])
+        await response.write_eof()
+        return response
+
+    app = web.Application(middlewares=[instrument])
+    app.router.add_get(LISTING_PATH, listing)
+    app.router.add_get("/epstein/files/{dataset}/{name}", pdf)
+    app["stats"] = stats
+    return app
+
+
+class BackgroundServer:
+    """Runs the mock on its own event loop in a daemon thread.
+
+    with BackgroundServer(MockConfig(pages=5)) as server:
+        subprocess.run([..., "--base-url", base_url(server.port)])
+        print(server.stats.requests)
+    """
+
+    def __init__(self, config: MockConfig, host: str = "127.0.0.1", port: int = 0):
+        self.config = config
+        self.host = host
+        self.port = port  # 0 = any free port; the real one is set once started
+        self.stats = ServerStats()
+        self._loop = asyncio.new_event_loop()
+        self._runner: Optional[web.AppRunner] = None
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+
+    async def _start(self) -> None:
+        self._runner = web.AppRunner(build_app(self.config, self.stats), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+
+    def __enter__(self) -> "BackgroundServer":
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if self._runner:
+            asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+def base_url(port: int, host: str = "127.0.0.1") -> str:
+    return f"http://{host}:{port}{LISTING_PATH}"
+
+
+def file_url(port: int, file_id: int, host: str = "127.0.0.1") -> str:
+    return f"http://{host}:{port}{FILES_PATH.replace(' ', '%20')}/{file_name(file_id)}"
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Serve a local mock of the DOJ listing pages and PDFs.")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"Port (default: {DEFAULT_PORT}).")
+    parser.add_argument("--pages", type=int, default=10, help=f"Listing pages with {PER_PAGE} files each.")
+    parser.add_argument("--size-median", type=int, default=200_000, help="Median PDF size in bytes.")
+    parser.add_argument("--size-sigma", type=float, default=1.0, help="Log-normal spread of PDF sizes (0 = fixed).")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response.")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Up to this many extra seconds per response.")
+    parser.add_argument("--fault-403", type=float, default=0.0, help="Fraction of requests answered 403.")
+    parser.add_argument("--fault-429", type=float, default=0.0, help="Fraction of requests answered 429.")
+    parser.add_argument("--fault-503", type=float, default=0.0, help="Fraction of requests answered 503.")
+    parser.add_argument("--fault-html", type=float, default=0.0, help="Fraction answered with an HTML page instead.")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429/503.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for sizes and faults.")
+    return parser
+
+
+def config_from_args(args: argparse.Namespace) -> MockConfig:
+    return MockConfig(
+        pages=max(0, args.pages),
+        size_median=max(256, args.size_median),
+        size_sigma=max(0.0, args.size_sigma),
+        latency=max(0.0, args.latency),
+        jitter=max(0.0, args.jitter),
+        fault_403=args.fault_403,
+        fault_429=args.fault_429,
+        fault_503=args.fault_503,
+        fault_html=args.fault_html,
+        retry_after=max(0, args.retry_after),
+        seed=args.seed,
+    )
+
+
+def main() -> None:
+    args = build_arg_parser().parse_args()
+    config = config_from_args(args)
+    print(f"Listing: {base_url(args.port, args.host)} ({config.pages} pages, {config.files} files)")
+    web.run_app(build_app(config), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
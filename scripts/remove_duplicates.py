@@ -4,27 +4,47 @@
 import argparse
 import re
 from pathlib import Path
+from typing import Dict, Optional
 
+from doj import manifest as mf
+from doj.cas import file_digest
+from doj.layout import Layout
 
-def find_duplicates(directory: Path, dry_run: bool = True) -> list[Path]:
-    """Find files with -N suffix where the original exists."""
+
+def same_content(a: Path, b: Path, digests: Dict[str, str]) -> bool:
+    """Compare two files by SHA-256, using recorded digests where available."""
+    stat_a, stat_b = a.stat(), b.stat()
+    if (stat_a.st_dev, stat_a.st_ino) == (stat_b.st_dev, stat_b.st_ino):
+        return True  # Hardlinks to the same content-addressed blob
+    if stat_a.st_size != stat_b.st_size:
+        return False
+    digest_a = digests.get(a.name) or file_digest(a)
+    digest_b = digests.get(b.name) or file_digest(b)
+    return digest_a == digest_b
+
+
+def find_duplicates(
+    directory: Path, dry_run: bool = True, digests: Optional[Dict[str, str]] = None
+) -> list[Path]:
+    """Find files with -N suffix whose content is identical to the original."""
     
     # Pattern: filename-2.pdf, filename-3.pdf, etc.
     suffix_pattern = re.compile(r'^(.+)-(\d+)(\.[^.]+)$')
     
     duplicates = []
     
-    for file in sorted(directory.iterdir()):
-        if not file.is_file():
-            continue
-        
+    # One scandir pass over the (possibly sharded) layout instead of a stat per candidate
+    files = sorted(Layout.load(directory).iter_files(""))
+    by_name = {file.name: file for file in files}
+    
+    for file in files:
         match = suffix_pattern.match(file.name)
         if match:
             stem, num, ext = match.groups()
-            original = directory / f"{stem}{ext}"
             
-            # Only consider it a duplicate if original exists
-            if original.exists():
+            # Only a duplicate if the original exists and holds the same bytes
+            original = by_name.get(f"{stem}{ext}")
+            if original and same_content(original, file, digests or {}):
                 duplicates.append(file)
     
     return duplicates
@@ -49,6 +69,11 @@ def main():
         action="store_true", 
         help="Delete without confirmation"
     )
+    parser.add_argument(
+        "--manifest",
+        default="",
+        help=f"Use SHA-256 digests recorded in this manifest instead of hashing (e.g. {mf.DEFAULT_MANIFEST})"
+    )
     args = parser.parse_args()
     
     directory = Path(args.dir)
@@ -56,7 +81,11 @@ def main():
         print(f"Directory not found: {directory}")
         return
     
-    duplicates = find_duplicates(directory)
+    digests = None
+    if args.manifest:
+        with mf.Manifest(Path(args.manifest)) as manifest:
+            digests = manifest.digests()
+    duplicates = find_duplicates(directory, digests=digests)
     
     if not duplicates:
         print("No duplicates found.")
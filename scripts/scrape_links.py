@@ -1,22 +1,34 @@
 #!/usr/bin/env python3
 """
 Pure HTTP PDF link scraper for justice.gov pages.
-Uses aiohttp for async requests and BeautifulSoup for HTML parsing.
+Uses aiohttp for async requests and a regex href extractor, run in a
+process pool, for HTML parsing.
 """
 import argparse
 import asyncio
+import contextlib
+import html
+import itertools
 import os
 import random
 import re
 import signal
-import sys
 import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Optional, Set, Tuple
+from typing import Deque, Dict, List, Optional, Sequence, Tuple
 from urllib.parse import urljoin, urlparse
 
 import aiohttp
-from bs4 import BeautifulSoup
+
+from doj import manifest as mf
+from doj.cookies import parse_cookies
+from doj.idindex import id_span, read_page_numbers
+from doj.limiter import AdaptiveLimiter, make_limiter, parse_retry_after
+from doj.metrics import TTFB, MetricsExporter, RunMetrics, add_metrics_arguments, exporter_from_args
+from doj.throttle import HostRateLimiter
+from doj.urlset import UrlSet
 
 
 # Configuration defaults
@@ -25,6 +37,7 @@ DEFAULT_CONCURRENCY = 50
 DEFAULT_TIMEOUT = 30
 DEFAULT_MAX_EMPTY = 5
 DEFAULT_START_PAGE = 1
+DEFAULT_PARSE_WORKERS = min(4, os.cpu_count() or 1)
 BASE_URL = "https://www.justice.gov/epstein/doj-disclosures/data-set-9-files"
 
 # User agents for rotation
@@ -52,48 +65,32 @@ def get_random_headers() -> Dict[str, str]:
     }
 
 
-def parse_cookies(cookie_string: str) -> Dict[str, str]:
-    """Parse cookies from string format 'name=value; name2=value2'."""
-    cookies: Dict[str, str] = {}
-    if not cookie_string:
-        return cookies
-    
-    for sep in [';', ',']:
-        if sep in cookie_string:
-            parts = cookie_string.split(sep)
-            break
-    else:
-        parts = [cookie_string]
-    
-    for part in parts:
-        part = part.strip()
-        if '=' in part:
-            name, value = part.split('=', 1)
-            cookies[name.strip()] = value.strip()
-    
-    return cookies
-
-
-def load_existing_links(path: Path) -> Set[str]:
+def load_existing_links(path: Path) -> UrlSet:
     """Load existing links from file to avoid duplicates."""
     if not path.exists():
         print(f"No existing file found at {path}, starting fresh")
-        return set()
+        return UrlSet()
     
     with path.open("r", encoding="utf-8") as f:
-        links = {line.strip() for line in f if line.strip()}
+        links = UrlSet(line.strip() for line in f if line.strip())
     
     print(f"Loaded {len(links)} existing links from {path}")
     return links
 
 
-def extract_pdf_links(html: str, base_url: str) -> List[str]:
-    """Extract all PDF links from HTML content."""
-    soup = BeautifulSoup(html, "lxml")
+# href attribute of an <a> tag, double-, single- or un-quoted
+A_HREF_RE = re.compile(
+    r"""<a\s[^>]*?\bhref\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>"']+))""",
+    re.IGNORECASE,
+)
+
+
+def extract_pdf_links(page_html: str, base_url: str) -> List[str]:
+    """Extract all PDF links from HTML content without building a DOM."""
     links: List[str] = []
     
-    for a_tag in soup.find_all("a", href=True):
-        href = a_tag["href"]
+    for match in A_HREF_RE.finditer(page_html):
+        href = html.unescape(match.group(1) or match.group(2) or match.group(3) or "")
         if href.endswith(".pdf"):
             # Make absolute URL
             full_url = urljoin(base_url, href)
@@ -106,46 +103,67 @@ async def fetch_page(
     session: aiohttp.ClientSession,
     page_num: int,
     timeout: aiohttp.ClientTimeout,
+    limiter: Optional[AdaptiveLimiter] = None,
+    base_url: str = BASE_URL,
+    metrics: Optional[RunMetrics] = None,
 ) -> Tuple[int, Optional[str], Optional[str]]:
     """Fetch a single page and return (page_num, html_content, error)."""
-    url = BASE_URL if page_num == 1 else f"{BASE_URL}?page={page_num}"
+    url = base_url if page_num == 1 else f"{base_url}?page={page_num}"
     
+    if metrics:
+        metrics.in_flight.inc()
     try:
         headers = get_random_headers()
+        started = time.monotonic()
         async with session.get(url, timeout=timeout, headers=headers) as resp:
+            if metrics:
+                metrics.observe(TTFB, time.monotonic() - started)
+                metrics.responses.inc(code=resp.status)
+            if limiter:
+                retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+                limiter.record(time.monotonic() - started, resp.status, retry_after)
             if resp.status == 403:
                 return (page_num, None, "403 Forbidden - need cookies?")
             if resp.status != 200:
                 return (page_num, None, f"HTTP {resp.status}")
             
-            html = await resp.text()
-            return (page_num, html, None)
+            page_html = await resp.text()
+            return (page_num, page_html, None)
     except asyncio.TimeoutError:
+        if limiter:
+            limiter.back_off()
         return (page_num, None, "timeout")
     except Exception as e:
         return (page_num, None, str(e))
+    finally:
+        if metrics:
+            metrics.in_flight.dec()
 
 
-async def scrape_batch(
+async def scrape_page(
     session: aiohttp.ClientSession,
-    page_numbers: List[int],
+    page_num: int,
     timeout: aiohttp.ClientTimeout,
-) -> List[Tuple[int, List[str], Optional[str]]]:
-    """Scrape a batch of pages concurrently."""
-    tasks = [fetch_page(session, pn, timeout) for pn in page_numbers]
-    results = await asyncio.gather(*tasks)
-    
-    parsed_results: List[Tuple[int, List[str], Optional[str]]] = []
-    for page_num, html, error in results:
-        if error:
-            parsed_results.append((page_num, [], error))
-        elif html:
-            links = extract_pdf_links(html, BASE_URL)
-            parsed_results.append((page_num, links, None))
-        else:
-            parsed_results.append((page_num, [], "empty response"))
-    
-    return parsed_results
+    parse_pool: Optional[Executor] = None,
+    limiter: Optional[AdaptiveLimiter] = None,
+    throttle: Optional[HostRateLimiter] = None,
+    base_url: str = BASE_URL,
+    metrics: Optional[RunMetrics] = None,
+) -> Tuple[int, List[str], Optional[str]]:
+    """Fetch one page and parse it as soon as it arrives, off the event loop if a pool is given."""
+    if throttle:
+        await throttle.wait(base_url)
+    async with limiter.slot() if limiter else contextlib.nullcontext():
+        page_num, page_html, error = await fetch_page(session, page_num, timeout, limiter, base_url, metrics)
+    if error:
+        return (page_num, [], error)
+    if not page_html:
+        return (page_num, [], "empty response")
+    if parse_pool is None:
+        return (page_num, extract_pdf_links(page_html, base_url), None)
+    loop = asyncio.get_running_loop()
+    links = await loop.run_in_executor(parse_pool, extract_pdf_links, page_html, base_url)
+    return (page_num, links, None)
 
 
 async def run_scraper(
@@ -155,101 +173,173 @@ async def run_scraper(
     timeout_seconds: int,
     max_empty: int,
     cookies: Optional[Dict[str, str]],
+    manifest: Optional[mf.Manifest] = None,
+    parse_workers: int = DEFAULT_PARSE_WORKERS,
+    max_concurrency: int = 0,
+    rate: float = 0,
+    burst: int = 1,
+    base_url: str = BASE_URL,
+    exporter: Optional[MetricsExporter] = None,
+    pages: Optional[Sequence[int]] = None,
 ) -> Tuple[int, int, int]:
     """
     Run the scraper.
+    Sweeps from start_page until max_empty empty pages in a row, or scrapes
+    just `pages` if given (e.g. the gaps found by efta_index.py).
     Returns (total_pages_scraped, new_links_found, total_links).
     """
     global last_completed_page, abort_requested
     
     timeout = aiohttp.ClientTimeout(total=timeout_seconds)
-    connector = aiohttp.TCPConnector(limit=concurrency)
+    # With a limiter the window is sized for its ceiling and the limiter
+    # decides how many of those pages are actually being fetched
+    limiter = make_limiter(concurrency, max_concurrency)
+    window = max(concurrency, max_concurrency)
+    throttle = HostRateLimiter(rate, burst) if rate > 0 else None
+    connector = aiohttp.TCPConnector(limit=window)
+    metrics = exporter.registry if exporter else None
+    if metrics and limiter:
+        metrics.add_collector(lambda: metrics.concurrency_limit.set(limiter.current))
     
     # Set up cookie jar
     cookie_jar = aiohttp.CookieJar(unsafe=True)
     
-    # Load existing links
-    existing_links = load_existing_links(output_path)
-    initial_count = len(existing_links)
+    # Load existing links (the manifest dedups on insert instead)
+    existing_links = UrlSet() if manifest else load_existing_links(output_path)
     
     # Pre-populate cookies
     if cookies:
         # Add cookies for the target domain
-        domain = urlparse(BASE_URL).netloc
+        domain = urlparse(base_url).netloc
         for name, value in cookies.items():
             cookie_jar.update_cookies({name: value}, response_url=aiohttp.client.URL(f"https://{domain}/"))
         print(f"Loaded {len(cookies)} cookie(s)")
     
-    current_page = start_page
+    schedule = iter(pages) if pages is not None else itertools.count(start_page)
+    scheduled: Deque[int] = deque()  # Pages in the order they must be committed
     last_completed_page = start_page - 1
     consecutive_empty = 0
     total_new_links = 0
     pages_scraped = 0
     start_time = time.monotonic()
     
-    async with aiohttp.ClientSession(connector=connector, cookie_jar=cookie_jar) as session:
-        while consecutive_empty < max_empty and not abort_requested:
-            # Create batch of page numbers
-            batch_pages = list(range(current_page, current_page + concurrency))
-            
-            # Scrape batch
-            results = await scrape_batch(session, batch_pages, timeout)
-            
-            # Process results
-            batch_empty = True
-            batch_new_links: List[str] = []
-            errors = 0
+    # Parse pages in worker processes so CPU work doesn't stall network I/O
+    parse_pool = ProcessPoolExecutor(max_workers=parse_workers) if parse_workers > 0 else None
+    
+    trace_configs = [metrics.trace_config()] if metrics else None
+    async with exporter or contextlib.nullcontext(), aiohttp.ClientSession(
+        connector=connector, cookie_jar=cookie_jar, trace_configs=trace_configs
+    ) as session:
+        # Sliding window: keep `window` pages in flight, and hold finished pages
+        # in a reorder buffer until every page before them has finished too
+        in_flight: Dict[asyncio.Task, int] = {}
+        finished: Dict[int, Tuple[List[str], Optional[str]]] = {}
+        
+        def fill_window() -> None:
+            while len(in_flight) < window:
+                page_num = next(schedule, None)
+                if page_num is None:
+                    return
+                task = asyncio.create_task(
+                    scrape_page(session, page_num, timeout, parse_pool, limiter, throttle, base_url, metrics)
+                )
+                in_flight[task] = page_num
+                scheduled.append(page_num)
+        
+        fill_window()
+        while in_flight and consecutive_empty < max_empty and not abort_requested:
+            done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                del in_flight[task]
+                page_num, links, error = task.result()
+                finished[page_num] = (links, error)
             
-            for page_num, links, error in sorted(results, key=lambda x: x[0]):
+            # Commit the run of finished pages at the head of the schedule
+            commit_new_links: List[str] = []
+            first_committed = scheduled[0] if scheduled else 0
+            pages_committed = 0
+            links_committed = 0
+            new_committed = 0
+            while scheduled and scheduled[0] in finished and consecutive_empty < max_empty:
+                page_num = scheduled.popleft()
+                links, error = finished.pop(page_num)
+                pages_committed += 1
                 pages_scraped += 1
+                if metrics:
+                    metrics.pages.inc(status="failed" if error else "done" if links else "empty")
                 
                 if error:
-                    errors += 1
+                    if manifest:
+                        manifest.record_page(page_num, mf.FAILED, error=error)
                     if "403" in error:
                         print(f"\nPage {page_num}: {error}")
                         print("Try adding cookies: --cookies 'justiceGovAgeVerified=true; QueueITAccepted-...'")
                         abort_requested = True
                         break
+                elif manifest:
+                    manifest.record_page(page_num, mf.DONE, links=len(links), ids=id_span(links))
+                    if links:
+                        added = manifest.add_urls(links)
+                        new_committed += added
+                        total_new_links += added
+                        if metrics:
+                            metrics.links.inc(added, new="true")
+                            metrics.links.inc(len(links) - added, new="false")
                 elif links:
-                    batch_empty = False
                     # Filter out existing links
                     new_links = [link for link in links if link not in existing_links]
+                    if metrics:
+                        metrics.links.inc(len(new_links), new="true")
+                        metrics.links.inc(len(links) - len(new_links), new="false")
                     if new_links:
-                        batch_new_links.extend(new_links)
+                        commit_new_links.extend(new_links)
                         for link in new_links:
                             existing_links.add(link)
+                        new_committed += len(new_links)
                         total_new_links += len(new_links)
-            
-            if abort_requested:
-                break
+                
+                # Errors neither end nor extend the run of empty pages; a page
+                # list has a known end, so empty pages don't stop it
+                if links:
+                    consecutive_empty = 0
+                    links_committed += len(links)
+                elif not error and pages is None:
+                    consecutive_empty += 1
+                last_completed_page = page_num
             
             # Write new links to file
-            if batch_new_links:
+            if commit_new_links:
                 with output_path.open("a", encoding="utf-8") as f:
-                    f.write("\n".join(batch_new_links) + "\n")
+                    f.write("\n".join(commit_new_links) + "\n")
             
-            # Update progress
-            elapsed = time.monotonic() - start_time
-            rate = pages_scraped / max(0.001, elapsed)
-            max_page = max(batch_pages)
-            last_completed_page = max_page
+            if abort_requested:
+                break
             
-            # Check for empty batch
-            if batch_empty and errors < concurrency:
-                consecutive_empty += 1
-                print(f"\rPage {current_page}-{max_page}: empty ({consecutive_empty}/{max_empty}) | "
-                      f"{pages_scraped} pages, {total_new_links} new links, {rate:.1f} pages/s   ", end="")
-            else:
-                consecutive_empty = 0
-                links_in_batch = sum(len(r[1]) for r in results)
-                new_in_batch = len(batch_new_links)
-                print(f"\rPage {current_page}-{max_page}: {links_in_batch} links ({new_in_batch} new) | "
-                      f"{pages_scraped} pages, {total_new_links} new links, {rate:.1f} pages/s   ", end="")
+            # Update progress
+            if pages_committed:
+                elapsed = time.monotonic() - start_time
+                rate = pages_scraped / max(0.001, elapsed)
+                limit = f" x{limiter.current}" if limiter else ""
+                if links_committed:
+                    print(f"\rPage {first_committed}-{last_completed_page}: {links_committed} links ({new_committed} new) | "
+                          f"{pages_scraped} pages, {total_new_links} new links, {rate:.1f} pages/s{limit}   ", end="")
+                else:
+                    print(f"\rPage {first_committed}-{last_completed_page}: empty ({consecutive_empty}/{max_empty}) | "
+                          f"{pages_scraped} pages, {total_new_links} new links, {rate:.1f} pages/s{limit}   ", end="")
             
-            current_page += concurrency
+            if consecutive_empty < max_empty:
+                fill_window()
+        
+        # End of listing or abort: drop pages still in flight
+        for task in in_flight:
+            task.cancel()
+        await asyncio.gather(*in_flight, return_exceptions=True)
     
+    if parse_pool:
+        parse_pool.shutdown()
     print()  # New line after progress
-    return pages_scraped, total_new_links, len(existing_links)
+    total_links = sum(manifest.counts().values()) if manifest else len(existing_links)
+    return pages_scraped, total_new_links, total_links
 
 
 def signal_handler(signum, frame):
@@ -273,6 +363,11 @@ Example usage:
         """,
         formatter_class=argparse.RawDescriptionHelpFormatter,
     )
+    parser.add_argument(
+        "--base-url",
+        default=BASE_URL,
+        help="Listing URL to scrape (default: the DOJ data set 9 listing).",
+    )
     parser.add_argument(
         "--start-page",
         type=int,
@@ -285,6 +380,24 @@ Example usage:
         default=DEFAULT_CONCURRENCY,
         help=f"Number of concurrent requests (default: {DEFAULT_CONCURRENCY}).",
     )
+    parser.add_argument(
+        "--max-concurrency",
+        type=int,
+        default=0,
+        help="Adapt concurrency up to this many requests, starting at --concurrency and backing off on 429/503 (default: fixed).",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=0,
+        help="Max page requests per second (default: unlimited).",
+    )
+    parser.add_argument(
+        "--burst",
+        type=int,
+        default=1,
+        help="Requests allowed back to back under --rate (default: 1).",
+    )
     parser.add_argument(
         "--timeout",
         type=int,
@@ -309,6 +422,25 @@ Example usage:
         default=DEFAULT_MAX_EMPTY,
         help=f"Stop after N consecutive empty pages (default: {DEFAULT_MAX_EMPTY}).",
     )
+    parser.add_argument(
+        "--parse-workers",
+        type=int,
+        default=DEFAULT_PARSE_WORKERS,
+        help=f"Processes for HTML parsing, 0 = parse on the event loop (default: {DEFAULT_PARSE_WORKERS}).",
+    )
+    parser.add_argument(
+        "--manifest",
+        type=str,
+        default="",
+        help=f"Record links and page status in this SQLite manifest instead of --output (e.g. {mf.DEFAULT_MANIFEST}).",
+    )
+    parser.add_argument(
+        "--pages-file",
+        type=str,
+        default="",
+        help="Scrape only the page numbers listed in this file, one per line (e.g. from efta_index.py gaps).",
+    )
+    add_metrics_arguments(parser)
     return parser
 
 
@@ -318,13 +450,19 @@ def main() -> None:
     
     output_path = Path(args.output)
     cookies = parse_cookies(args.cookies) if args.cookies else None
+    manifest = mf.Manifest(Path(args.manifest)) if args.manifest else None
     
     # Set up signal handler for graceful abort
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
     
-    print(f"Starting scrape from page {args.start_page}")
-    print(f"Concurrency: {args.concurrency}, Output: {output_path}")
+    pages = read_page_numbers(Path(args.pages_file)) if args.pages_file else None
+    
+    if pages is not None:
+        print(f"Scraping {len(pages)} listed pages from {args.pages_file}")
+    else:
+        print(f"Starting scrape from page {args.start_page}")
+    print(f"Concurrency: {args.concurrency}, Output: {args.manifest or output_path}")
     if cookies:
         print(f"Cookies: {', '.join(cookies.keys())}")
     print()
@@ -337,8 +475,18 @@ def main() -> None:
             timeout_seconds=max(5, args.timeout),
             max_empty=max(1, args.max_empty),
             cookies=cookies,
+            manifest=manifest,
+            parse_workers=max(0, args.parse_workers),
+            max_concurrency=args.max_concurrency,
+            rate=args.rate,
+            burst=args.burst,
+            base_url=args.base_url,
+            exporter=exporter_from_args(args),
+            pages=pages,
         )
     )
+    if manifest:
+        manifest.close()
     
     print(f"\nDone!")
     print(f"Pages scraped: {pages_scraped}")
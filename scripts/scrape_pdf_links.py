@@ -4,12 +4,15 @@ import asyncio
 import json
 from html.parser import HTMLParser
 from pathlib import Path
-from typing import Iterable, List, Optional, Set, Tuple
+from typing import Iterable, List, Optional, Sequence, Set, Tuple
 from urllib.parse import urljoin
 
 import aiohttp
 from yarl import URL
 
+from doj import manifest as mf
+from doj.idindex import id_span, read_page_numbers
+
 
 DEFAULT_BASE_URL = "https://www.justice.gov/epstein/doj-disclosures/data-set-9-files"
 DEFAULT_OUT_FILE = "pdf-links.txt"
@@ -114,6 +117,8 @@ async def run(
     retries: int,
     user_agent: str,
     append: bool,
+    manifest: Optional[mf.Manifest] = None,
+    pages: Optional[Sequence[int]] = None,
 ) -> None:
     cookies = load_cookies(storage_state)
     cookie_jar = build_cookie_jar(cookies)
@@ -138,17 +143,25 @@ async def run(
                 links = parse_pdf_links(html, base_url)
                 return page_num, links, None
 
-        tasks = [fetch_and_parse(page_num) for page_num in range(start_page, end_page + 1)]
+        page_nums = pages if pages is not None else range(start_page, end_page + 1)
+        tasks = [fetch_and_parse(page_num) for page_num in page_nums]
         for coro in asyncio.as_completed(tasks):
             page_num, links, error = await coro
             if error:
                 failed_pages.append(page_num)
+                if manifest:
+                    manifest.record_page(page_num, mf.FAILED, error=error)
                 print(f"Page {page_num}: failed ({error})")
                 continue
+            if manifest:
+                manifest.record_page(page_num, mf.DONE, links=len(links), ids=id_span(links))
             if links:
                 total_links += len(links)
-                with out_file.open("a", encoding="utf-8") as handle:
-                    handle.write("\n".join(links) + "\n")
+                if manifest:
+                    manifest.add_urls(links)
+                else:
+                    with out_file.open("a", encoding="utf-8") as handle:
+                        handle.write("\n".join(links) + "\n")
             print(f"Page {page_num}: {len(links)} PDF links (total {total_links})")
 
     if failed_pages:
@@ -194,6 +207,14 @@ def build_arg_parser() -> argparse.ArgumentParser:
         action="store_true",
         help="Always append to output file.",
     )
+    parser.add_argument(
+        "--manifest",
+        help=f"Record links and page status in this SQLite manifest instead of --out-file (e.g. {mf.DEFAULT_MANIFEST}).",
+    )
+    parser.add_argument(
+        "--pages-file",
+        help="Scrape only the page numbers listed in this file instead of --start-page..--end-page.",
+    )
     return parser
 
 
@@ -206,30 +227,41 @@ def main() -> None:
     if end_page < start_page:
         parser.error("--end-page must be >= --start-page")
 
+    pages = read_page_numbers(Path(args.pages_file)) if args.pages_file else None
+
     out_file = Path(args.out_file)
     storage_state = Path(args.storage_state) if args.storage_state else None
 
-    if args.append or start_page > 1:
-        out_file.parent.mkdir(parents=True, exist_ok=True)
-        out_file.open("a", encoding="utf-8").close()
-    else:
+    manifest = mf.Manifest(Path(args.manifest)) if args.manifest else None
+
+    # With a manifest the links go there and the output file is left untouched
+    if not manifest:
         out_file.parent.mkdir(parents=True, exist_ok=True)
-        out_file.write_text("", encoding="utf-8")
-
-    asyncio.run(
-        run(
-            base_url=args.base_url,
-            start_page=start_page,
-            end_page=end_page,
-            out_file=out_file,
-            storage_state=storage_state,
-            concurrency=max(1, args.concurrency),
-            timeout=max(1, args.timeout),
-            retries=max(0, args.retries),
-            user_agent=args.user_agent,
-            append=args.append,
+        if args.append or start_page > 1 or pages is not None:
+            out_file.open("a", encoding="utf-8").close()
+        else:
+            out_file.write_text("", encoding="utf-8")
+
+    try:
+        asyncio.run(
+            run(
+                base_url=args.base_url,
+                start_page=start_page,
+                end_page=end_page,
+                out_file=out_file,
+                storage_state=storage_state,
+                concurrency=max(1, args.concurrency),
+                timeout=max(1, args.timeout),
+                retries=max(0, args.retries),
+                user_agent=args.user_agent,
+                append=args.append,
+                manifest=manifest,
+                pages=pages,
+            )
         )
-    )
+    finally:
+        if manifest:
+            manifest.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Summarise a --trace log from the downloaders: where the time went.
+
+For every phase (block pause, rate limiter, concurrency slot, connection
+pool, DNS, connect, server TTFB, body transfer, disk, retry backoff) it
+prints the total seconds across all attempts, its share of all attempt
+time and latency percentiles, followed by outcomes, status codes and the
+slowest attempts. Time an attempt spent outside any traced phase (e.g. a
+request that timed out before its headers) shows up as "other".
+"""
+import argparse
+import heapq
+import json
+import sys
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from doj.trace import PHASES
+
+OTHER = "other"
+DEFAULT_TOP = 10
+
+
+def read_trace(paths: Iterable[Path]) -> Iterator[dict]:
+    for path in paths:
+        with path.open(encoding="utf-8") as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"{path}:{line_no}: skipping malformed line", file=sys.stderr)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of sorted values."""
+    if not values:
+        return 0.0
+    rank = max(0, min(len(values) - 1, round(pct / 100 * len(values)) - 1))
+    return values[rank]
+
+
+class TraceSummary:
+    """Aggregates trace records one at a time."""
+
+    def __init__(self, top: int = DEFAULT_TOP):
+        self.top = top
+        self.attempts = 0
+        self.retried = 0
+        self.urls = set()
+        self.bytes = 0
+        self.busy = 0.0  # Sum of attempt durations
+        self.first: Optional[float] = None
+        self.last: Optional[float] = None
+        self.outcomes: Counter = Counter()
+        self.statuses: Counter = Counter()
+        self.phases: Dict[str, List[float]] = {phase: [] for phase in PHASES + (OTHER,)}
+        self.slowest: List = []  # Min-heap of (total, seq, record)
+
+    def add(self, record: dict) -> None:
+        total = record.get("total", 0.0)
+        start = record.get("ts", 0.0)
+        self.attempts += 1
+        self.retried += bool(record.get("retried"))
+        self.urls.add(record.get("url"))
+        self.bytes += record.get("bytes", 0)
+        self.busy += total
+        self.first = start if self.first is None else min(self.first, start)
+        self.last = start + total if self.last is None else max(self.last, start + total)
+        self.outcomes[record.get("outcome")] += 1
+        self.statuses[record.get("status")] += 1
+        phases = record.get("phases", {})
+        for phase, seconds in phases.items():
+            self.phases.setdefault(phase, []).append(seconds)
+        other = total - sum(phases.values())
+        if other > 0.0005:
+            self.phases[OTHER].append(other)
+        if self.top:
+            entry = (total, self.attempts, record)
+            if len(self.slowest) < self.top:
+                heapq.heappush(self.slowest, entry)
+            elif total > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, entry)
+
+    @property
+    def wall(self) -> float:
+        return (self.last - self.first) if self.first is not None else 0.0
+
+    def report(self) -> str:
+        if not self.attempts:
+            return "No trace records."
+        wall = max(0.001, self.wall)
+        lines = [
+            f"{self.attempts} attempts for {len(self.urls)} URLs ({self.retried} retried) "
+            f"over {self.wall:.1f}s of wall clock",
+            f"{self.bytes / 1e6:.1f} MB of bodies ({self.bytes / 1e6 / wall:.2f} MB/s), "
+            f"{self.busy / wall:.1f} attempts in progress on average",
+            "Outcomes: " + ", ".join(f"{name}:{count}" for name, count in self.outcomes.most_common()),
+            "Statuses: " + ", ".join(
+                f"{status or 'none'}:{count}" for status, count in sorted(self.statuses.items(), key=lambda i: i[0] or 0)
+            ),
+            "",
+        ]
+        header = f"{'phase':<12}{'total s':>10}{'share':>8}{'n':>8}{'mean ms':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+        lines += [header, "-" * len(header)]
+        busy = max(0.001, self.busy)
+        for phase, values in self.phases.items():
+            if not values:
+                continue
+            values.sort()
+            total = sum(values)
+            lines.append(
+                f"{phase:<12}{total:>10.1f}{total / busy:>8.1%}{len(values):>8}{total / len(values) * 1000:>10.1f}"
+                f"{percentile(values, 50) * 1000:>9.1f}{percentile(values, 95) * 1000:>9.1f}"
+                f"{percentile(values, 99) * 1000:>9.1f}{values[-1] * 1000:>9.1f}"
+            )
+        lines.append(f"{'all':<12}{self.busy:>10.1f}{1:>8.1%}{self.attempts:>8}{self.busy / self.attempts * 1000:>10.1f}")
+
+        if self.slowest:
+            lines += ["", "Slowest attempts:"]
+            for total, _, record in sorted(self.slowest, key=lambda entry: -entry[0]):
+                phases = record.get("phases", {})
+                main = max(phases, key=phases.get) if phases else OTHER
+                lines.append(
+                    f"  {total:8.2f}s  {main} {phases.get(main, total):.2f}s  "
+                    f"{record.get('status') or record.get('outcome')}  {record.get('url')}"
+                )
+        return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Summarise where a download run's time went, from a --trace JSONL log.",
+        epilog="""
+Example usage:
+  python scripts/download_pdfs.py --trace trace.jsonl
+  python scripts/trace_report.py trace.jsonl
+  python scripts/trace_report.py --outcome failed --top 20 trace.jsonl
+        """,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("traces", nargs="+", type=Path, help="Trace files written with --trace.")
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP, help=f"Slowest attempts to list (default: {DEFAULT_TOP}).")
+    parser.add_argument("--outcome", default="", help="Only count attempts with this outcome (e.g. downloaded, failed).")
+    parser.add_argument("--match", default="", help="Only count attempts whose URL contains this string.")
+    args = parser.parse_args()
+
+    summary = TraceSummary(max(0, args.top))
+    for record in read_trace(args.traces):
+        if args.outcome and record.get("outcome") != args.outcome:
+            continue
+        if args.match and args.match not in (record.get("url") or ""):
+            continue
+        summary.add(record)
+    print(summary.report())
+
+
+if __name__ == "__main__":
+    main()